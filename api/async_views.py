@@ -0,0 +1,224 @@
+"""Async versions of the I/O bound API views, routed instead of the DRF ones when ASYNC_VIEWS is on.
+
+DRF views are synchronous, so these are plain Django async views. They answer
+with the same status codes and bodies as their counterparts in ``views``, and
+share their helpers. Under an ASGI server a request waiting on Redis, the
+database or the scheduler no longer holds a worker thread.
+"""
+import functools
+import json
+import logging
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.exceptions import AuthenticationFailed
+from scheduler.capacity import get_capacity_cache
+from scheduler.dispatch import get_dispatcher, SchedulingDispatchError
+from scheduler.placement import candidate_clusters, choose_cluster
+from scheduler.queue_handler import deployment_payload, queue_instance
+from scheduler.status import QUEUED, STOPPED, aevent_stream, apublish_transitions
+from scheduler.versions import aget_version
+from .auth import aauthenticate, aget_principal
+from .models import Cluster, Deployment, UserProfile
+from .serializers import ClusterStatusSerializer, DeploymentSerializer
+from .views import (
+    can_view_deployment, exceeds_cluster, exceeds_cluster_response, format_etag, last_event_id, not_modified,
+    release_deployment, scheduled_response, status_stream_response, stopped_response, with_etag,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def async_api_view(methods, authenticated=True):
+    """Decorate an async view like ``api_view`` and the default authentication and permission classes do.
+
+    Answers other methods with 405 and, when ``authenticated``, requests
+    without a valid token with 401, in DRF's format. Sets ``request.user``
+    and ``request.auth``, and ``request.data`` to the JSON or form body.
+    """
+    def decorator(view):
+        @csrf_exempt
+        @functools.wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method not in methods:
+                response = JsonResponse({"detail": f'Method "{request.method}" not allowed.'}, status=405)
+                response['Allow'] = ', '.join(methods)
+                return response
+
+            if authenticated:
+                try:
+                    credentials = await aauthenticate(request)
+                except AuthenticationFailed as e:
+                    return _unauthorized(e.detail)
+                if credentials is None:
+                    return _unauthorized("Authentication credentials were not provided.")
+                request.user, request.auth = credentials
+
+            request.data = request.POST
+            if request.content_type == 'application/json':
+                try:
+                    request.data = json.loads(request.body) if request.body else {}
+                except ValueError as e:
+                    return JsonResponse({"detail": f"JSON parse error - {e}"}, status=400)
+            return await view(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _unauthorized(detail):
+    response = JsonResponse({"detail": detail}, status=401)
+    response['WWW-Authenticate'] = 'Bearer realm="api"'
+    return response
+
+
+@async_api_view(['GET'])
+async def cluster_status(request, cluster_id):
+    etag = format_etag('cluster', cluster_id, await aget_version('cluster', cluster_id))
+    response = not_modified(request, etag)
+    if response is not None:
+        return response
+    try:
+        cluster = await Cluster.objects.select_related('user').aget(id=cluster_id)
+        if not (await aget_principal(request)).can_access(cluster):
+            return JsonResponse({"error": "You don't have permission to view this cluster"}, status=403)
+
+        # The capacity cache may be ahead of the database
+        capacity = get_capacity_cache()
+        if capacity is not None:
+            await capacity.aoverlay(cluster, queue_instance.async_redis_client)
+
+        return with_etag(JsonResponse(ClusterStatusSerializer(cluster).data, status=200), etag)
+
+    except Cluster.DoesNotExist:
+        return JsonResponse({"error": "Cluster not found"}, status=404)
+    except UserProfile.DoesNotExist:
+        return JsonResponse({"error": "User profile not found"}, status=404)
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
+
+
+@async_api_view(['POST'])
+async def schedule_deployment(request):
+    serializer = DeploymentSerializer(data=request.data)
+    # Validation looks the cluster up in the database
+    if not await sync_to_async(serializer.is_valid)():
+        return JsonResponse(serializer.errors, status=400)
+
+    cpu_required = serializer.validated_data['cpu_required']
+    gpu_required = serializer.validated_data['gpu_required']
+    ram_required = serializer.validated_data['ram_required']
+    try:
+        principal = await aget_principal(request)
+        cluster = serializer.validated_data.get('cluster')
+        if cluster is not None:
+            if not principal.can_access(cluster, manage=True):
+                return JsonResponse({
+                    "error": "You don't have permission to schedule deployments on this cluster"
+                }, status=403)
+        else:
+            # No cluster given, place it on one of the user's own clusters
+            cluster = await sync_to_async(choose_cluster)(
+                candidate_clusters(principal.profile()), cpu_required, gpu_required, ram_required,
+                strategy=request.data.get('placement'),
+            )
+            if cluster is None:
+                return JsonResponse({"error": "None of your clusters can fit this deployment"}, status=404)
+    except UserProfile.DoesNotExist:
+        return JsonResponse({"error": "User not found"}, status=404)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    if exceeds_cluster(cluster, cpu_required, gpu_required, ram_required):
+        return exceeds_cluster_response()
+
+    deployment = await Deployment.objects.acreate(**{**serializer.validated_data, 'user': principal.profile(), 'cluster': cluster})
+    await apublish_transitions([(deployment.id, cluster.id, principal.organization_id, QUEUED)])
+
+    try:
+        dispatcher = get_dispatcher()
+        await dispatcher.aschedule(deployment_payload(deployment, service_name=request.data.get('service_name')), cluster.id)
+    except SchedulingDispatchError as e:
+        return JsonResponse({"error": str(e)}, status=502)
+    return scheduled_response(deployment, dispatcher)
+
+
+@async_api_view(['POST'])
+async def stop_deployment(request, deployment_id):
+    """Stop a deployment and restore cluster resources"""
+    try:
+        deployment = await Deployment.objects.select_related('cluster').aget(id=deployment_id)
+
+        principal = await aget_principal(request)
+        if not principal.can_access(deployment.cluster, manage=True):
+            return JsonResponse({
+                "error": "You don't have permission to stop deployments on this cluster"
+            }, status=403)
+        if deployment.status != 'running':
+            return JsonResponse({"error": "Deployment is not running"}, status=400)
+        cluster = deployment.cluster
+        if not cluster:
+            return JsonResponse({"error": "Deployment is not associated with any cluster"}, status=400)
+
+        # The release is transactional, which the async ORM does not support yet
+        if not await sync_to_async(release_deployment)(deployment, principal.organization_id):
+            return JsonResponse({"error": "Deployment is not running"}, status=400)
+        await apublish_transitions([(deployment.id, cluster.id, principal.organization_id, STOPPED)])
+
+        try:
+            await get_dispatcher().aprocess(cluster.id)
+        except SchedulingDispatchError as e:
+            # The deployment is already stopped, the next pass will pick up the freed resources
+            logger.warning("Failed to trigger scheduling for cluster %s: %s", cluster.id, e)
+
+        return stopped_response(deployment_id, cluster)
+
+    except Deployment.DoesNotExist:
+        return JsonResponse({"error": "Deployment not found"}, status=404)
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
+
+
+def stream_status(scope, scope_id, request):
+    """Stream transitions from the asyncio Redis client, an open stream holds no thread"""
+    try:
+        after = last_event_id(request)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    return status_stream_response(aevent_stream(
+        scope, scope_id, after,
+        heartbeat=settings.STATUS_STREAM_HEARTBEAT, duration=settings.STATUS_STREAM_DURATION,
+    ))
+
+
+@async_api_view(['GET'])
+async def deployment_events(request, deployment_id):
+    try:
+        deployment = await Deployment.objects.select_related('cluster__user').aget(id=deployment_id)
+    except Deployment.DoesNotExist:
+        return JsonResponse({"error": "Deployment not found"}, status=404)
+    if not can_view_deployment(await aget_principal(request), deployment):
+        return JsonResponse({"error": "You don't have permission to view this deployment"}, status=403)
+    return stream_status('deployment', deployment.id, request)
+
+
+@async_api_view(['GET'])
+async def cluster_events(request, cluster_id):
+    try:
+        cluster = await Cluster.objects.select_related('user').aget(id=cluster_id)
+    except Cluster.DoesNotExist:
+        return JsonResponse({"error": "Cluster not found"}, status=404)
+    if not (await aget_principal(request)).can_access(cluster):
+        return JsonResponse({"error": "You don't have permission to view this cluster"}, status=403)
+    return stream_status('cluster', cluster.id, request)
+
+
+@async_api_view(['GET'])
+async def organization_events(request):
+    try:
+        principal = await aget_principal(request)
+    except UserProfile.DoesNotExist:
+        return JsonResponse({"error": "User profile not found"}, status=404)
+    if not principal.organization_id:
+        return JsonResponse({"error": "User is not associated with any organization"}, status=400)
+    return stream_status('organization', principal.organization_id, request)
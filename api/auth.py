@@ -0,0 +1,224 @@
+import logging
+import time
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.functional import cached_property
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from .models import Organization, UserProfile
+
+logger = logging.getLogger(__name__)
+
+# Claims login_user adds to tokens, enough to authorize without the database
+PRINCIPAL_CLAIMS = ('profile_id', 'username', 'organization_id', 'role')
+
+
+class Principal:
+    """The authenticated user's profile, organization and role, as authorization needs them.
+
+    Resolved once per request by ``get_principal``. Views check access with
+    ``can_access`` instead of walking ``cluster.user.organization``.
+    """
+
+    def __init__(self, user_id, username, organization_id, role):
+        self.user_id = user_id
+        self.username = username
+        self.organization_id = organization_id
+        self.role = role
+
+    @property
+    def is_admin(self):
+        return self.role == 'admin'
+
+    def profile(self):
+        """An unsaved UserProfile carrying the principal, enough to assign foreign keys"""
+        return UserProfile(id=self.user_id, username=self.username,
+                           organization_id=self.organization_id, role=self.role)
+
+    def can_access(self, cluster, manage=False):
+        """Whether the principal may see ``cluster``, or with ``manage`` change what runs on it.
+
+        Members of the owner's organization may see a cluster, only its owner
+        may manage it. Load the cluster with ``select_related('user')`` so the
+        owner's organization costs no query.
+        """
+        if cluster is None:
+            return False
+        if cluster.user_id == self.user_id:
+            return True
+        return (not manage and self.organization_id is not None
+                and cluster.user.organization_id == self.organization_id)
+
+
+def get_principal_key(user_id):
+    """Generate the cache key holding a user's principal"""
+    return f'principal_{user_id}'
+
+
+def get_principal(request):
+    """Return the request's principal, loading it at most once per request.
+
+    Looks in the request and the token's claims, then the cache for
+    PRINCIPAL_CACHE_TTL seconds, then the database. Raises
+    UserProfile.DoesNotExist for a user without profile.
+    """
+    principal = getattr(request, '_principal', None) or getattr(request.user, 'principal', None)
+    if principal is not None:
+        return principal
+
+    user_id = request.user.id
+    ttl = getattr(settings, 'PRINCIPAL_CACHE_TTL', 60)
+    fields = None
+    if ttl:
+        try:
+            fields = cache.get(get_principal_key(user_id))
+        except Exception as e:
+            # The cache only saves a query, the database still answers
+            logger.warning("Failed to read principal %s from the cache: %s", user_id, e)
+    if fields is None:
+        fields = UserProfile.objects.values('username', 'organization_id', 'role').get(id=user_id)
+        if ttl:
+            try:
+                cache.set(get_principal_key(user_id), fields, ttl)
+            except Exception as e:
+                logger.warning("Failed to cache principal %s: %s", user_id, e)
+
+    request._principal = Principal(user_id, **fields)
+    return request._principal
+
+
+async def aget_principal(request):
+    """Async counterpart of ``get_principal``, free when the token carries the principal"""
+    principal = getattr(request, '_principal', None) or getattr(request.user, 'principal', None)
+    if principal is not None:
+        return principal
+    return await sync_to_async(get_principal)(request)
+
+
+def invalidate_principals(user_ids):
+    """Drop cached principals so the next request reads them from the database"""
+    keys = [get_principal_key(user_id) for user_id in user_ids]
+    if not keys:
+        return
+    try:
+        cache.delete_many(keys)
+    except Exception as e:
+        # Stale entries still expire after PRINCIPAL_CACHE_TTL
+        logger.warning("Failed to invalidate principals %s: %s", list(user_ids), e)
+
+
+def add_principal_claims(token, user_profile):
+    """Put the profile's principal in a token, access tokens made from a refresh token inherit it"""
+    token['profile_id'] = user_profile.id
+    token['username'] = user_profile.username
+    token['organization_id'] = user_profile.organization_id
+    token['role'] = user_profile.role
+    return token
+
+
+def get_denylist_key(jti):
+    """Generate the cache key marking a token id as revoked"""
+    return f'token_denylist_{jti}'
+
+
+def get_user_revocation_key(user_id):
+    """Generate the cache key holding when a user's tokens were last revoked"""
+    return f'token_revoked_before_{user_id}'
+
+
+def revoke_token(token):
+    """Deny a token until it expires. Each entry expires with its token, so the denylist stays small."""
+    ttl = int(token['exp'] - time.time())
+    if ttl > 0:
+        cache.set(get_denylist_key(token[jwt_settings.JTI_CLAIM]), 1, ttl)
+
+
+def revoke_user_tokens(user_id):
+    """Deny every token issued to a user before this second, e.g. when their role or organization changes"""
+    lifetime = max(jwt_settings.ACCESS_TOKEN_LIFETIME, jwt_settings.REFRESH_TOKEN_LIFETIME)
+    try:
+        cache.set(get_user_revocation_key(user_id), int(time.time()), int(lifetime.total_seconds()))
+    except Exception as e:
+        logger.warning("Failed to revoke the tokens of user %s: %s", user_id, e)
+
+
+def is_revoked(token):
+    """Whether the token or every token of its user was revoked, in one cache round trip"""
+    user_id = token.get('profile_id', token.get(jwt_settings.USER_ID_CLAIM))
+    keys = [get_denylist_key(token.get(jwt_settings.JTI_CLAIM)), get_user_revocation_key(user_id)]
+    try:
+        found = cache.get_many(keys)
+    except Exception as e:
+        # Without Redis revocation is unknown, the token's signature and expiry still hold
+        logger.warning("Failed to read the token denylist: %s", e)
+        return False
+    if keys[0] in found:
+        return True
+    revoked_before = found.get(keys[1])
+    return revoked_before is not None and token.get('iat', 0) < revoked_before
+
+
+class PrincipalUser(TokenUser):
+    """A user built from the claims of a token, without the database"""
+
+    @cached_property
+    def principal(self):
+        return Principal(self.token['profile_id'], self.token['username'],
+                         self.token['organization_id'], self.token['role'])
+
+
+class PrincipalJWTAuthentication(JWTAuthentication):
+    """JWT authentication that trusts the principal claims of tokens issued by login_user.
+
+    Tokens carrying them authenticate with a single denylist lookup in Redis
+    and no query. Tokens without them, issued before the claims existed,
+    still load the user from the database.
+    """
+
+    def get_user(self, validated_token):
+        if is_revoked(validated_token):
+            raise InvalidToken("Token has been revoked")
+        if not all(claim in validated_token for claim in PRINCIPAL_CLAIMS):
+            return super().get_user(validated_token)
+        return PrincipalUser(validated_token)
+
+
+async def aauthenticate(request):
+    """Authenticate a request to an async view like PrincipalJWTAuthentication.
+
+    Returns ``(user, token)``, or None without an Authorization header. Raises
+    AuthenticationFailed or InvalidToken. Tokens with the principal claims
+    only wait on the denylist, in the thread pool; older tokens load their
+    user on the database thread.
+    """
+    authentication = PrincipalJWTAuthentication()
+    header = authentication.get_header(request)
+    if header is None:
+        return None
+    raw_token = authentication.get_raw_token(header)
+    if raw_token is None:
+        return None
+    validated_token = authentication.get_validated_token(raw_token)
+    if not all(claim in validated_token for claim in PRINCIPAL_CLAIMS):
+        return await sync_to_async(authentication.get_user)(validated_token), validated_token
+    if await sync_to_async(is_revoked, thread_sensitive=False)(validated_token):
+        raise InvalidToken("Token has been revoked")
+    return PrincipalUser(validated_token), validated_token
+
+
+@receiver([post_save, post_delete], sender=UserProfile)
+def user_profile_changed(sender, instance, created=False, **kwargs):
+    invalidate_principals([instance.id])
+    if not created:
+        # Tokens carry the old profile in their claims
+        revoke_user_tokens(instance.id)
+
+
+@receiver([post_save, post_delete], sender=Organization)
+def organization_changed(sender, instance, **kwargs):
+    invalidate_principals(list(UserProfile.objects.filter(organization_id=instance.id).values_list('id', flat=True)))
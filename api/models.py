@@ -85,6 +85,13 @@ class Deployment(models.Model):
     status = models.CharField(max_length=50, choices=STATUS_CHOICES, default='queued')
     priority = models.CharField(max_length=10, choices=[('high', 'High'), ('low', 'Low')])
 
+    class Meta:
+        # Listings filter on the owner and status and page by id
+        indexes = [
+            models.Index(fields=['cluster', 'status', 'id'], name='deployment_cluster_status_idx'),
+            models.Index(fields=['user', 'status', 'id'], name='deployment_user_status_idx'),
+        ]
+
     def __str__(self):
         return f"{self.docker_image} - {self.status} ({self.priority})"
 
@@ -0,0 +1,33 @@
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+
+
+class IdCursorPagination(CursorPagination):
+    """Keyset pagination on the primary key, newest first.
+
+    The cursor carries the last id of the page, so every page is a range scan
+    on an index however much history there is, and rows added meanwhile never
+    shift or repeat a page. Paginated responses hold ``next``, ``previous``
+    and ``results``.
+    """
+
+    ordering = '-id'
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+
+def paginated_response(request, queryset, serializer_class, prepare=None):
+    """Serialize one page of ``queryset``, or return 400 for an invalid cursor.
+
+    ``prepare`` is called with the page's objects before they are serialized.
+    """
+    paginator = IdCursorPagination()
+    try:
+        page = paginator.paginate_queryset(queryset, request)
+    except NotFound as e:
+        return Response({"error": str(e.detail)}, status=400)
+    if prepare is not None:
+        prepare(page)
+    return paginator.get_paginated_response(serializer_class(page, many=True).data)
@@ -0,0 +1,16 @@
+import json
+from rest_framework.renderers import BaseRenderer
+
+
+class EventStreamRenderer(BaseRenderer):
+    """Lets views answering with Server-Sent Events accept ``Accept: text/event-stream``.
+
+    The events themselves are streamed by the view, this only renders the
+    JSON error bodies of requests refused before the stream starts.
+    """
+
+    media_type = 'text/event-stream'
+    format = 'event-stream'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return json.dumps(data).encode()
@@ -0,0 +1,171 @@
+import hashlib
+import logging
+import secrets
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import DEFERRED
+from django.db.models.signals import post_delete, post_init, post_save, pre_save
+from django.dispatch import receiver
+from rest_framework.response import Response
+from scheduler.metrics import metrics
+from .models import Cluster, Organization, UserProfile
+
+logger = logging.getLogger(__name__)
+
+# Cluster listings are cached per organization or user in the default cache,
+# under the organization's generations. Events replace a generation instead
+# of deleting entries, so every entry built before is unreachable at once:
+# CLUSTERS when a cluster or its owner is saved, UTILIZATION when a deployment
+# starts, stops or is preempted. RESPONSE_CACHE_TTL only reclaims unreachable entries.
+CLUSTERS = 'clusters'
+UTILIZATION = 'utilization'
+
+# On a miss one request builds the entry, the others poll for it this long
+# before building it themselves
+LOCK_TIMEOUT = 2.0
+POLL_INTERVAL = 0.05
+
+
+def get_generation_key(kind, organization_id):
+    """Generate the cache key holding an organization's generation of ``kind``"""
+    return f'listing_generation_{kind}_{organization_id}'
+
+
+def _new_generation():
+    return secrets.token_hex(8)
+
+
+def invalidate_listings(organization_ids, kind):
+    """Make the organizations' cached listings depending on ``kind`` unreachable.
+
+    Call it once the change is committed, so no entry is rebuilt from the
+    data before it.
+    """
+    keys = {get_generation_key(kind, organization_id): _new_generation()
+            for organization_id in organization_ids if organization_id is not None}
+    if not keys:
+        return
+    try:
+        cache.set_many(keys, None)
+    except Exception as e:
+        # Entries built before the change are served until the next one
+        logger.warning("Failed to invalidate the %s listings of organizations %s: %s", kind, list(organization_ids), e)
+
+
+def _generations(organization_id, kinds):
+    keys = [get_generation_key(kind, organization_id) for kind in kinds]
+    found = cache.get_many(keys)
+    if len(found) < len(keys):
+        for key in keys:
+            if key not in found:
+                cache.add(key, _new_generation(), None)
+        # Another request may have added them first
+        found = cache.get_many(keys)
+    if len(found) < len(keys):
+        return None
+    return '_'.join(found[key] for key in keys)
+
+
+def _wait_for(key):
+    deadline = time.monotonic() + LOCK_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(POLL_INTERVAL)
+        data = cache.get(key)
+        if data is not None:
+            return data
+    return None
+
+
+def cached_listing(request, view, scope, organization_id, kinds, build):
+    """Serve the Response ``build`` makes from the cache while the organization's ``kinds`` generations hold.
+
+    Entries are keyed by ``scope``, e.g. the user or organization the listing
+    belongs to, and the request's absolute URI, which pages and links vary
+    with. Only 200 responses are cached. Without an organization or with
+    RESPONSE_CACHE_TTL at 0 every request is built.
+    """
+    ttl = getattr(settings, 'RESPONSE_CACHE_TTL', 3600)
+    if not ttl or organization_id is None:
+        return build()
+
+    lock_key = None
+    try:
+        generations = _generations(organization_id, kinds)
+        if generations is None:
+            return build()
+        uri = hashlib.sha1(request.build_absolute_uri().encode()).hexdigest()[:16]
+        key = f'listing_{view}_{scope}_{generations}_{uri}'
+        data = cache.get(key)
+        if data is not None:
+            metrics.inc('api_response_cache_requests', view=view, result='hit')
+            return Response(data)
+        if cache.add(f'{key}_lock', 1, LOCK_TIMEOUT):
+            lock_key = f'{key}_lock'
+        else:
+            # Another request is building it
+            data = _wait_for(key)
+            if data is not None:
+                metrics.inc('api_response_cache_requests', view=view, result='wait')
+                return Response(data)
+    except Exception as e:
+        logger.warning("Failed to read the %s cache: %s", view, e)
+        return build()
+
+    metrics.inc('api_response_cache_requests', view=view, result='miss')
+    response = build()
+    try:
+        if response.status_code == 200:
+            cache.set(key, response.data, ttl)
+        if lock_key is not None:
+            cache.delete(lock_key)
+    except Exception as e:
+        logger.warning("Failed to cache %s: %s", view, e)
+    return response
+
+
+@receiver(post_save, sender=Organization)
+def organization_created(sender, instance, created=False, **kwargs):
+    # Nothing cached under a reused id may be served to a new organization
+    if created:
+        invalidate_listings([instance.id], CLUSTERS)
+        invalidate_listings([instance.id], UTILIZATION)
+
+
+@receiver([post_save, post_delete], sender=Cluster)
+def cluster_changed(sender, instance, **kwargs):
+    if Cluster.user.is_cached(instance):
+        organization_id = instance.user.organization_id
+    else:
+        # Only the owner's organization, rather than loading the whole owner
+        organization_id = UserProfile.objects.filter(id=instance.user_id).values_list('organization_id', flat=True).first()
+    invalidate_listings([organization_id], CLUSTERS)
+
+
+@receiver(post_init, sender=UserProfile)
+def user_profile_loaded(sender, instance, **kwargs):
+    # Remembered so a save can tell whether the organization changed without a query,
+    # unless the field was deferred
+    instance._loaded_organization_id = instance.__dict__.get('organization_id', DEFERRED)
+
+
+@receiver(pre_save, sender=UserProfile)
+def user_profile_saving(sender, instance, update_fields=None, **kwargs):
+    instance._previous_organization_id = None
+    if instance._state.adding:
+        return
+    if update_fields is not None and not {'organization', 'organization_id'} & set(update_fields):
+        return
+    previous = instance._loaded_organization_id
+    if previous is DEFERRED:
+        previous = UserProfile.objects.filter(id=instance.id).values_list('organization_id', flat=True).first()
+    if previous != instance.organization_id:
+        # The owner's clusters leave the organization they were listed in
+        instance._previous_organization_id = previous
+
+
+@receiver([post_save, post_delete], sender=UserProfile)
+def user_profile_changed(sender, instance, created=False, **kwargs):
+    if not created:
+        invalidate_listings({instance.organization_id, getattr(instance, '_previous_organization_id', None)}, CLUSTERS)
+    instance._loaded_organization_id = instance.organization_id
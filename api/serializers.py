@@ -51,3 +51,8 @@ class DeploymentSerializer(serializers.ModelSerializer):
     class Meta:
         model = Deployment
         fields = ['name', 'cpu_required', 'gpu_required', 'ram_required', 'docker_image', 'priority', 'cluster', 'status']
+
+
+class BulkDeploymentSerializer(DeploymentSerializer):
+    # An id, the clusters of a whole batch are looked up in one query
+    cluster = serializers.IntegerField(required=False, allow_null=True)
@@ -0,0 +1,123 @@
+import re
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import path, reverse
+from rest_framework_simplejwt.tokens import RefreshToken
+from api import async_views
+from api.auth import add_principal_claims, get_user_revocation_key
+from api.models import Organization, UserProfile, Cluster, Deployment
+from scheduler import async_views as scheduler_async_views
+from scheduler.queue_handler import queue_instance
+from scheduler.status import apublish_transitions
+from scheduler.tests.test_status import clear_status_streams
+
+# The routes ASYNC_VIEWS switches to async views
+urlpatterns = [
+    path('clusters/<int:cluster_id>/', async_views.cluster_status, name='cluster-status'),
+    path('schedule_deployment/', async_views.schedule_deployment, name='schedule_deployment'),
+    path('deployments/<int:deployment_id>/stop/', async_views.stop_deployment, name='stop-deployment'),
+    path('deployments/<int:deployment_id>/events/', async_views.deployment_events, name='deployment-events'),
+    path('queue-status/', scheduler_async_views.queue_status, name='queue-status'),
+    path('queue-status/<int:cluster_id>/', scheduler_async_views.cluster_queue_status, name='cluster-queue-status'),
+]
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class AsyncViewsTestCase(TestCase):
+    def setUp(self):
+        self.organization = Organization.objects.create(name="TestOrg")
+        self.user = UserProfile.objects.create(username="testuser", password="testpass", organization=self.organization)
+        django_user = User.objects.create_user(id=self.user.id, username="testuser", password="testpass")
+        token = add_principal_claims(RefreshToken.for_user(django_user), self.user)
+        self.headers = {'Authorization': f'Bearer {token.access_token}'}
+        self.cluster = Cluster.objects.create(name="TestCluster", user=self.user, total_cpu=16, total_gpu=2, total_ram=64)
+
+    def tearDown(self):
+        cache.delete(get_user_revocation_key(self.user.id))
+        queue_instance.clear_queue(self.cluster.id)
+        clear_status_streams()
+
+    def deployment_data(self, **data):
+        return {"docker_image": "model:latest", "cpu_required": 4, "gpu_required": 1, "ram_required": 8,
+                "priority": "high", "cluster": self.cluster.id, **data}
+
+    async def test_cluster_status(self):
+        await apublish_transitions([(0, self.cluster.id, None, 'queued')])
+        response = await self.async_client.get(reverse('cluster-status', args=[self.cluster.id]), headers=self.headers)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['user'], "testuser")
+
+        response = await self.async_client.get(reverse('cluster-status', args=[self.cluster.id]),
+                                               headers={**self.headers, 'If-None-Match': response['ETag']})
+        self.assertEqual(response.status_code, 304)
+
+    async def test_requires_a_token(self):
+        response = await self.async_client.get(reverse('cluster-status', args=[self.cluster.id]))
+        self.assertEqual(response.status_code, 401)
+
+        response = await self.async_client.get(reverse('cluster-status', args=[self.cluster.id]),
+                                               headers={'Authorization': 'Bearer invalid'})
+        self.assertEqual(response.status_code, 401)
+
+    async def test_rejects_other_methods(self):
+        response = await self.async_client.get(reverse('schedule_deployment'), headers=self.headers)
+        self.assertEqual(response.status_code, 405)
+
+    async def test_schedule_then_stop_deployment(self):
+        response = await self.async_client.post(reverse('schedule_deployment'), self.deployment_data(),
+                                                content_type='application/json', headers=self.headers)
+        self.assertEqual(response.status_code, 201)
+        deployment = await Deployment.objects.aget(id=response.json()['deployment_id'])
+        self.assertEqual(deployment.status, 'running')
+
+        response = await self.async_client.post(reverse('stop-deployment', args=[deployment.id]), headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['cluster_status']['utilized_cpu'], 0)
+
+        response = await self.async_client.post(reverse('stop-deployment', args=[deployment.id]), headers=self.headers)
+        self.assertEqual(response.status_code, 400)
+
+    async def test_schedule_deployment_invalid(self):
+        response = await self.async_client.post(reverse('schedule_deployment'), self.deployment_data(cpu_required=64),
+                                                content_type='application/json', headers=self.headers)
+        self.assertEqual(response.status_code, 404)
+
+        response = await self.async_client.post(reverse('schedule_deployment'), self.deployment_data(priority="urgent"),
+                                                content_type='application/json', headers=self.headers)
+        self.assertEqual(response.status_code, 400)
+
+    @override_settings(SCHEDULER_DISPATCHER='scheduler.dispatch.EventDispatcher')
+    async def test_schedule_deployment_with_worker(self):
+        response = await self.async_client.post(reverse('schedule_deployment'), self.deployment_data(),
+                                                content_type='application/json', headers=self.headers)
+        self.assertEqual(response.status_code, 202)
+
+        # Queued through the asyncio client for the scheduler worker
+        response = await self.async_client.get(reverse('cluster-queue-status', args=[self.cluster.id]))
+        self.assertEqual(response.json()['queues'], {'high_priority': 1, 'low_priority': 0})
+
+        response = await self.async_client.get(reverse('queue-status'), {'organization': self.organization.id})
+        self.assertEqual(response.json()['count'], 1)
+        self.assertEqual(response.json()['clusters'][0]['queues']['high_priority'], 1)
+
+    async def test_queue_status_invalid_page(self):
+        response = await self.async_client.get(reverse('queue-status'), {'page': 5})
+        self.assertEqual(response.status_code, 400)
+        response = await self.async_client.get(reverse('cluster-queue-status', args=[self.cluster.id + 100]))
+        self.assertEqual(response.status_code, 404)
+
+    @override_settings(STATUS_STREAM_HEARTBEAT=0.01, STATUS_STREAM_DURATION=0.05)
+    async def test_deployment_events(self):
+        response = await self.async_client.post(reverse('schedule_deployment'), self.deployment_data(),
+                                                content_type='application/json', headers=self.headers)
+        deployment_id = response.json()['deployment_id']
+        await self.async_client.post(reverse('stop-deployment', args=[deployment_id]), headers=self.headers)
+
+        response = await self.async_client.get(reverse('deployment-events', args=[deployment_id]),
+                                               headers={**self.headers, 'Last-Event-ID': '0-0'})
+
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        body = b''.join([chunk async for chunk in response.streaming_content]).decode()
+        self.assertEqual(re.findall(r'"status": "(\w+)"', body), ['queued', 'running', 'stopped'])
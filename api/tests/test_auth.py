@@ -0,0 +1,130 @@
+import time
+from types import SimpleNamespace
+from unittest import mock
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
+from django.core.cache import cache
+from api.auth import Principal, get_principal, get_user_revocation_key
+from api.models import Organization, UserProfile, Cluster
+
+
+def make_request(user_id):
+    return SimpleNamespace(user=SimpleNamespace(id=user_id))
+
+
+class PrincipalTestCase(TestCase):
+    def setUp(self):
+        self.organization = Organization.objects.create(name="TestOrg")
+        self.user = UserProfile.objects.create(username="testuser", password="testpass",
+                                               organization=self.organization, role='developer')
+
+    def tearDown(self):
+        # Ids are reused by later tests, whose tokens must not count as revoked
+        cache.delete(get_user_revocation_key(self.user.id))
+
+    def test_loaded_once_per_request_then_cached(self):
+        request = make_request(self.user.id)
+        with self.assertNumQueries(1):
+            principal = get_principal(request)
+            self.assertIs(get_principal(request), principal)
+        self.assertEqual((principal.username, principal.organization_id, principal.role),
+                         ("testuser", self.organization.id, 'developer'))
+
+        with self.assertNumQueries(0):
+            self.assertEqual(get_principal(make_request(self.user.id)).role, 'developer')
+
+    def test_invalidated_when_profile_changes(self):
+        get_principal(make_request(self.user.id))
+        self.user.role = 'admin'
+        self.user.save()
+
+        self.assertTrue(get_principal(make_request(self.user.id)).is_admin)
+
+    @override_settings(PRINCIPAL_CACHE_TTL=0)
+    def test_cache_can_be_disabled(self):
+        get_principal(make_request(self.user.id))
+        with self.assertNumQueries(1):
+            get_principal(make_request(self.user.id))
+
+    def test_missing_profile(self):
+        with self.assertRaises(UserProfile.DoesNotExist):
+            get_principal(make_request(self.user.id + 100))
+
+
+class CanAccessTestCase(TestCase):
+    def setUp(self):
+        organization = Organization.objects.create(name="TestOrg")
+        owner = UserProfile.objects.create(username="owner", password="testpass", organization=organization)
+        self.cluster = Cluster.objects.select_related('user').get(id=Cluster.objects.create(
+            name="TestCluster", user=owner, total_cpu=4, total_gpu=0, total_ram=8).id)
+        self.owner = Principal(owner.id, "owner", organization.id, 'admin')
+        self.member = Principal(owner.id + 1, "member", organization.id, 'developer')
+        self.outsider = Principal(owner.id + 2, "outsider", None, 'admin')
+
+    def test_members_see_and_owners_manage(self):
+        with self.assertNumQueries(0):
+            self.assertTrue(self.owner.can_access(self.cluster, manage=True))
+            self.assertTrue(self.member.can_access(self.cluster))
+            self.assertFalse(self.member.can_access(self.cluster, manage=True))
+            self.assertFalse(self.outsider.can_access(self.cluster))
+            self.assertFalse(self.owner.can_access(None))
+
+    def test_users_without_organization_only_see_their_own(self):
+        self.cluster.user.organization_id = None
+        self.assertFalse(self.outsider.can_access(self.cluster))
+
+
+class ClaimsAuthenticationTestCase(APITestCase):
+    def setUp(self):
+        self.organization = Organization.objects.create(name="TestOrg")
+        self.user = UserProfile.objects.create(username="testuser", password=make_password("testpass"),
+                                               organization=self.organization)
+        User.objects.create_user(id=self.user.id, username="testuser", password="testpass")
+        self.cluster = Cluster.objects.create(name="TestCluster", user=self.user, total_cpu=4, total_gpu=0, total_ram=8)
+
+    def tearDown(self):
+        cache.delete(get_user_revocation_key(self.user.id))
+
+    def login(self):
+        response = self.client.post(reverse('login_user'), {"username": "testuser", "password": "testpass"}, format='json')
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.json()['access']}")
+        return response.json()
+
+    def test_access_token_carries_the_principal(self):
+        access = AccessToken(self.login()['access'])
+
+        self.assertEqual(access['profile_id'], self.user.id)
+        self.assertEqual(access['organization_id'], self.organization.id)
+        self.assertEqual(access['role'], 'admin')
+
+    def test_cluster_status_is_authorized_without_the_database(self):
+        self.login()
+
+        # Only the cluster itself is read
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('cluster-status', args=[self.cluster.id]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_logout_revokes_the_tokens(self):
+        tokens = self.login()
+
+        response = self.client.post(reverse('logout_user'), {"refresh": tokens['refresh']}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        response = self.client.get(reverse('cluster-status', args=[self.cluster.id]))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_profile_change_revokes_earlier_tokens(self):
+        self.login()
+        # Tokens issued in the second the profile changes stay valid, so look a second ahead
+        with mock.patch('api.auth.time.time', return_value=time.time() + 1):
+            self.user.role = 'developer'
+            self.user.save()
+
+        response = self.client.get(reverse('cluster-status', args=[self.cluster.id]))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
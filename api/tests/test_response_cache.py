@@ -0,0 +1,132 @@
+import threading
+import time
+from django.contrib.auth.models import User
+from django.test import TestCase, RequestFactory
+from django.urls import reverse
+from rest_framework.response import Response
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import RefreshToken
+from api.auth import add_principal_claims
+from api.models import Organization, UserProfile, Cluster
+from api.response_cache import cached_listing
+from scheduler.metrics import METRICS_KEY, metrics
+from scheduler.queue_handler import queue_instance
+from scheduler.tests.test_status import clear_status_streams
+
+
+class ListingCacheTests(APITestCase):
+    def setUp(self):
+        self.organization = Organization.objects.create(name="TestOrg")
+        self.user = UserProfile.objects.create(username="testuser", password="testpass", organization=self.organization)
+        django_user = User.objects.create_user(id=self.user.id, username="testuser", password="testpass")
+        # Tokens carrying the principal authenticate without a query
+        token = add_principal_claims(RefreshToken.for_user(django_user), self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token.access_token}')
+        self.cluster = Cluster.objects.create(name="TestCluster", user=self.user, total_cpu=8, total_gpu=0, total_ram=32)
+
+    def tearDown(self):
+        queue_instance.clear_queue(self.cluster.id)
+        clear_status_streams()
+
+    def list(self, name, queries):
+        with self.assertNumQueries(queries):
+            response = self.client.get(reverse(name))
+        self.assertEqual(response.status_code, 200)
+        return response.json()['results']
+
+    def test_organization_clusters_are_cached_until_a_cluster_is_created(self):
+        self.assertEqual(len(self.list('organization-clusters', 1)), 1)
+        self.assertEqual(len(self.list('organization-clusters', 0)), 1)
+
+        response = self.client.post(reverse('create_cluster'), {
+            "name": "Second", "total_cpu": 4, "total_gpu": 0, "total_ram": 8,
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+
+        self.assertEqual([cluster['name'] for cluster in self.list('organization-clusters', 1)], ["Second", "TestCluster"])
+
+    def test_user_clusters_follow_scheduling_and_stopping(self):
+        self.assertEqual(self.list('user-clusters', 1)[0]['utilized_cpu'], 0)
+
+        response = self.client.post(reverse('schedule_deployment'), {
+            "docker_image": "model:latest", "cpu_required": 2, "gpu_required": 0, "ram_required": 4,
+            "priority": "high", "cluster": self.cluster.id,
+        }, format='json')
+        self.assertEqual(self.list('user-clusters', 1)[0]['utilized_cpu'], 2)
+        self.assertEqual(self.list('user-clusters', 0)[0]['utilized_cpu'], 2)
+
+        # Scheduling leaves the organization's listing, which has no utilization, cached
+        self.list('organization-clusters', 1)
+        self.client.post(reverse('stop-deployment', args=[response.json()['deployment_id']]))
+        self.list('organization-clusters', 0)
+        self.assertEqual(self.list('user-clusters', 1)[0]['utilized_cpu'], 0)
+
+    def test_pages_are_cached_apart(self):
+        Cluster.objects.create(name="Second", user=self.user, total_cpu=4, total_gpu=0, total_ram=8)
+        first = self.client.get(reverse('user-clusters'), {'page_size': 1}).json()
+        second = self.client.get(first['next']).json()
+
+        self.assertNotEqual(first['results'], second['results'])
+        self.assertEqual(self.client.get(reverse('user-clusters'), {'page_size': 1}).json(), first)
+
+    def test_moving_a_user_invalidates_both_organizations(self):
+        self.assertEqual(len(self.list('organization-clusters', 1)), 1)
+        other = Organization.objects.create(name="OtherOrg")
+        member = UserProfile.objects.create(username="member", password="testpass", organization=other)
+        Cluster.objects.create(name="Theirs", user=member, total_cpu=4, total_gpu=0, total_ram=8)
+
+        member.organization = self.organization
+        member.save()
+
+        self.assertEqual(len(self.list('organization-clusters', 1)), 2)
+
+    def test_invalidation_adds_no_queries_to_saves(self):
+        # The owner is already loaded, and the organization did not change
+        with self.assertNumQueries(1):
+            self.cluster.save()
+        with self.assertNumQueries(1):
+            self.user.save()
+        user = UserProfile.objects.get(id=self.user.id)
+        with self.assertNumQueries(1):
+            user.save(update_fields=['username'])
+        self.list('organization-clusters', 1)
+
+        # Without the owner only its organization is read
+        cluster = Cluster.objects.get(id=self.cluster.id)
+        with self.assertNumQueries(2):
+            cluster.save()
+        self.list('organization-clusters', 1)
+
+
+class StampedeTests(TestCase):
+    def waits(self):
+        metrics.flush()
+        return float(queue_instance.redis_client.hget(
+            METRICS_KEY, 'api_response_cache_requests{view="test_listing",result="wait"}') or 0)
+
+    def test_concurrent_misses_build_once(self):
+        organization = Organization.objects.create(name="TestOrg")
+        waits = self.waits()
+        request = RequestFactory().get('/api/organization/clusters/')
+        builds = []
+
+        def build():
+            builds.append(1)
+            time.sleep(0.2)
+            return Response({"results": ["cluster"]})
+
+        responses = []
+        threads = [
+            threading.Thread(target=lambda: responses.append(
+                cached_listing(request, 'test_listing', organization.id, organization.id, ('clusters',), build)))
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(builds), 1)
+        self.assertEqual([response.data for response in responses], [{"results": ["cluster"]}] * 5)
+        # The others waited for the first request's entry
+        self.assertEqual(self.waits() - waits, 4)
@@ -1,10 +1,21 @@
+import json
+from unittest import mock
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.test import override_settings
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APITestCase
-from api.models import UserProfile, Organization, Cluster
+from api.models import UserProfile, Organization, Cluster, Deployment
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth.models import User
 from django.contrib.auth.hashers import make_password
+from api.auth import add_principal_claims
+from scheduler.dispatch import SchedulingDispatchError
+from scheduler.queue_handler import queue_instance
+from scheduler.scheduler import DeploymentScheduler
+from scheduler.tests.test_status import clear_status_streams
+from scheduler.versions import get_version_key
 
 class UserTests(APITestCase):
     def setUp(self):
@@ -64,3 +75,383 @@ class ClusterTests(APITestCase):
         }
         response = self.client.post(url, data, format='json')
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_schedule_deployment(self):
+        cluster = Cluster.objects.create(name="TestCluster", user=self.user, total_cpu=16, total_gpu=2, total_ram=64)
+        url = reverse('schedule_deployment')
+        data = {
+            "name": "model",
+            "docker_image": "model:latest",
+            "cpu_required": 4,
+            "gpu_required": 1,
+            "ram_required": 8,
+            "priority": "high",
+            "cluster": cluster.id
+        }
+        response = self.client.post(url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        # The scheduler runs in-process, so the deployment is started right away
+        deployment = Deployment.objects.get(id=response.json()['deployment_id'])
+        self.assertEqual(deployment.status, 'running')
+        cluster.refresh_from_db()
+        self.assertEqual(cluster.utilized_cpu, 4)
+
+    @override_settings(SCHEDULER_DISPATCHER='scheduler.dispatch.EventDispatcher')
+    def test_schedule_deployment_with_worker(self):
+        cluster = Cluster.objects.create(name="TestCluster", user=self.user, total_cpu=16, total_gpu=2, total_ram=64)
+        url = reverse('schedule_deployment')
+        data = {
+            "docker_image": "model:latest",
+            "cpu_required": 4,
+            "gpu_required": 1,
+            "ram_required": 8,
+            "priority": "high",
+            "cluster": cluster.id
+        }
+        response = self.client.post(url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+
+        # Left queued for the scheduler worker
+        deployment = Deployment.objects.get(id=response.json()['deployment_id'])
+        self.assertEqual(deployment.status, 'queued')
+        queue_instance.clear_queue(cluster.id)
+
+    def test_schedule_deployment_without_cluster(self):
+        cluster = Cluster.objects.create(name="TestCluster", user=self.user, total_cpu=16, total_gpu=2, total_ram=64)
+        url = reverse('schedule_deployment')
+        data = {
+            "docker_image": "model:latest",
+            "cpu_required": 4,
+            "gpu_required": 1,
+            "ram_required": 8,
+            "priority": "high"
+        }
+        response = self.client.post(url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.json()['cluster_id'], cluster.id)
+
+
+class ListingTests(APITestCase):
+    def setUp(self):
+        self.organization = Organization.objects.create(name="TestOrg")
+        self.user = UserProfile.objects.create(username="testuser", password="testpass", organization=self.organization)
+        self.django_user = User.objects.create_user(id=self.user.id, username="testuser", password="testpass")
+        self.token = RefreshToken.for_user(self.django_user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token.access_token}')
+        self.cluster = Cluster.objects.create(name="TestCluster", user=self.user, total_cpu=16, total_gpu=2, total_ram=64)
+
+    def create_deployments(self, count, **fields):
+        Deployment.objects.bulk_create([
+            Deployment(docker_image="model:latest", cpu_required=1, gpu_required=0, ram_required=1,
+                       cluster=self.cluster, user=self.user, **{'priority': 'low', **fields})
+            for _ in range(count)
+        ])
+
+    def test_cluster_deployments_are_cursor_paginated(self):
+        self.create_deployments(5)
+        url = reverse('cluster-deployments', args=[self.cluster.id])
+
+        first = self.client.get(url, {'page_size': 2}).json()
+        # Newest first, and a deployment added meanwhile does not shift the next page
+        self.create_deployments(1)
+        second = self.client.get(first['next']).json()
+        third = self.client.get(second['next']).json()
+
+        self.assertEqual(len(first['results']), 2)
+        self.assertEqual(len(second['results']), 2)
+        self.assertEqual(len(third['results']), 1)
+        self.assertIsNone(third['next'])
+        self.assertIsNone(first['previous'])
+        self.assertIsNotNone(second['previous'])
+
+    def test_cluster_deployments_filters(self):
+        self.create_deployments(3, status='running')
+        self.create_deployments(2, status='queued', priority='high')
+        url = reverse('cluster-deployments', args=[self.cluster.id])
+
+        running = self.client.get(url, {'status': 'running'}).json()['results']
+        high = self.client.get(url, {'priority': 'high'}).json()['results']
+
+        self.assertEqual([d['status'] for d in running], ['running'] * 3)
+        self.assertEqual([d['priority'] for d in high], ['high'] * 2)
+        self.assertEqual(self.client.get(url, {'status': 'sleeping'}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(url, {'cursor': 'nonsense'}).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_cluster_listings_query_count_is_flat(self):
+        for i in range(20):
+            Cluster.objects.create(name=f"Cluster{i}", user=self.user, total_cpu=1, total_gpu=0, total_ram=1)
+
+        # Authenticated user, principal and one page, however many clusters are listed
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('user-clusters'))
+        self.assertEqual(len(response.json()['results']), 21)
+        self.assertEqual(response.json()['results'][0]['user'], 'testuser')
+
+        # The principal is cached by now
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('organization-clusters'), {'page_size': 5})
+        self.assertEqual(len(response.json()['results']), 5)
+
+
+class BulkSchedulingTests(APITestCase):
+    def setUp(self):
+        self.organization = Organization.objects.create(name="TestOrg")
+        self.user = UserProfile.objects.create(username="testuser", password="testpass", organization=self.organization)
+        self.django_user = User.objects.create_user(id=self.user.id, username="testuser", password="testpass")
+        self.token = RefreshToken.for_user(self.django_user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token.access_token}')
+        self.first = Cluster.objects.create(name="First", user=self.user, total_cpu=8, total_gpu=0, total_ram=32)
+        self.second = Cluster.objects.create(name="Second", user=self.user, total_cpu=8, total_gpu=0, total_ram=32)
+
+    def tearDown(self):
+        queue_instance.clear_queue(self.first.id)
+        queue_instance.clear_queue(self.second.id)
+
+    def deployment(self, cluster, **fields):
+        return {"docker_image": "model:latest", "cpu_required": 2, "gpu_required": 0, "ram_required": 4,
+                "priority": "low", "cluster": cluster.id if cluster else None, **fields}
+
+    def test_schedules_valid_deployments_and_reports_each(self):
+        outsider = UserProfile.objects.create(username="outsider", password="testpass")
+        elsewhere = Cluster.objects.create(name="Elsewhere", user=outsider, total_cpu=8, total_gpu=0, total_ram=32)
+        deployments = [
+            self.deployment(self.first, priority="high"),
+            self.deployment(self.second),
+            self.deployment(self.first, priority="urgent"),
+            self.deployment(elsewhere),
+            self.deployment(self.second, cpu_required=64),
+            self.deployment(None, priority="high"),
+        ]
+
+        with mock.patch.object(DeploymentScheduler, 'process_cluster_queue', autospec=True,
+                               side_effect=DeploymentScheduler.process_cluster_queue) as process:
+            response = self.client.post(reverse('schedule_deployments'), {"deployments": deployments}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        body = response.json()
+        self.assertEqual((body['created'], body['failed']), (3, 3))
+        results = body['results']
+        self.assertEqual(results[0]['cluster_id'], self.first.id)
+        self.assertEqual(results[1]['cluster_id'], self.second.id)
+        self.assertIn('priority', results[2]['errors'])
+        self.assertIn('permission', results[3]['error'])
+        self.assertIn('exceeds', results[4]['error'])
+        self.assertIn(results[5]['cluster_id'], (self.first.id, self.second.id))
+
+        # One pass per cluster, which starts everything that fits
+        self.assertEqual(process.call_count, 2)
+        self.assertEqual(Deployment.objects.filter(status='running').count(), 3)
+        self.assertFalse(Deployment.objects.filter(cluster=elsewhere).exists())
+
+    @override_settings(SCHEDULER_DISPATCHER='scheduler.dispatch.EventDispatcher')
+    def test_query_count_does_not_grow_with_the_batch(self):
+        def submit(count):
+            deployments = [self.deployment(self.first if i % 3 else None) for i in range(count)]
+            response = self.client.post(reverse('schedule_deployments'), {"deployments": deployments}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+            self.assertEqual(response.json()['created'], count)
+
+        submit(1)
+        with CaptureQueriesContext(connection) as queries:
+            submit(500)
+        # Authenticated user, clusters and candidates, the principal is cached by
+        # now. Inserts are only split where the database limits query parameters.
+        statements = [query['sql'].split()[0] for query in queries.captured_queries]
+        self.assertEqual(statements.count('SELECT'), 3)
+        self.assertEqual(set(statements[3:]), {'INSERT'})
+        length = queue_instance.get_queue_length(self.first.id)
+        self.assertEqual(length['low_priority'] + queue_instance.get_queue_length(self.second.id)['low_priority'], 501)
+
+    def test_placement_spreads_a_batch(self):
+        deployments = [self.deployment(None, cpu_required=6) for _ in range(2)]
+        response = self.client.post(reverse('schedule_deployments'), {"deployments": deployments}, format='json')
+
+        clusters = {result['cluster_id'] for result in response.json()['results']}
+        self.assertEqual(clusters, {self.first.id, self.second.id})
+
+    def test_rejects_invalid_batches(self):
+        url = reverse('schedule_deployments')
+        self.assertEqual(self.client.post(url, {"deployments": []}, format='json').status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(url, {"deployments": [self.deployment(self.first, priority="urgent")]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.json()['failed'], 1)
+        response = self.client.post(url, {"deployments": [self.deployment(None)], "placement": "random"}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(url, [self.deployment(self.first)], format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Deployment.objects.exists())
+
+    def test_dispatch_error_reports_the_saved_deployments(self):
+        deployments = [self.deployment(self.first), self.deployment(self.second, priority="urgent")]
+        with mock.patch('scheduler.dispatch.InProcessDispatcher.schedule_many',
+                        side_effect=SchedulingDispatchError("Redis is down")):
+            response = self.client.post(reverse('schedule_deployments'), {"deployments": deployments}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_502_BAD_GATEWAY)
+        body = response.json()
+        self.assertEqual((body['created'], body['failed'], body['error']), (1, 1, "Redis is down"))
+        deployment = Deployment.objects.get()
+        self.assertEqual(body['results'][0], {"deployment_id": deployment.id, "cluster_id": self.first.id,
+                                              "error": "Redis is down"})
+        self.assertIn('priority', body['results'][1]['errors'])
+
+
+@override_settings(STATUS_STREAM_HEARTBEAT=0.01, STATUS_STREAM_DURATION=0.05)
+class StatusStreamTests(APITestCase):
+    def setUp(self):
+        self.organization = Organization.objects.create(name="TestOrg")
+        self.user = UserProfile.objects.create(username="testuser", password="testpass", organization=self.organization)
+        self.django_user = User.objects.create_user(id=self.user.id, username="testuser", password="testpass")
+        self.token = RefreshToken.for_user(self.django_user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token.access_token}')
+        self.cluster = Cluster.objects.create(name="TestCluster", user=self.user, total_cpu=8, total_gpu=0, total_ram=32)
+        clear_status_streams()
+
+    def tearDown(self):
+        queue_instance.clear_queue(self.cluster.id)
+        clear_status_streams()
+
+    def schedule(self):
+        response = self.client.post(reverse('schedule_deployment'), {
+            "docker_image": "model:latest", "cpu_required": 2, "gpu_required": 0, "ram_required": 4,
+            "priority": "high", "cluster": self.cluster.id,
+        }, format='json')
+        return response.json()['deployment_id']
+
+    def stream(self, url, **extra):
+        """The (event id, transition) pairs streamed by ``url``"""
+        response = self.client.get(url, HTTP_ACCEPT='text/event-stream', **extra)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        events = []
+        for message in b''.join(response.streaming_content).decode().split('\n\n'):
+            fields = dict(line.split(': ', 1) for line in message.split('\n') if ': ' in line)
+            if fields.get('event') == 'status':
+                events.append((fields['id'], json.loads(fields['data'])))
+        return events
+
+    def test_streams_deployment_transitions(self):
+        deployment_id = self.schedule()
+        self.client.post(reverse('stop-deployment', args=[deployment_id]))
+
+        events = self.stream(reverse('deployment-events', args=[deployment_id]), HTTP_LAST_EVENT_ID='0-0')
+
+        self.assertEqual([event['status'] for _, event in events], ['queued', 'running', 'stopped'])
+        self.assertEqual(events[0][1]['organization_id'], self.organization.id)
+
+    def test_resumes_after_last_event_id(self):
+        deployment_id = self.schedule()
+        events = self.stream(reverse('organization-events'), data={'last_event_id': '0-0'})
+        self.assertEqual(len(events), 2)
+
+        # Event ids belong to their stream, resume the stream they came from
+        events = self.stream(reverse('organization-events'), HTTP_LAST_EVENT_ID=events[0][0])
+        self.assertEqual([(event['deployment_id'], event['status']) for _, event in events], [(deployment_id, 'running')])
+
+        events = self.stream(reverse('cluster-events', args=[self.cluster.id]), data={'last_event_id': '0-0'})
+        self.assertEqual([event['status'] for _, event in events], ['queued', 'running'])
+
+    def test_rejects_invalid_requests(self):
+        response = self.client.get(reverse('cluster-events', args=[self.cluster.id]), HTTP_LAST_EVENT_ID='latest')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        outsider = UserProfile.objects.create(username="outsider", password="testpass")
+        elsewhere = Cluster.objects.create(name="Elsewhere", user=outsider, total_cpu=8, total_gpu=0, total_ram=32)
+        response = self.client.get(reverse('cluster-events', args=[elsewhere.id]), HTTP_ACCEPT='text/event-stream')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        response = self.client.get(reverse('deployment-events', args=[0]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class ConditionalGetTests(APITestCase):
+    def setUp(self):
+        self.organization = Organization.objects.create(name="TestOrg")
+        self.user = UserProfile.objects.create(username="testuser", password="testpass", organization=self.organization)
+        self.django_user = User.objects.create_user(id=self.user.id, username="testuser", password="testpass")
+        # Tokens carrying the principal authenticate without a query
+        self.token = add_principal_claims(RefreshToken.for_user(self.django_user), self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token.access_token}')
+        self.cluster = Cluster.objects.create(name="TestCluster", user=self.user, total_cpu=8, total_gpu=0, total_ram=32)
+        # Ids are reused once a test's rows are rolled back
+        queue_instance.redis_client.delete(get_version_key('cluster', self.cluster.id))
+
+    def tearDown(self):
+        queue_instance.clear_queue(self.cluster.id)
+        queue_instance.redis_client.delete(get_version_key('cluster', self.cluster.id))
+        clear_status_streams()
+
+    def schedule(self):
+        response = self.client.post(reverse('schedule_deployment'), {
+            "docker_image": "model:latest", "cpu_required": 2, "gpu_required": 0, "ram_required": 4,
+            "priority": "high", "cluster": self.cluster.id,
+        }, format='json')
+        return response.json()['deployment_id']
+
+    def assertNotModified(self, url, etag, if_none_match=None, **params):
+        with self.assertNumQueries(0):
+            response = self.client.get(url, params, HTTP_IF_NONE_MATCH=if_none_match or etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_cluster_status(self):
+        url = reverse('cluster-status', args=[self.cluster.id])
+        # Versions start with the first transition
+        self.assertFalse(self.client.get(url).has_header('ETag'))
+        self.schedule()
+        etag = self.client.get(url)['ETag']
+        self.assertNotModified(url, etag)
+
+        # Scheduling changes the cluster's utilization
+        self.schedule()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['utilized_cpu'], 4)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_ignores_wildcard(self):
+        deployment_id = self.schedule()
+
+        response = self.client.get(reverse('get-deployment', args=[deployment_id]), HTTP_IF_NONE_MATCH='*')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        queue_instance.redis_client.delete(get_version_key('deployment', 987654))
+        response = self.client.get(reverse('get-deployment', args=[987654]), HTTP_IF_NONE_MATCH='*')
+        self.assertNotEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertFalse(queue_instance.redis_client.exists(get_version_key('deployment', 987654)))
+
+    def test_get_deployment(self):
+        deployment_id = self.schedule()
+        url = reverse('get-deployment', args=[deployment_id])
+        etag = self.client.get(url)['ETag']
+        self.assertNotModified(url, etag)
+
+        self.client.post(reverse('stop-deployment', args=[deployment_id]))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.json()['status'], 'stopped')
+
+        self.assertNotModified(url, response['ETag'], if_none_match=f'"other", {response["ETag"]}')
+
+    def test_cluster_deployments_per_query(self):
+        self.schedule()
+        url = reverse('cluster-deployments', args=[self.cluster.id])
+        etag = self.client.get(url)['ETag']
+        running = self.client.get(url, {'status': 'running'})['ETag']
+        self.assertNotEqual(etag, running)
+        self.assertNotModified(url, running, status='running')
+
+        response = self.client.get(url, {'status': 'stopped'}, HTTP_IF_NONE_MATCH=running)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.schedule()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(len(response.json()['results']), 2)
+
+    def test_errors_carry_no_etag(self):
+        outsider = UserProfile.objects.create(username="outsider", password="testpass")
+        elsewhere = Cluster.objects.create(name="Elsewhere", user=outsider, total_cpu=8, total_gpu=0, total_ram=32)
+
+        response = self.client.get(reverse('cluster-status', args=[elsewhere.id]))
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertFalse(response.has_header('ETag'))
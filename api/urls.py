@@ -1,9 +1,14 @@
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path, include, re_path
 from rest_framework import permissions
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
-from .views import register_user, login_user, generate_invite_code, create_cluster, cluster_status, schedule_deployment, stop_deployment, user_clusters, organization_clusters, get_deployment, cluster_deployments
+from .views import register_user, login_user, logout_user, generate_invite_code, create_cluster, cluster_status, schedule_deployment, schedule_deployments, stop_deployment, user_clusters, organization_clusters, get_deployment, cluster_deployments, deployment_events, cluster_events, organization_events
+
+if settings.ASYNC_VIEWS:
+    # Served by an ASGI server, the I/O bound endpoints don't hold a thread while they wait
+    from .async_views import cluster_status, schedule_deployment, stop_deployment, deployment_events, cluster_events, organization_events
 
 # Create Info object with tags
 info = openapi.Info(
@@ -35,14 +40,19 @@ schema_view = get_schema_view(
 urlpatterns = [
     path('register/', register_user, name='register_user'),  # URL for user registration
     path('login/', login_user, name='login_user'),            # URL for user login
+    path('logout/', logout_user, name='logout_user'),
     path('generate_invite_code/', generate_invite_code, name='generate_invite_code'),
     path('create_cluster/', create_cluster, name='create_cluster'),
     path('clusters/<int:cluster_id>/', cluster_status, name='cluster-status'),
     path('schedule_deployment/', schedule_deployment, name='schedule_deployment'),
+    path('schedule_deployments/', schedule_deployments, name='schedule_deployments'),
     path('deployments/<int:deployment_id>/stop/', stop_deployment, name='stop-deployment'),
     path('user/clusters/', user_clusters, name='user-clusters'),
     path('organization/clusters/', organization_clusters, name='organization-clusters'),
     path('deployments/<int:deployment_id>/', get_deployment, name='get-deployment'),
     path('clusters/<int:cluster_id>/deployments/', cluster_deployments, name='cluster-deployments'),
+    path('deployments/<int:deployment_id>/events/', deployment_events, name='deployment-events'),
+    path('clusters/<int:cluster_id>/events/', cluster_events, name='cluster-events'),
+    path('organization/events/', organization_events, name='organization-events'),
 ]
 
@@ -1,22 +1,54 @@
+import hashlib
+import logging
+from django.conf import settings
 from django.db import transaction
 from .models import Deployment
-from django.http import JsonResponse
+from django.http import HttpResponseNotModified, JsonResponse, StreamingHttpResponse
+from django.utils.http import parse_etags, quote_etag
 import json
 from .models import Organization, InviteCode, UserProfile, Cluster
 from django.views.decorators.csrf import csrf_exempt
 from django.contrib.auth.hashers import make_password, check_password
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, renderer_classes
 from django.shortcuts import get_object_or_404
-from .serializers import RegisterUserSerializer, LoginSerializer, InviteCodeSerializer, ClusterSerializer, ClusterStatusSerializer, DeploymentSerializer
-import requests
+from .serializers import RegisterUserSerializer, LoginSerializer, InviteCodeSerializer, ClusterSerializer, ClusterStatusSerializer, DeploymentSerializer, BulkDeploymentSerializer
+from scheduler.dispatch import get_dispatcher, SchedulingDispatchError
+from scheduler.engines import get_engine
+from scheduler.accounting import release
+from scheduler.capacity import get_capacity_cache
+from scheduler.placement import candidate_clusters, choose_cluster, place_deployments
+from scheduler.queue_handler import deployment_payload
+from scheduler.status import QUEUED, STOPPED, event_stream, is_event_id, publish_transitions
+from scheduler.versions import get_version
+from .pagination import paginated_response
+from .renderers import EventStreamRenderer
+from .response_cache import CLUSTERS, UTILIZATION, cached_listing, invalidate_listings
+from .auth import add_principal_claims, get_principal, revoke_token
 from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.exceptions import TokenError
 from django.contrib.auth.models import User
 from rest_framework.decorators import authentication_classes
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 
+logger = logging.getLogger(__name__)
+
+# Most deployments one schedule_deployments request accepts
+BULK_DEPLOYMENT_LIMIT = 1000
+
+EXCEEDS_CLUSTER_ERROR = "cannot make this deployment on given cluster. deployment requiements exceeds cluster specifications"
+
+# Query parameters of the cursor paginated listings
+PAGINATION_PARAMETERS = [
+    openapi.Parameter('cursor', openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                      description="Cursor from the 'next' or 'previous' link of another page"),
+    openapi.Parameter('page_size', openapi.IN_QUERY, type=openapi.TYPE_INTEGER,
+                      description="Items per page, 100 by default and at most 1000"),
+]
+
 
 # 1. Authentication Endpoints
 @swagger_auto_schema(
@@ -132,7 +164,8 @@ def login_user(request):
         user_profile = UserProfile.objects.filter(username=username).first()
         if user_profile and check_password(password, user_profile.password):
             django_user = User.objects.get(username=username)
-            refresh = RefreshToken.for_user(django_user)
+            # Access tokens carry the principal, so requests are authorized without the database
+            refresh = add_principal_claims(RefreshToken.for_user(django_user), user_profile)
             return Response({
                 'refresh': str(refresh),
                 'access': str(refresh.access_token),
@@ -142,6 +175,36 @@ def login_user(request):
             return Response({'error': 'Invalid Credentials'}, status=401)
     return Response(serializer.errors, status=400)
 
+# Logout User
+@swagger_auto_schema(
+    method='post',
+    request_body=openapi.Schema(
+        type=openapi.TYPE_OBJECT,
+        properties={'refresh': openapi.Schema(type=openapi.TYPE_STRING, description="Refresh token to revoke too")},
+    ),
+    responses={
+        200: "Tokens revoked",
+        400: "Invalid refresh token"
+    },
+    operation_description="Revoke the access token of this request and, if given, a refresh token",
+    tags=['1. Authentication'],
+    operation_id='1_3_logout'
+)
+
+@api_view(['POST'])
+
+def logout_user(request):
+    try:
+        if request.data.get('refresh'):
+            try:
+                revoke_token(RefreshToken(request.data['refresh']))
+            except TokenError as e:
+                return Response({'error': str(e)}, status=400)
+        revoke_token(request.auth)
+        return Response({'message': 'User logged out successfully.'})
+    except Exception as e:
+        return Response({'error': str(e)}, status=500)
+
 # Generate Invite Code
 @swagger_auto_schema(
     method='post',
@@ -160,17 +223,15 @@ def login_user(request):
 
 def generate_invite_code(request):
     try:
-        user_profile = UserProfile.objects.get(username=request.user)
+        principal = get_principal(request)
 
-        if user_profile.role != 'admin':
+        if not principal.is_admin:
             return Response({'error': 'You do not have permission to generate invite codes.'}, status=403)
 
-        org_id = user_profile.organization.id
-        if not org_id:
+        if not principal.organization_id:
             return Response({'error': 'Organization ID is required.'}, status=400)
 
-        organization = get_object_or_404(Organization, id=org_id)
-        invite_code = InviteCode.objects.create(organization=organization)
+        invite_code = InviteCode.objects.create(organization_id=principal.organization_id)
 
         serializer = InviteCodeSerializer(invite_code)
         return Response(serializer.data, status=201)
@@ -200,19 +261,15 @@ def create_cluster(request):
     serializer = ClusterSerializer(data=request.data)
 
     if serializer.is_valid():
-        # Check if the user and organization exist
-        user_id = request.user.id
-        
+        # Check if the user exists
         try:
-            user = UserProfile.objects.get(id=user_id)
+            principal = get_principal(request)
             
         except UserProfile.DoesNotExist:
             return JsonResponse({"error": "User not found"}, status=404)
-        except Organization.DoesNotExist:
-            return JsonResponse({"error": "Organization not found"}, status=404)
 
-        # Set the organization and user fields
-        cluster = serializer.save(user=user)
+        # Set the organization and user fields, saving invalidates the organization's cached listings
+        cluster = serializer.save(user=principal.profile())
         return JsonResponse(ClusterSerializer(cluster).data, status=201)
 
     return JsonResponse(serializer.errors, status=400)
@@ -222,6 +279,7 @@ def create_cluster(request):
     method='get',
     responses={
         200: ClusterStatusSerializer,
+        304: "Unchanged since the ETag in If-None-Match",
         404: "Cluster not found",
         403: "Permission denied"
     },
@@ -233,17 +291,24 @@ def create_cluster(request):
 @api_view(['GET'])
 
 def cluster_status(request, cluster_id):
+    etag = resource_etag('cluster', cluster_id)
+    response = not_modified(request, etag)
+    if response is not None:
+        return response
     try:
         # Retrieve the cluster by ID
-        cluster = Cluster.objects.get(id=cluster_id)
-        user_id = request.user.id
+        cluster = Cluster.objects.select_related('user').get(id=cluster_id)
         # Check if user has access to this cluster
-        user_profile = UserProfile.objects.get(id=user_id)
-        if cluster.user != user_profile and cluster.user.organization != user_profile.organization:
+        if not get_principal(request).can_access(cluster):
             return Response({"error": "You don't have permission to view this cluster"}, status=403)
         
+        # The capacity cache may be ahead of the database
+        capacity = get_capacity_cache()
+        if capacity is not None:
+            capacity.overlay(cluster)
+
         serializer = ClusterStatusSerializer(cluster)  # Remove cluster= from here
-        return Response(serializer.data, status=200)  # Use Response instead of JsonResponse
+        return with_etag(Response(serializer.data, status=200), etag)  # Use Response instead of JsonResponse
         
     except Cluster.DoesNotExist:
         return Response({"error": "Cluster not found"}, status=404)
@@ -252,6 +317,50 @@ def cluster_status(request, cluster_id):
     except Exception as e:
         return Response({"error": str(e)}, status=500)
 
+
+def format_etag(scope, scope_id, version, variant=''):
+    return None if version is None else quote_etag(f'{scope}-{scope_id}-{version}{variant}')
+
+
+def resource_etag(scope, scope_id, variant=''):
+    """The ETag of a cluster's or deployment's current version, None until its first transition or without Redis.
+
+    ``variant`` tells apart representations of the same version, such as pages.
+    Versions are bumped whenever the scheduler or a stop changes a deployment,
+    so a matching ETag means the representation is unchanged.
+    """
+    return format_etag(scope, scope_id, get_version(scope, scope_id), variant)
+
+
+def request_variant(request):
+    """Tell apart the representations a listing serves for different query strings and hosts"""
+    return '-' + hashlib.sha1(request.build_absolute_uri().encode()).hexdigest()[:16]
+
+
+def not_modified(request, etag):
+    """A 304 if the client's If-None-Match holds ``etag``, None otherwise.
+
+    Checked before anything is read from the database, authorization
+    included. Versions only exist for resources that had a transition and
+    start from a random number, so only a client that was served the
+    resource holds a matching ETag, and a 304 tells it nothing new. ``*``
+    would match resources the client may not see, or that don't exist, so
+    it is ignored.
+    """
+    if etag is None:
+        return None
+    if etag not in parse_etags(request.headers.get('If-None-Match', '')):
+        return None
+    response = HttpResponseNotModified()
+    response['ETag'] = etag
+    return response
+
+
+def with_etag(response, etag):
+    if etag is not None:
+        response['ETag'] = etag
+    return response
+
 # Schedule Deployment
 @swagger_auto_schema(
     method='post',
@@ -267,11 +376,14 @@ def cluster_status(request, cluster_id):
                 }
             }
         ),
+        202: "Deployment accepted, scheduled by the scheduler worker",
         400: "Invalid data",
         403: "Permission denied",
-        404: "Cluster/Deployment not found"
+        404: "Cluster not found, or none of your clusters can fit the deployment",
+        502: "Scheduler unavailable"
     },
-    operation_description="Schedule a new deployment",
+    operation_description="Schedule a new deployment. Without a cluster, one of your own clusters, the ones "
+                          "you may name, is chosen automatically ('placement': 'best_fit' or 'worst_fit')",
     tags=['4. Deployment Management'],
     operation_id='4_1_deployment'
 )
@@ -282,74 +394,221 @@ def schedule_deployment(request):
     serializer = DeploymentSerializer(data=request.data)
 
     if serializer.is_valid():
-        # Extract user_id and cluster_id from the request data
-        user_id = request.user.id
+        # Extract cluster_id from the request data
         cluster_id = request.data.get('cluster')
-        cpu_required = request.data.get('cpu_required')
-        gpu_required = request.data.get('gpu_required')
-        ram_required = request.data.get('ram_required')
-
-        if not cluster_id:
-            return JsonResponse({"error": "cluster_id is required"}, status=400)
+        cpu_required = serializer.validated_data['cpu_required']
+        gpu_required = serializer.validated_data['gpu_required']
+        ram_required = serializer.validated_data['ram_required']
 
         # Check if the user and cluster exist
         try:
-            user = UserProfile.objects.get(id=user_id)
-            cluster = Cluster.objects.get(id=cluster_id)
-            if cluster.user.id != user_id:
-                return JsonResponse({
-                    "error": "You don't have permission to schedule deployments on this cluster"
-                }, status=403)
+            principal = get_principal(request)
+            user = principal.profile()
+            if cluster_id:
+                cluster = Cluster.objects.get(id=cluster_id)
+                if not principal.can_access(cluster, manage=True):
+                    return JsonResponse({
+                        "error": "You don't have permission to schedule deployments on this cluster"
+                    }, status=403)
+            else:
+                # No cluster given, place it on one of the user's own clusters
+                cluster = choose_cluster(
+                    candidate_clusters(user), cpu_required, gpu_required, ram_required,
+                    strategy=request.data.get('placement'),
+                )
+                if cluster is None:
+                    return JsonResponse({"error": "None of your clusters can fit this deployment"}, status=404)
+                cluster_id = cluster.id
 
         except UserProfile.DoesNotExist:
             return JsonResponse({"error": "User not found"}, status=404)
         except Cluster.DoesNotExist:
             return JsonResponse({"error": "Cluster not found"}, status=404)
+        except ValueError as e:
+            return JsonResponse({"error": str(e)}, status=400)
 
         # Save the deployment to the database
-        
-        cluster = Cluster.objects.get(id=cluster_id)
-        
-        if(cluster.total_cpu < cpu_required or cluster.total_gpu < gpu_required or cluster.total_ram < ram_required):
-            return JsonResponse({"error": "cannot make this deployment on given cluster. deployment requiements exceeds cluster specifications"}, status=404)
+        if exceeds_cluster(cluster, cpu_required, gpu_required, ram_required):
+            return exceeds_cluster_response()
         
         deployment = serializer.save(user=user, cluster=cluster)
-        
-        # Prepare data to send to the scheduling server
-        scheduling_data = {
-            "user_id": user_id,
-            "cpu": deployment.cpu_required,
-            "gpu": deployment.gpu_required,
-            "ram": deployment.ram_required,
-            "service_name": request.data.get('service_name'),
-            "docker_image": deployment.docker_image,
-            "priority": deployment.priority,
-            "deployment_id": deployment.id,
-            "cluster_id": cluster_id,
-            "is_scheduled": True
-        }
+        publish_transitions([(deployment.id, cluster_id, principal.organization_id, QUEUED)])
 
-        # Send data to the scheduling server
-        headers = {
-            "Content-Type": "application/json"
-        }
-        scheduling_server_url = "http://localhost:8000/scheduler/schedule/"
+        # Hand the deployment to the scheduler
         try:
-            response = requests.post(scheduling_server_url, json=scheduling_data, headers=headers)
-            if response.status_code == 200:
-                return JsonResponse({
-                    "message": "Deployment scheduled successfully",
-                    "deployment_id": deployment.id,
-                    "cluster_id": cluster_id
-                }, status=201)
-            else:
-                return JsonResponse({"error": "Failed to communicate with scheduling server"}, status=502)
-        except requests.exceptions.RequestException as e:
+            dispatcher = get_dispatcher()
+            dispatcher.schedule(deployment_payload(deployment, service_name=request.data.get('service_name')), cluster_id)
+        except SchedulingDispatchError as e:
             return JsonResponse({"error": str(e)}, status=502)
+        return scheduled_response(deployment, dispatcher)
 
     return JsonResponse(serializer.errors, status=400)
 
 
+def exceeds_cluster(cluster, cpu_required, gpu_required, ram_required):
+    """Whether a deployment needs more than the cluster has in total"""
+    return cluster.total_cpu < cpu_required or cluster.total_gpu < gpu_required or cluster.total_ram < ram_required
+
+
+def exceeds_cluster_response():
+    return JsonResponse({"error": EXCEEDS_CLUSTER_ERROR}, status=404)
+
+
+def scheduled_response(deployment, dispatcher):
+    if dispatcher.asynchronous:
+        # The scheduler worker picks it up, don't wait for the pass
+        return JsonResponse({
+            "message": "Deployment accepted for scheduling",
+            "deployment_id": deployment.id,
+            "cluster_id": deployment.cluster_id
+        }, status=202)
+    return JsonResponse({
+        "message": "Deployment scheduled successfully",
+        "deployment_id": deployment.id,
+        "cluster_id": deployment.cluster_id
+    }, status=201)
+
+
+
+# Schedule Deployments in bulk
+@swagger_auto_schema(
+    method='post',
+    request_body=openapi.Schema(
+        type=openapi.TYPE_OBJECT,
+        required=['deployments'],
+        properties={
+            'deployments': openapi.Schema(
+                type=openapi.TYPE_ARRAY,
+                items=openapi.Schema(type=openapi.TYPE_OBJECT, description="A deployment, as schedule_deployment takes it"),
+                description=f"Up to {BULK_DEPLOYMENT_LIMIT} deployments, with or without a cluster. "
+                            "Deployments without one are placed on your own clusters",
+            ),
+            'placement': openapi.Schema(type=openapi.TYPE_STRING, description="'best_fit' or 'worst_fit'"),
+        },
+    ),
+    responses={
+        201: openapi.Response(
+            description="Valid deployments scheduled, results in request order",
+            examples={
+                "application/json": {
+                    "created": 1,
+                    "failed": 1,
+                    "results": [
+                        {"deployment_id": "id", "cluster_id": "cluster_id"},
+                        {"errors": {"priority": ["\"urgent\" is not a valid choice."]}}
+                    ]
+                }
+            }
+        ),
+        202: "Valid deployments accepted, scheduled by the scheduler worker",
+        400: "Invalid request, or no valid deployment",
+        502: "Scheduler unavailable, the deployments were saved and their results carry the error"
+    },
+    operation_description="Schedule a batch of deployments across one or more clusters. Valid deployments are "
+                          "scheduled even when others are rejected; each gets a result, in request order",
+    tags=['4. Deployment Management'],
+    operation_id='4_1_bulk_deployments'
+)
+
+@api_view(['POST'])
+
+def schedule_deployments(request):
+    """Schedule a batch of deployments, answering for each one.
+
+    Clusters named by the batch are read in one query and the user's own
+    clusters, candidates for deployments without a cluster, in another. Valid
+    deployments are inserted with bulk_create, queued in one Redis round trip
+    and scheduled with one pass per cluster.
+    """
+    if not isinstance(request.data, dict):
+        return JsonResponse({"error": "Expected a JSON object"}, status=400)
+    items = request.data.get('deployments')
+    if not isinstance(items, list) or not items:
+        return JsonResponse({"error": "'deployments' must be a non-empty list"}, status=400)
+    if len(items) > BULK_DEPLOYMENT_LIMIT:
+        return JsonResponse({"error": f"At most {BULK_DEPLOYMENT_LIMIT} deployments can be scheduled at once"}, status=400)
+
+    try:
+        principal = get_principal(request)
+    except UserProfile.DoesNotExist:
+        return JsonResponse({"error": "User not found"}, status=404)
+
+    results = [None] * len(items)
+    valid = []
+    for index, item in enumerate(items):
+        serializer = BulkDeploymentSerializer(data=item)
+        if serializer.is_valid():
+            valid.append((index, dict(serializer.validated_data)))
+        else:
+            results[index] = {"errors": serializer.errors}
+
+    cluster_ids = {data['cluster'] for _, data in valid if data.get('cluster')}
+    clusters = Cluster.objects.in_bulk(cluster_ids) if cluster_ids else {}
+    unplaced = [(index, data) for index, data in valid if not data.get('cluster')]
+    placed = {}
+    if unplaced:
+        # No cluster given, place them on the user's own clusters
+        try:
+            placements = place_deployments(
+                candidate_clusters(principal.profile()),
+                [(data['cpu_required'], data['gpu_required'], data['ram_required']) for _, data in unplaced],
+                strategy=request.data.get('placement'),
+            )
+        except ValueError as e:
+            return JsonResponse({"error": str(e)}, status=400)
+        placed = {index: cluster for (index, _), cluster in zip(unplaced, placements)}
+
+    user = principal.profile()
+    deployments = []
+    for index, data in valid:
+        cluster_id = data.pop('cluster', None)
+        if cluster_id:
+            cluster = clusters.get(cluster_id)
+            if cluster is None:
+                results[index] = {"error": "Cluster not found"}
+                continue
+            if not principal.can_access(cluster, manage=True):
+                results[index] = {"error": "You don't have permission to schedule deployments on this cluster"}
+                continue
+        else:
+            cluster = placed[index]
+            if cluster is None:
+                results[index] = {"error": "None of your clusters can fit this deployment"}
+                continue
+        if exceeds_cluster(cluster, data['cpu_required'], data['gpu_required'], data['ram_required']):
+            results[index] = {"error": EXCEEDS_CLUSTER_ERROR}
+            continue
+        deployments.append((index, Deployment(**data, user=user, cluster=cluster)))
+
+    if not deployments:
+        return JsonResponse({"created": 0, "failed": len(items), "results": results}, status=400)
+
+    Deployment.objects.bulk_create([deployment for _, deployment in deployments])
+    publish_transitions([
+        (deployment.id, deployment.cluster_id, principal.organization_id, QUEUED) for _, deployment in deployments
+    ])
+    try:
+        dispatcher = get_dispatcher()
+        dispatcher.schedule_many([
+            (deployment_payload(deployment, service_name=items[index].get('service_name')), deployment.cluster_id)
+            for index, deployment in deployments
+        ])
+    except SchedulingDispatchError as e:
+        # The deployments are saved, tell the client which ones the scheduler may not have received
+        logger.warning("Failed to schedule %d deployments: %s", len(deployments), e)
+        error = {"error": str(e)}
+    else:
+        error = {}
+
+    for index, deployment in deployments:
+        results[index] = {"deployment_id": deployment.id, "cluster_id": deployment.cluster_id, **error}
+    return JsonResponse({
+        "created": len(deployments),
+        "failed": len(items) - len(deployments),
+        "results": results,
+        **error,
+    }, status=502 if error else 202 if dispatcher.asynchronous else 201)
+
 
 # Stop Deployment
 @swagger_auto_schema(
@@ -379,10 +638,10 @@ def stop_deployment(request, deployment_id):
     """Stop a deployment and restore cluster resources"""
     try:
         # Get deployment
-        deployment = get_object_or_404(Deployment, id=deployment_id)
+        deployment = get_object_or_404(Deployment.objects.select_related('cluster'), id=deployment_id)
         
-        user_id = request.user.id
-        if deployment.cluster.user.id != user_id:
+        principal = get_principal(request)
+        if not principal.can_access(deployment.cluster, manage=True):
             return JsonResponse({
                 "error": "You don't have permission to stop deployments on this cluster"
             }, status=403)
@@ -401,40 +660,20 @@ def stop_deployment(request, deployment_id):
 
         cluster_id = cluster.id  # Store cluster_id before nullifying the relationship
 
-        # Use transaction to ensure atomicity
-        # with transaction.atomic():
-            # Restore cluster resources
-        cluster.utilized_cpu -= deployment.cpu_required
-        cluster.utilized_gpu -= deployment.gpu_required
-        cluster.utilized_ram -= deployment.ram_required
-        
-        # Ensure we don't go below 0 for any resource
-        cluster.utilized_cpu = max(0, cluster.utilized_cpu)
-        cluster.utilized_gpu = max(0, cluster.utilized_gpu)
-        cluster.utilized_ram = max(0, cluster.utilized_ram)
-        
-        cluster.save()
+        if not release_deployment(deployment, principal.organization_id):
+            return JsonResponse({
+                "error": "Deployment is not running"
+            }, status=400)
+        publish_transitions([(deployment.id, cluster_id, principal.organization_id, STOPPED)])
 
-        # Update deployment status
-        deployment.status = 'stopped'
-        deployment.save()
-        headers = {
-            "Content-Type": "application/json"
-        }
         # Process queue for this cluster since resources were freed
-        scheduling_server_url = "http://localhost:8000/scheduler/schedule/"
-        requests.post(scheduling_server_url, json={"cluster_id": cluster_id, "is_scheduled": False}, headers=headers)
+        try:
+            get_dispatcher().process(cluster_id)
+        except SchedulingDispatchError as e:
+            # The deployment is already stopped, the next pass will pick up the freed resources
+            logger.warning("Failed to trigger scheduling for cluster %s: %s", cluster_id, e)
 
-        return JsonResponse({
-            "message": "Deployment stopped successfully",
-            "deployment_id": deployment_id,
-            "cluster_status": {
-                "name": cluster.name,
-                "utilized_cpu": cluster.utilized_cpu,
-                "utilized_gpu": cluster.utilized_gpu,
-                "utilized_ram": cluster.utilized_ram
-            }
-        }, status=200)
+        return stopped_response(deployment_id, cluster)
 
     except Deployment.DoesNotExist:
         return JsonResponse({
@@ -445,14 +684,63 @@ def stop_deployment(request, deployment_id):
             "error": str(e)
         }, status=500)
 
+def release_deployment(deployment, organization_id=None):
+    """Stop a running deployment and give its resources back to its cluster.
+
+    Refreshes ``deployment.cluster`` with the new utilization. Returns False
+    if the deployment was no longer running. ``organization_id`` is the
+    cluster owner's, whose cached listings show the utilization.
+    """
+    cluster = deployment.cluster
+    capacity = get_capacity_cache()
+
+    # Use transaction to ensure atomicity
+    with transaction.atomic():
+        # Only the request that moves the deployment out of running restores
+        # its resources, so concurrent stops cannot release them twice
+        if not Deployment.objects.filter(id=deployment.id, status='running').update(status='stopped'):
+            return False
+        if capacity is None:
+            release(cluster.id, deployment.cpu_required, deployment.gpu_required, deployment.ram_required)
+    cluster.refresh_from_db()
+
+    if capacity is not None:
+        # The cache is written back to the database by the scheduler worker.
+        # A cluster not cached yet is still tracked in the database.
+        if not capacity.release(cluster.id, deployment.cpu_required, deployment.gpu_required, deployment.ram_required):
+            release(cluster.id, deployment.cpu_required, deployment.gpu_required, deployment.ram_required)
+        capacity.overlay(cluster)
+    else:
+        # Keep the scheduler's server-side capacity in step with the database
+        engine = get_engine()
+        if engine is not None:
+            engine.release(cluster.id, deployment.cpu_required, deployment.gpu_required, deployment.ram_required)
+    invalidate_listings([organization_id], UTILIZATION)
+    return True
+
+
+def stopped_response(deployment_id, cluster):
+    return JsonResponse({
+        "message": "Deployment stopped successfully",
+        "deployment_id": deployment_id,
+        "cluster_status": {
+            "name": cluster.name,
+            "utilized_cpu": cluster.utilized_cpu,
+            "utilized_gpu": cluster.utilized_gpu,
+            "utilized_ram": cluster.utilized_ram
+        }
+    }, status=200)
+
 # User Clusters
 @swagger_auto_schema(
     method='get',
+    manual_parameters=PAGINATION_PARAMETERS,
     responses={
-        200: ClusterSerializer(many=True),
+        200: ClusterStatusSerializer(many=True),
+        400: "Invalid cursor",
         500: "Server error"
     },
-    operation_description="Get all clusters belonging to the authenticated user",
+    operation_description="Get the clusters belonging to the authenticated user, newest first, one page at a time",
     tags=['3. Cluster Management'],
     operation_id='3_3_user_clusters'
 )
@@ -460,13 +748,18 @@ def stop_deployment(request, deployment_id):
 @api_view(['GET'])
 
 def user_clusters(request):
-    """Fetch all clusters belonging to the authenticated user"""
+    """Fetch the clusters belonging to the authenticated user"""
     try:
-        user_id = request.user.id
-        user = UserProfile.objects.get(id=user_id)
-        clusters = Cluster.objects.filter(user=user)
-        serializer = ClusterStatusSerializer(clusters, many=True)
-        return Response(serializer.data)
+        principal = get_principal(request)
+        clusters = Cluster.objects.filter(user_id=principal.user_id).select_related('user')
+        # The capacity cache may be ahead of the database
+        capacity = get_capacity_cache()
+        # Utilization is listed too, so scheduling and stopping invalidate it
+        return cached_listing(
+            request, 'user_clusters', principal.user_id, principal.organization_id, (CLUSTERS, UTILIZATION),
+            lambda: paginated_response(request, clusters, ClusterStatusSerializer,
+                                       prepare=capacity.overlay_many if capacity is not None else None),
+        )
     except Exception as e:
         return Response({"error": str(e)}, status=500)
 
@@ -476,12 +769,13 @@ def user_clusters(request):
 # Organization Clusters
 @swagger_auto_schema(
     method='get',
+    manual_parameters=PAGINATION_PARAMETERS,
     responses={
         200: ClusterSerializer(many=True),
-        400: "User not in organization",
+        400: "User not in organization or invalid cursor",
         404: "User profile not found"
     },
-    operation_description="Get all clusters in the user's organization",
+    operation_description="Get the clusters in the user's organization, newest first, one page at a time",
     tags=['3. Cluster Management'],
     operation_id='3_5__org_clusters'
 )
@@ -489,21 +783,18 @@ def user_clusters(request):
 @api_view(['GET'])
 
 def organization_clusters(request):
-    """Fetch all clusters in the user's organization"""
+    """Fetch the clusters in the user's organization"""
     try:
-        user_id = request.user.id
-        user_profile = UserProfile.objects.get(id=user_id)
-        organization = user_profile.organization
-        if not organization:
+        principal = get_principal(request)
+        if not principal.organization_id:
             return Response({"error": "User is not associated with any organization"}, status=400)
             
-        # Get all users in the organization
-        org_users = UserProfile.objects.filter(organization=organization)
-        # Get all clusters belonging to these users
-        clusters = Cluster.objects.filter(user__in=org_users)
-        
-        serializer = ClusterSerializer(clusters, many=True)
-        return Response(serializer.data)
+        # Clusters of every user in the organization
+        clusters = Cluster.objects.filter(user__organization_id=principal.organization_id)
+        return cached_listing(
+            request, 'organization_clusters', principal.organization_id, principal.organization_id, (CLUSTERS,),
+            lambda: paginated_response(request, clusters, ClusterSerializer),
+        )
     except UserProfile.DoesNotExist:
         return Response({"error": "User profile not found"}, status=404)
     except Exception as e:
@@ -514,6 +805,7 @@ def organization_clusters(request):
     method='get',
     responses={
         200: DeploymentSerializer,
+        304: "Unchanged since the ETag in If-None-Match",
         403: "Permission denied",
         404: "Deployment not found"
     },
@@ -526,17 +818,18 @@ def organization_clusters(request):
 
 def get_deployment(request, deployment_id):
     """Fetch a specific deployment by ID"""
+    etag = resource_etag('deployment', deployment_id)
+    response = not_modified(request, etag)
+    if response is not None:
+        return response
     try:
-        
-        deployment = get_object_or_404(Deployment, id=deployment_id)
+        deployment = get_object_or_404(Deployment.objects.select_related('cluster__user'), id=deployment_id)
         # Check if user has access to this deployment
-        user_id = request.user.id
-        user_profile = UserProfile.objects.get(id=user_id)
-        if deployment.user != user_profile and deployment.cluster.user.organization != user_profile.organization:
+        if not can_view_deployment(get_principal(request), deployment):
             return Response({"error": "You don't have permission to view this deployment"}, status=403)
             
         serializer = DeploymentSerializer(deployment)
-        return Response(serializer.data)
+        return with_etag(Response(serializer.data), etag)
     except Deployment.DoesNotExist:
         return Response({"error": "Deployment not found"}, status=404)
     except Exception as e:
@@ -545,12 +838,20 @@ def get_deployment(request, deployment_id):
 
 @swagger_auto_schema(
     method='get',
+    manual_parameters=PAGINATION_PARAMETERS + [
+        openapi.Parameter('status', openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                          enum=[choice for choice, _ in Deployment.STATUS_CHOICES]),
+        openapi.Parameter('priority', openapi.IN_QUERY, type=openapi.TYPE_STRING, enum=['high', 'low']),
+    ],
     responses={
         200: DeploymentSerializer(many=True),
+        304: "Unchanged since the ETag in If-None-Match",
+        400: "Invalid filter or cursor",
         403: "Permission denied",
         404: "Cluster not found"
     },
-    operation_description="Get all deployments in a specific cluster",
+    operation_description="Get the deployments in a specific cluster, newest first, one page at a time. "
+                          "Filter with 'status' and 'priority'",
     tags=['4. Deployment Management'],
     operation_id='4_4_fetch_cluster_deployments'
 )
@@ -558,19 +859,158 @@ def get_deployment(request, deployment_id):
 @api_view(['GET'])
 
 def cluster_deployments(request, cluster_id):
-    """Fetch all deployments in a specific cluster"""
+    """Fetch the deployments in a specific cluster"""
+    # Every change to one of the cluster's deployments bumps its version
+    etag = resource_etag('cluster', cluster_id, request_variant(request))
+    response = not_modified(request, etag)
+    if response is not None:
+        return response
     try:
-        cluster = get_object_or_404(Cluster, id=cluster_id)
+        cluster = get_object_or_404(Cluster.objects.select_related('user'), id=cluster_id)
         # Check if user has access to this cluster
-        user_id = request.user.id
-        user_profile = UserProfile.objects.get(id=user_id)
-        if cluster.user != user_profile and cluster.user.organization != user_profile.organization:
+        if not get_principal(request).can_access(cluster):
             return Response({"error": "You don't have permission to view deployments in this cluster"}, status=403)
             
         deployments = Deployment.objects.filter(cluster=cluster)
-        serializer = DeploymentSerializer(deployments, many=True)
-        return Response(serializer.data)
+        for field in ('status', 'priority'):
+            value = request.query_params.get(field)
+            if value is None:
+                continue
+            if value not in dict(Deployment._meta.get_field(field).choices):
+                return Response({"error": f"Invalid {field} '{value}'"}, status=400)
+            deployments = deployments.filter(**{field: value})
+        response = paginated_response(request, deployments, DeploymentSerializer)
+        return with_etag(response, etag) if response.status_code == 200 else response
     except Cluster.DoesNotExist:
         return Response({"error": "Cluster not found"}, status=404)
     except Exception as e:
-        return Response({"error": str(e)}, status=500)
\ No newline at end of file
+        return Response({"error": str(e)}, status=500)
+
+
+STATUS_STREAM_PARAMETERS = [
+    openapi.Parameter('Last-Event-ID', openapi.IN_HEADER, type=openapi.TYPE_STRING,
+                      description="Id of the last event received, the stream resumes after it"),
+    openapi.Parameter('last_event_id', openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                      description="Same as the Last-Event-ID header, for clients that cannot set headers"),
+]
+
+
+def last_event_id(request):
+    """The event a status stream resumes after, from the Last-Event-ID header EventSource sends on reconnect.
+
+    Returns None for a new stream and raises ValueError for a malformed id.
+    """
+    value = request.headers.get('Last-Event-ID') or request.GET.get('last_event_id')
+    if value and not is_event_id(value):
+        raise ValueError(f"Invalid Last-Event-ID '{value}'")
+    return value or None
+
+
+def status_stream_response(events):
+    response = StreamingHttpResponse(events, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Proxies such as nginx would hold events back until their buffer fills
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def stream_status(scope, scope_id, request):
+    """Stream the transitions of a deployment, cluster or organization as Server-Sent Events"""
+    try:
+        after = last_event_id(request)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    return status_stream_response(event_stream(
+        scope, scope_id, after,
+        heartbeat=settings.STATUS_STREAM_HEARTBEAT, duration=settings.STATUS_STREAM_DURATION,
+    ))
+
+
+def can_view_deployment(principal, deployment):
+    """Whether the principal made the deployment or may see its cluster"""
+    return deployment.user_id == principal.user_id or principal.can_access(deployment.cluster)
+
+
+# Deployment status stream
+@swagger_auto_schema(
+    method='get',
+    manual_parameters=STATUS_STREAM_PARAMETERS,
+    responses={
+        200: "text/event-stream of 'status' events: deployment_id, cluster_id, organization_id, status and at",
+        400: "Invalid Last-Event-ID",
+        403: "Permission denied",
+        404: "Deployment not found"
+    },
+    operation_description="Stream a deployment's status transitions (queued, running, preempted, stopped) "
+                          "as Server-Sent Events, instead of polling the deployment",
+    tags=['4. Deployment Management'],
+    operation_id='4_5_deployment_events'
+)
+
+@api_view(['GET'])
+@renderer_classes([JSONRenderer, EventStreamRenderer])
+
+def deployment_events(request, deployment_id):
+    try:
+        deployment = Deployment.objects.select_related('cluster__user').get(id=deployment_id)
+    except Deployment.DoesNotExist:
+        return JsonResponse({"error": "Deployment not found"}, status=404)
+    if not can_view_deployment(get_principal(request), deployment):
+        return JsonResponse({"error": "You don't have permission to view this deployment"}, status=403)
+    return stream_status('deployment', deployment.id, request)
+
+
+# Cluster status stream
+@swagger_auto_schema(
+    method='get',
+    manual_parameters=STATUS_STREAM_PARAMETERS,
+    responses={
+        200: "text/event-stream of the status transitions of the cluster's deployments",
+        400: "Invalid Last-Event-ID",
+        403: "Permission denied",
+        404: "Cluster not found"
+    },
+    operation_description="Stream the status transitions of every deployment in a cluster as Server-Sent Events",
+    tags=['4. Deployment Management'],
+    operation_id='4_6_cluster_events'
+)
+
+@api_view(['GET'])
+@renderer_classes([JSONRenderer, EventStreamRenderer])
+
+def cluster_events(request, cluster_id):
+    try:
+        cluster = Cluster.objects.select_related('user').get(id=cluster_id)
+    except Cluster.DoesNotExist:
+        return JsonResponse({"error": "Cluster not found"}, status=404)
+    if not get_principal(request).can_access(cluster):
+        return JsonResponse({"error": "You don't have permission to view this cluster"}, status=403)
+    return stream_status('cluster', cluster.id, request)
+
+
+# Organization status stream
+@swagger_auto_schema(
+    method='get',
+    manual_parameters=STATUS_STREAM_PARAMETERS,
+    responses={
+        200: "text/event-stream of the status transitions of the organization's deployments",
+        400: "User not in organization or invalid Last-Event-ID",
+        404: "User profile not found"
+    },
+    operation_description="Stream the status transitions of every deployment in the user's organization "
+                          "as Server-Sent Events",
+    tags=['4. Deployment Management'],
+    operation_id='4_7_organization_events'
+)
+
+@api_view(['GET'])
+@renderer_classes([JSONRenderer, EventStreamRenderer])
+
+def organization_events(request):
+    try:
+        principal = get_principal(request)
+    except UserProfile.DoesNotExist:
+        return JsonResponse({"error": "User profile not found"}, status=404)
+    if not principal.organization_id:
+        return JsonResponse({"error": "User is not associated with any organization"}, status=400)
+    return stream_status('organization', principal.organization_id, request)
@@ -41,6 +41,7 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
     'rest_framework',
     'api',
+    'scheduler',
     'rest_framework_simplejwt',
     'drf_yasg'
 ]
@@ -53,6 +54,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'scheduler.metrics.RequestMetricsMiddleware',
 ]
 
 ROOT_URLCONF = 'mlops_platform.urls'
@@ -74,6 +76,10 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'mlops_platform.wsgi.application'
+ASGI_APPLICATION = 'mlops_platform.asgi.application'
+# Route cluster status, scheduling, stopping, queue status and status streams to async views.
+# Only worth it under an ASGI server, under WSGI each async view runs in its own event loop.
+ASYNC_VIEWS = False
 
 
 # Database
@@ -130,7 +136,7 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'api.auth.PrincipalJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
@@ -177,3 +183,53 @@ CACHES = {
         }
     }
 }
+# Seconds a user's profile, organization and role are cached for authorization, 0 to disable
+PRINCIPAL_CACHE_TTL = 60
+# Seconds unused cluster listing responses stay cached, 0 to disable. Entries are invalidated
+# when clusters are created and deployments start or stop, this only reclaims stale ones.
+RESPONSE_CACHE_TTL = 3600
+
+# Redis holding the scheduler's queues, events and capacity, connected on first use.
+# Also accepts MAX_CONNECTIONS, STREAM_MAX_CONNECTIONS (status streams' own pool),
+# SOCKET_TIMEOUT, HEALTH_CHECK_INTERVAL and RETRIES.
+SCHEDULER_REDIS = {
+    'URL': 'redis://localhost:6379/0',
+}
+
+# Scheduler dispatch
+# Use 'scheduler.dispatch.HttpDispatcher' when the scheduler runs as a separate service,
+# or 'scheduler.dispatch.EventDispatcher' to leave scheduling to `manage.py run_scheduler`
+SCHEDULER_DISPATCHER = 'scheduler.dispatch.InProcessDispatcher'
+SCHEDULER_URL = 'http://localhost:8000/scheduler/schedule/'
+SCHEDULER_TIMEOUT = 10  # seconds
+# 'orm' runs the scheduling pass in Python, 'lua' runs it atomically inside Redis
+SCHEDULER_ENGINE = 'orm'
+# Resolution of the queued deployment capacity index (cores, GPUs, GB of RAM)
+SCHEDULER_BUCKET_STEPS = {'cpu': 1, 'gpu': 1, 'ram': 4}
+# Number of clusters `manage.py run_scheduler` schedules at the same time
+SCHEDULER_WORKER_CONCURRENCY = 4
+# Seconds a scheduler worker's cluster leases last without renewal
+SCHEDULER_LEASE_TTL = 10.0
+# How deployments without a cluster are placed: 'best_fit' or 'worst_fit'
+SCHEDULER_PLACEMENT_STRATEGY = 'best_fit'
+# Aging: queued deployments gain RATE priority points per minute of waiting, at most MAX_BOOST
+# ('high' is 10 points above 'low'). BACKFILL lets lower priorities use capacity no waiting
+# high priority deployment fits in.
+SCHEDULER_AGING = {
+    'RATE': 0.0,
+    'MAX_BOOST': None,
+    'BACKFILL': False,
+}
+# Stop and re-queue running low priority deployments when a high priority one does not fit
+SCHEDULER_PREEMPTION = False
+# Keep cluster capacity in Redis and write utilization back to the database in batches
+SCHEDULER_CAPACITY_CACHE = False
+SCHEDULER_CAPACITY_FLUSH_INTERVAL = 1.0  # seconds between write-behind flushes, by run_scheduler or after in-process passes
+# Metrics served at /scheduler/metrics/, buffered in memory and pushed to Redis at most this often
+METRICS_ENABLED = True
+METRICS_FLUSH_INTERVAL = 5.0  # seconds
+# Status streams (/api/.../events/) send a keep-alive after this many idle seconds, keep it
+# below SCHEDULER_REDIS's SOCKET_TIMEOUT, and end after STATUS_STREAM_DURATION seconds,
+# when EventSource reconnects and resumes from the last event it received
+STATUS_STREAM_HEARTBEAT = 3.0
+STATUS_STREAM_DURATION = 300
@@ -0,0 +1,34 @@
+from django.db.models import F, FloatField, Value
+from django.db.models.functions import Greatest
+from api.models import Cluster
+
+RESOURCES = ('cpu', 'gpu', 'ram')
+
+
+class CapacityConflict(Exception):
+    """The cluster or its deployments changed between planning and committing a pass"""
+
+
+def reserve(cluster_id, cpu, gpu, ram):
+    """Add to a cluster's utilization in one conditional UPDATE.
+
+    The row only changes if every resource stays within the cluster's totals,
+    so concurrent reservations can never over-commit it. Returns True if the
+    resources were reserved.
+    """
+    demand = {'cpu': cpu, 'gpu': gpu, 'ram': ram}
+    fits = {f'total_{resource}__gte': F(f'utilized_{resource}') + demand[resource] for resource in RESOURCES}
+    changes = {f'utilized_{resource}': F(f'utilized_{resource}') + demand[resource] for resource in RESOURCES}
+    return Cluster.objects.filter(id=cluster_id, **fits).update(**changes) == 1
+
+
+def release(cluster_id, cpu, gpu, ram):
+    """Give resources back to a cluster in one UPDATE, never going below zero"""
+    demand = {'cpu': cpu, 'gpu': gpu, 'ram': ram}
+    changes = {
+        f'utilized_{resource}': Greatest(
+            F(f'utilized_{resource}') - demand[resource], Value(0.0), output_field=FloatField()
+        )
+        for resource in RESOURCES
+    }
+    return Cluster.objects.filter(id=cluster_id).update(**changes) == 1
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class SchedulerConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "scheduler"
+
+    def ready(self):
+        # Connect the receiver keeping cached cluster totals in step with the database
+        from . import capacity  # noqa: F401
@@ -0,0 +1,43 @@
+"""Async versions of the queue status views, routed instead of the DRF ones when ASYNC_VIEWS is on"""
+from django.core.paginator import InvalidPage
+from django.http import JsonResponse
+from api.async_views import async_api_view
+from api.models import Cluster
+from .queue_handler import queue_instance
+from .views import cluster_paginator, queue_status_payload
+
+queue = queue_instance
+
+
+@async_api_view(['GET'], authenticated=False)
+async def queue_status(request):
+    """Get queue status for all clusters, optionally for one organization"""
+    try:
+        try:
+            paginator = cluster_paginator(request.GET)
+            # Counted with the async ORM up front, Paginator would count synchronously
+            paginator.count = await paginator.object_list.acount()
+            page = paginator.page(request.GET.get('page', 1))
+        except (ValueError, InvalidPage) as e:
+            return JsonResponse({"error": str(e)}, status=400)
+
+        clusters = [cluster async for cluster in page.object_list]
+        queues = await queue.aget_queue_status([cluster['id'] for cluster in clusters])
+        return JsonResponse(queue_status_payload(page, clusters, queues))
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
+
+
+@async_api_view(['GET'], authenticated=False)
+async def cluster_queue_status(request, cluster_id):
+    """Get queue status for specific cluster"""
+    try:
+        cluster = await Cluster.objects.only('name').aget(id=cluster_id)
+        return JsonResponse({
+            "cluster_name": cluster.name,
+            "queues": await queue.aget_queue_length(cluster_id)
+        })
+    except Cluster.DoesNotExist:
+        return JsonResponse({"error": "Cluster not found"}, status=404)
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
@@ -0,0 +1,253 @@
+import logging
+from django.conf import settings
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from redis.exceptions import NoScriptError
+from api.models import Cluster
+from .queue_handler import cluster_key, get_redis_client
+
+logger = logging.getLogger(__name__)
+
+RESOURCES = ('cpu', 'gpu', 'ram')
+
+# Clusters whose cached capacity changed since the last write-behind flush.
+# It sits in a Redis Cluster slot of its own, so the scripts below never touch
+# it, callers mark clusters in the same round trip instead.
+DIRTY_KEY = 'cluster_capacity_dirty'
+
+# Each cluster's hash holds its free resources as 'cpu', 'gpu' and 'ram' (the
+# fields the Lua engine works on) and its totals as 'total_cpu' and so on.
+
+# Take resources if every one of them is free. KEYS[1] is the capacity hash
+# and ARGV[1..3] the demand.
+# Returns 1 if reserved, 0 if it does not fit and -1 if the hash is not seeded.
+RESERVE_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return -1
+end
+local free = redis.call('HMGET', KEYS[1], 'cpu', 'gpu', 'ram')
+for i = 1, 3 do
+    if tonumber(free[i]) < tonumber(ARGV[i]) then
+        return 0
+    end
+end
+redis.call('HINCRBYFLOAT', KEYS[1], 'cpu', -tonumber(ARGV[1]))
+redis.call('HINCRBYFLOAT', KEYS[1], 'gpu', -tonumber(ARGV[2]))
+redis.call('HINCRBYFLOAT', KEYS[1], 'ram', -tonumber(ARGV[3]))
+return 1
+"""
+
+# Return resources, never above the cluster's totals. An unseeded hash is left
+# alone, it is read from the database on next use.
+RELEASE_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+local fields = {'cpu', 'gpu', 'ram'}
+for i = 1, 3 do
+    local free = tonumber(redis.call('HINCRBYFLOAT', KEYS[1], fields[i], ARGV[i]))
+    local total = tonumber(redis.call('HGET', KEYS[1], 'total_' .. fields[i]))
+    if total and free > total then
+        redis.call('HSET', KEYS[1], fields[i], total)
+    end
+end
+return 1
+"""
+
+# Replace a cached cluster's totals with ARGV[1..3], moving its free resources
+# by as much so its utilization stays. A hash that is not seeded is left alone.
+TOTALS_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+local fields = {'cpu', 'gpu', 'ram'}
+for i = 1, 3 do
+    local total = tonumber(redis.call('HGET', KEYS[1], 'total_' .. fields[i]))
+    if total then
+        redis.call('HINCRBYFLOAT', KEYS[1], fields[i], tonumber(ARGV[i]) - total)
+    end
+    redis.call('HSET', KEYS[1], 'total_' .. fields[i], ARGV[i])
+end
+return 1
+"""
+
+
+class CapacityCache:
+    """Free and total resources of each cluster, kept in Redis.
+
+    Reservations and releases are atomic in Redis, so the scheduler does not
+    touch the cluster row while deciding what fits. The cached utilization is
+    the source of truth: ``flush()`` writes it back to ``Cluster.utilized_*``
+    in batches, for the clusters that changed since the last flush.
+
+    Without ``write_behind`` the database stays the source of truth and
+    changes are not marked for flushing, as for the Lua engine on its own.
+    """
+
+    def __init__(self, redis_client, write_behind=True):
+        self.redis_client = redis_client
+        self.write_behind = write_behind
+        self._reserve = redis_client.register_script(RESERVE_SCRIPT)
+        self._release = redis_client.register_script(RELEASE_SCRIPT)
+        self._set_totals = redis_client.register_script(TOTALS_SCRIPT)
+
+    def get_capacity_key(self, cluster_id):
+        """Generate the hash key holding a cluster's free resources"""
+        return cluster_key(cluster_id, 'capacity')
+
+    def seed(self, clusters):
+        """Copy clusters from the database, leaving the ones already cached alone"""
+        pipe = self.redis_client.pipeline(transaction=False)
+        for cluster in clusters:
+            capacity_key = self.get_capacity_key(cluster.id)
+            for resource in RESOURCES:
+                total = getattr(cluster, f'total_{resource}')
+                pipe.hsetnx(capacity_key, resource, total - getattr(cluster, f'utilized_{resource}'))
+                pipe.hsetnx(capacity_key, f'total_{resource}', total)
+        pipe.execute()
+
+    def set_totals(self, cluster):
+        """Take a cluster's totals from the database, keeping its cached utilization"""
+        return self._set_totals(keys=[self.get_capacity_key(cluster.id)],
+                                args=[getattr(cluster, f'total_{resource}') for resource in RESOURCES])
+
+    def rebuild(self):
+        """Seed every cluster that is missing from the cache, e.g. after Redis restarted"""
+        self.seed(Cluster.objects.only('id', 'total_cpu', 'total_gpu', 'total_ram',
+                                       'utilized_cpu', 'utilized_gpu', 'utilized_ram').iterator())
+
+    def get_cluster(self, cluster_id):
+        """Return an unsaved Cluster carrying the cached totals and utilization.
+
+        Seeds the cluster from the database on a miss. Returns None if the
+        cluster does not exist.
+        """
+        fields = list(RESOURCES) + [f'total_{resource}' for resource in RESOURCES]
+        values = self.redis_client.hmget(self.get_capacity_key(cluster_id), fields)
+        if None in values:
+            try:
+                cluster = Cluster.objects.get(id=cluster_id)
+            except Cluster.DoesNotExist:
+                return None
+            self.seed([cluster])
+            values = self.redis_client.hmget(self.get_capacity_key(cluster_id), fields)
+        free, total = values[:3], values[3:]
+        cluster = Cluster(id=cluster_id)
+        for resource, free_amount, total_amount in zip(RESOURCES, free, total):
+            setattr(cluster, f'total_{resource}', float(total_amount))
+            setattr(cluster, f'utilized_{resource}', float(total_amount) - float(free_amount))
+        return cluster
+
+    def overlay(self, cluster):
+        """Replace a Cluster's utilization with the cached one, which may be ahead of the database"""
+        cached = self.get_cluster(cluster.id)
+        if cached is not None:
+            for resource in RESOURCES:
+                setattr(cluster, f'utilized_{resource}', getattr(cached, f'utilized_{resource}'))
+        return cluster
+
+    def overlay_many(self, clusters):
+        """``overlay`` a page of Clusters in one round trip, leaving the ones not cached yet as loaded"""
+        fields = list(RESOURCES) + [f'total_{resource}' for resource in RESOURCES]
+        pipe = self.redis_client.pipeline(transaction=False)
+        for cluster in clusters:
+            pipe.hmget(self.get_capacity_key(cluster.id), fields)
+        for cluster, values in zip(clusters, pipe.execute()):
+            if None not in values:
+                for resource, free_amount, total_amount in zip(RESOURCES, values[:3], values[3:]):
+                    setattr(cluster, f'utilized_{resource}', float(total_amount) - float(free_amount))
+        return clusters
+
+    async def aoverlay(self, cluster, redis_client):
+        """Async counterpart of ``overlay`` on an asyncio Redis client.
+
+        A cluster that is not cached yet is left as loaded, its utilization is
+        still tracked in the database.
+        """
+        fields = list(RESOURCES) + [f'total_{resource}' for resource in RESOURCES]
+        values = await redis_client.hmget(self.get_capacity_key(cluster.id), fields)
+        if None not in values:
+            for resource, free_amount, total_amount in zip(RESOURCES, values[:3], values[3:]):
+                setattr(cluster, f'utilized_{resource}', float(total_amount) - float(free_amount))
+        return cluster
+
+    def _run(self, script, cluster_id, args):
+        """Run a capacity script, marking the cluster dirty in the same round trip when flushed"""
+        keys = [self.get_capacity_key(cluster_id)]
+        if not self.write_behind:
+            return script(keys=keys, args=args)
+        pipe = self.redis_client.pipeline(transaction=False)
+        pipe.evalsha(script.sha, len(keys), *keys, *args)
+        pipe.sadd(DIRTY_KEY, cluster_id)
+        try:
+            return pipe.execute()[0]
+        except NoScriptError:
+            # Redis lost its script cache, the dirty mark is in already
+            return script(keys=keys, args=args)
+
+    def reserve(self, cluster_id, cpu, gpu, ram):
+        """Take resources only if all of them are free, returns True if reserved"""
+        reserved = self._run(self._reserve, cluster_id, [cpu, gpu, ram])
+        if reserved == -1:
+            cluster = Cluster.objects.filter(id=cluster_id).first()
+            if cluster is None:
+                return False
+            self.seed([cluster])
+            reserved = self._run(self._reserve, cluster_id, [cpu, gpu, ram])
+        return reserved == 1
+
+    def release(self, cluster_id, cpu, gpu, ram):
+        """Give resources back to the cluster, returns False if it is not cached"""
+        return self._run(self._release, cluster_id, [cpu, gpu, ram])
+
+    def flush(self):
+        """Write the cached utilization of changed clusters to the database, returns how many"""
+        pipe = self.redis_client.pipeline()
+        pipe.smembers(DIRTY_KEY)
+        pipe.delete(DIRTY_KEY)
+        cluster_ids = sorted(int(cluster_id) for cluster_id in pipe.execute()[0])
+        if not cluster_ids:
+            return 0
+        try:
+            return self._write(cluster_ids)
+        except Exception:
+            # Keep them dirty so the next flush tries again
+            self.redis_client.sadd(DIRTY_KEY, *cluster_ids)
+            raise
+
+    def _write(self, cluster_ids):
+        # A change made after this read marks the cluster dirty again for the next flush
+        pipe = self.redis_client.pipeline(transaction=False)
+        for cluster_id in cluster_ids:
+            pipe.hmget(self.get_capacity_key(cluster_id), list(RESOURCES) + [f'total_{resource}' for resource in RESOURCES])
+        clusters = []
+        for cluster_id, values in zip(cluster_ids, pipe.execute()):
+            if None in values:
+                continue
+            cluster = Cluster(id=cluster_id)
+            for resource, free, total in zip(RESOURCES, values[:3], values[3:]):
+                setattr(cluster, f'utilized_{resource}', float(total) - float(free))
+            clusters.append(cluster)
+        Cluster.objects.bulk_update(clusters, ['utilized_cpu', 'utilized_gpu', 'utilized_ram'])
+        return len(clusters)
+
+
+def get_capacity_cache(queue=None):
+    """Return the capacity cache if SCHEDULER_CAPACITY_CACHE is enabled, otherwise None"""
+    if not getattr(settings, 'SCHEDULER_CAPACITY_CACHE', False):
+        return None
+    if queue is None:
+        from .queue_handler import queue_instance
+        queue = queue_instance
+    return CapacityCache(queue.redis_client)
+
+
+@receiver(post_save, sender=Cluster)
+def cluster_saved(sender, instance, update_fields=None, **kwargs):
+    # seed() leaves cached clusters alone, so edited totals are pushed here
+    if update_fields is not None and not {f'total_{resource}' for resource in RESOURCES} & set(update_fields):
+        return
+    try:
+        CapacityCache(get_redis_client()).set_totals(instance)
+    except Exception as e:
+        logger.warning("Failed to update the cached totals of cluster %s: %s", instance.id, e)
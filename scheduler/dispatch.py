@@ -0,0 +1,209 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+import logging
+import time
+import redis
+import requests
+from .events import apublish_event, publish_event, DEPLOYMENT_SUBMITTED, CAPACITY_FREED
+from .queue_handler import queue_instance, reset_redis_client
+
+logger = logging.getLogger(__name__)
+
+
+class SchedulingDispatchError(Exception):
+    """Raised when scheduling work could not be handed to the scheduler"""
+
+
+class InProcessDispatcher:
+    """Run the scheduler inside the current process, without any HTTP hop.
+
+    Every dispatcher has async counterparts ``aschedule`` and ``aprocess`` for
+    the async views. Here the scheduling pass is synchronous ORM work, so they
+    run it on the thread the async views share for database access.
+
+    With the capacity cache enabled, passes also write the cached utilization
+    back to the database every SCHEDULER_CAPACITY_FLUSH_INTERVAL seconds, as
+    `run_scheduler` does, since no worker may be running to do it.
+    """
+
+    # Whether scheduling happens after the call returns
+    asynchronous = False
+
+    def __init__(self):
+        self._scheduler = None
+        self._flushed_at = 0.0
+
+    @property
+    def scheduler(self):
+        # Built on first use so importing the dispatcher stays cheap
+        if self._scheduler is None:
+            from .scheduler import DeploymentScheduler
+            self._scheduler = DeploymentScheduler()
+        return self._scheduler
+
+    def schedule(self, deployment_data, cluster_id):
+        """Queue a deployment on a cluster and run a scheduling pass"""
+        try:
+            self.scheduler.queue.enqueue_deployment(deployment_data, cluster_id)
+            self.scheduler.process_cluster_queue(cluster_id)
+        except redis.RedisError as e:
+            raise SchedulingDispatchError(str(e)) from e
+        self.write_behind()
+
+    def process(self, cluster_id):
+        """Run a scheduling pass for a cluster, e.g. after resources were freed"""
+        try:
+            self.scheduler.process_cluster_queue(cluster_id)
+        except redis.RedisError as e:
+            raise SchedulingDispatchError(str(e)) from e
+        self.write_behind()
+
+    def schedule_many(self, deployments):
+        """Queue (deployment data, cluster id) pairs in one round trip, then run one pass per cluster"""
+        try:
+            self.scheduler.queue.enqueue_deployments(deployments)
+            for cluster_id in affected_clusters(deployments):
+                self.scheduler.process_cluster_queue(cluster_id)
+        except redis.RedisError as e:
+            raise SchedulingDispatchError(str(e)) from e
+        self.write_behind()
+
+    def write_behind(self):
+        """Flush the capacity cache to the database once the flush interval has passed"""
+        capacity = self.scheduler.capacity
+        if capacity is None:
+            return
+        interval = getattr(settings, 'SCHEDULER_CAPACITY_FLUSH_INTERVAL', 1.0)
+        if time.monotonic() - self._flushed_at < interval:
+            return
+        self._flushed_at = time.monotonic()
+        try:
+            capacity.flush()
+        except Exception:
+            # The clusters stay dirty, a later flush writes them
+            logger.exception("Capacity write-behind failed")
+
+    async def aschedule(self, deployment_data, cluster_id):
+        await sync_to_async(self.schedule)(deployment_data, cluster_id)
+
+    async def aprocess(self, cluster_id):
+        await sync_to_async(self.process)(cluster_id)
+
+
+class HttpDispatcher:
+    """Forward scheduling work to a scheduler running as a separate service"""
+
+    asynchronous = False
+
+    def __init__(self, url=None, timeout=None):
+        self.url = url or getattr(settings, 'SCHEDULER_URL', 'http://localhost:8000/scheduler/schedule/')
+        self.timeout = timeout or getattr(settings, 'SCHEDULER_TIMEOUT', 10)
+
+    def _post(self, payload):
+        try:
+            response = requests.post(self.url, json=payload, timeout=self.timeout)
+        except requests.exceptions.RequestException as e:
+            raise SchedulingDispatchError(str(e)) from e
+        if response.status_code != 200:
+            raise SchedulingDispatchError("Failed to communicate with scheduling server")
+        return response
+
+    def schedule(self, deployment_data, cluster_id):
+        self._post({**deployment_data, "cluster_id": cluster_id, "is_scheduled": True})
+
+    def process(self, cluster_id):
+        self._post({"cluster_id": cluster_id, "is_scheduled": False})
+
+    def schedule_many(self, deployments):
+        self._post({
+            "deployments": [{**deployment_data, "cluster_id": cluster_id} for deployment_data, cluster_id in deployments],
+            "is_scheduled": True,
+        })
+
+    # The request holds no database connection, so it waits in the thread pool
+    # rather than on the thread shared by the async views' database access
+    async def aschedule(self, deployment_data, cluster_id):
+        await sync_to_async(self.schedule, thread_sensitive=False)(deployment_data, cluster_id)
+
+    async def aprocess(self, cluster_id):
+        await sync_to_async(self.process, thread_sensitive=False)(cluster_id)
+
+
+class EventDispatcher:
+    """Queue the work and leave the pass to the `run_scheduler` worker"""
+
+    asynchronous = True
+
+    def __init__(self):
+        self.queue = queue_instance
+
+    def schedule(self, deployment_data, cluster_id):
+        try:
+            self.queue.enqueue_deployment(deployment_data, cluster_id)
+            publish_event(DEPLOYMENT_SUBMITTED, cluster_id)
+        except redis.RedisError as e:
+            raise SchedulingDispatchError(str(e)) from e
+
+    def process(self, cluster_id):
+        try:
+            publish_event(CAPACITY_FREED, cluster_id)
+        except redis.RedisError as e:
+            raise SchedulingDispatchError(str(e)) from e
+
+    def schedule_many(self, deployments):
+        try:
+            self.queue.enqueue_deployments(deployments)
+            pipe = self.queue.redis_client.pipeline(transaction=False)
+            for cluster_id in affected_clusters(deployments):
+                publish_event(DEPLOYMENT_SUBMITTED, cluster_id, redis_client=pipe)
+            pipe.execute()
+        except redis.RedisError as e:
+            raise SchedulingDispatchError(str(e)) from e
+
+    async def aschedule(self, deployment_data, cluster_id):
+        try:
+            await self.queue.aenqueue_deployment(deployment_data, cluster_id)
+            await apublish_event(DEPLOYMENT_SUBMITTED, cluster_id)
+        except redis.RedisError as e:
+            raise SchedulingDispatchError(str(e)) from e
+
+    async def aprocess(self, cluster_id):
+        try:
+            await apublish_event(CAPACITY_FREED, cluster_id)
+        except redis.RedisError as e:
+            raise SchedulingDispatchError(str(e)) from e
+
+
+def affected_clusters(deployments):
+    """Distinct cluster ids of (deployment data, cluster id) pairs, in order of first appearance"""
+    return list(dict.fromkeys(cluster_id for _deployment_data, cluster_id in deployments))
+
+
+_dispatcher = None
+
+
+def get_dispatcher():
+    """Return the dispatcher configured by the SCHEDULER_DISPATCHER setting"""
+    global _dispatcher
+    if _dispatcher is None:
+        backend = getattr(settings, 'SCHEDULER_DISPATCHER', 'scheduler.dispatch.InProcessDispatcher')
+        _dispatcher = import_string(backend)()
+    return _dispatcher
+
+
+def reset_dispatcher():
+    """Drop the cached dispatcher so the next call re-reads settings"""
+    global _dispatcher
+    _dispatcher = None
+
+
+@receiver(setting_changed)
+def _reset_on_setting_changed(setting, **kwargs):
+    if setting in ('SCHEDULER_DISPATCHER', 'SCHEDULER_URL', 'SCHEDULER_TIMEOUT', 'SCHEDULER_ENGINE', 'SCHEDULER_AGING',
+                   'SCHEDULER_PREEMPTION', 'SCHEDULER_CAPACITY_CACHE'):
+        reset_dispatcher()
+    elif setting == 'SCHEDULER_REDIS':
+        reset_redis_client()
@@ -0,0 +1,137 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from api.models import Cluster, Deployment
+from .capacity import CapacityCache
+from .queue_handler import HIGH_PRIORITY, QUEUE_LUA_HELPERS
+
+# Fit-and-reserve pass over one cluster's queue, run atomically inside Redis.
+# Uses the queue script key layout plus KEYS[8], the capacity hash holding the
+# cluster's free resources, and ARGV[2], the high priority threshold. Each queued
+# payload carries its demand as 'cpu', 'gpu' and 'ram'. Deployments that fit are
+# taken off the queue and their demand is reserved. Returns one
+# [id, cpu, gpu, ram] entry per started deployment, or nil when the capacity
+# hash has not been seeded yet.
+PASS_SCRIPT = QUEUE_LUA_HELPERS + """
+if redis.call('EXISTS', KEYS[8]) == 0 then
+    return false
+end
+local capacity = redis.call('HMGET', KEYS[8], 'cpu', 'gpu', 'ram')
+local free_cpu = tonumber(capacity[1])
+local free_gpu = tonumber(capacity[2])
+local free_ram = tonumber(capacity[3])
+
+-- Only consider low priority when no high priority deployment is waiting
+local max_score = '+inf'
+if redis.call('ZCOUNT', KEYS[1], '-inf', -tonumber(ARGV[2])) > 0 then
+    max_score = -tonumber(ARGV[2])
+end
+
+local started = {}
+local members = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', max_score)
+for _, member in ipairs(members) do
+    local id = member_id(member)
+    local payload = redis.call('HGET', KEYS[2], id)
+    if not payload then
+        -- Orphaned member, drop it
+        remove_entry(id, member)
+    else
+        local data = cjson.decode(payload)
+        local cpu = tonumber(data['cpu'])
+        local gpu = tonumber(data['gpu'])
+        local ram = tonumber(data['ram'])
+        if cpu and gpu and ram and cpu <= free_cpu and gpu <= free_gpu and ram <= free_ram then
+            free_cpu = free_cpu - cpu
+            free_gpu = free_gpu - gpu
+            free_ram = free_ram - ram
+            remove_entry(id, member)
+            -- Lua numbers are truncated to integers in replies, send demand as strings
+            started[#started + 1] = {id, tostring(cpu), tostring(gpu), tostring(ram)}
+        end
+    end
+end
+
+if #started > 0 then
+    redis.call('HSET', KEYS[8], 'cpu', free_cpu, 'gpu', free_gpu, 'ram', free_ram)
+end
+return started
+"""
+
+class LuaSchedulingEngine:
+    """Schedule a cluster with a single atomic Redis round trip per pass.
+
+    Enabled with ``SCHEDULER_ENGINE = 'lua'``. Concurrent passes on the same
+    cluster are serialized by Redis, so they cannot double-book capacity.
+    """
+
+    def __init__(self, queue):
+        self.queue = queue
+        # The pass works on the same capacity hashes as the capacity cache. It
+        # writes utilization to the database itself, so its releases only need
+        # flushing when the cache is enabled and flushed anyway.
+        self.capacity = CapacityCache(queue.redis_client,
+                                      write_behind=getattr(settings, 'SCHEDULER_CAPACITY_CACHE', False))
+        self._pass = queue.redis_client.register_script(PASS_SCRIPT)
+
+    def get_capacity_key(self, cluster_id):
+        """Generate the hash key holding a cluster's free resources"""
+        return self.capacity.get_capacity_key(cluster_id)
+
+    def seed_capacity(self, cluster):
+        """Copy a cluster's free resources from the database, unless already seeded"""
+        self.capacity.seed([cluster])
+
+    def release(self, cluster_id, cpu, gpu, ram):
+        """Give resources back to the cluster, e.g. when a deployment stops"""
+        self.capacity.release(cluster_id, cpu, gpu, ram)
+
+    def reserve_pass(self, cluster_id):
+        """Run the Lua pass, seeding capacity from the database on first use.
+
+        Returns a dict mapping each reserved deployment id to its (cpu, gpu, ram) demand.
+        """
+        keys = self.queue.get_script_keys(cluster_id) + [self.get_capacity_key(cluster_id)]
+        args = [self.queue.get_bucket_prefix(cluster_id), HIGH_PRIORITY]
+        reserved = self._pass(keys=keys, args=args)
+        if reserved is None:
+            self.seed_capacity(Cluster.objects.get(id=cluster_id))
+            reserved = self._pass(keys=keys, args=args)
+        return {
+            int(deployment_id): (float(cpu), float(gpu), float(ram))
+            for deployment_id, cpu, gpu, ram in reserved
+        }
+
+    def process_cluster_queue(self, cluster_id):
+        """Start every queued deployment that fits, returns the started ids"""
+        reserved = self.reserve_pass(cluster_id)
+        if not reserved:
+            return []
+
+        with transaction.atomic():
+            rows = list(Deployment.objects.filter(id__in=reserved, status='queued').values_list(
+                'id', 'cpu_required', 'gpu_required', 'ram_required'
+            ))
+            running = [row[0] for row in rows]
+            if running:
+                Deployment.objects.filter(id__in=running).update(status='running', cluster_id=cluster_id)
+                Cluster.objects.filter(id=cluster_id).update(
+                    utilized_cpu=F('utilized_cpu') + sum(row[1] for row in rows),
+                    utilized_gpu=F('utilized_gpu') + sum(row[2] for row in rows),
+                    utilized_ram=F('utilized_ram') + sum(row[3] for row in rows),
+                )
+
+        # Deployments that were deleted or stopped while queued give their reservation back
+        dropped = [reserved[deployment_id] for deployment_id in set(reserved) - set(running)]
+        if dropped:
+            self.release(cluster_id, *(sum(demand) for demand in zip(*dropped)))
+        return running
+
+
+def get_engine(queue=None):
+    """Return the scheduling engine selected by SCHEDULER_ENGINE, or None for the ORM pass"""
+    if getattr(settings, 'SCHEDULER_ENGINE', 'orm') != 'lua':
+        return None
+    if queue is None:
+        from .queue_handler import queue_instance
+        queue = queue_instance
+    return LuaSchedulingEngine(queue)
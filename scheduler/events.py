@@ -0,0 +1,53 @@
+from .queue_handler import queue_instance
+
+# Redis stream carrying the events that make a cluster worth a scheduling pass
+EVENTS_STREAM = 'scheduler_events'
+EVENTS_MAXLEN = 10000
+
+DEPLOYMENT_SUBMITTED = 'deployment_submitted'
+CAPACITY_FREED = 'capacity_freed'
+
+
+def publish_event(event_type, cluster_id, redis_client=None):
+    """Append a scheduling event for a cluster to the events stream"""
+    redis_client = redis_client or queue_instance.redis_client
+    return redis_client.xadd(
+        EVENTS_STREAM,
+        {'type': event_type, 'cluster_id': cluster_id},
+        maxlen=EVENTS_MAXLEN,
+        approximate=True,
+    )
+
+
+async def apublish_event(event_type, cluster_id, redis_client=None):
+    """Async counterpart of ``publish_event``, on the asyncio Redis client"""
+    redis_client = redis_client or queue_instance.async_redis_client
+    return await redis_client.xadd(
+        EVENTS_STREAM,
+        {'type': event_type, 'cluster_id': cluster_id},
+        maxlen=EVENTS_MAXLEN,
+        approximate=True,
+    )
+
+
+def last_event_id(redis_client=None):
+    """Id of the newest event in the stream, reading after it skips the backlog"""
+    redis_client = redis_client or queue_instance.redis_client
+    newest = redis_client.xrevrange(EVENTS_STREAM, count=1)
+    return newest[0][0] if newest else '0-0'
+
+
+def read_events(last_id, block_ms, count=1000, redis_client=None):
+    """Block up to ``block_ms`` for events after ``last_id``.
+
+    Returns the id of the last event read and the list of events, each a dict
+    with 'type' and 'cluster_id'.
+    """
+    redis_client = redis_client or queue_instance.redis_client
+    response = redis_client.xread({EVENTS_STREAM: last_id}, count=count, block=block_ms)
+    events = []
+    for _stream, entries in response or []:
+        for event_id, fields in entries:
+            last_id = event_id
+            events.append({'type': fields['type'], 'cluster_id': int(fields['cluster_id'])})
+    return last_id, events
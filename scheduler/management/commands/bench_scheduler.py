@@ -0,0 +1,184 @@
+import json
+import random
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+from api.models import UserProfile, Cluster, Deployment
+from scheduler.accounting import release
+from scheduler.memory import InMemoryQueue
+from scheduler.metrics import QueryCounter
+from scheduler.queue_handler import CountingRedis, RedisQueue, deployment_payload, redis_call_count
+from scheduler.scheduler import DeploymentScheduler
+from scheduler.stats import percentile
+
+# Every cluster has the same size
+CLUSTER_SIZE = {'total_cpu': 64, 'total_gpu': 8, 'total_ram': 256}
+
+# fill: start each cluster full of small running deployments
+# high_share: fraction of queued deployments that are high priority
+# cpu, gpu, ram: demands drawn uniformly for queued deployments
+# release: running deployments stopped on the cluster before each pass
+SCENARIOS = {
+    # A full cluster with a deep queue, each pass frees a little room
+    'deep_queue': {'fill': True, 'high_share': 0.5, 'cpu': [1, 2, 4], 'gpu': [0], 'ram': [2, 4, 8], 'release': 1},
+    # Almost everything is high priority, low priority waits behind it
+    'high_flood': {'fill': False, 'high_share': 0.95, 'cpu': [1, 2], 'gpu': [0], 'ram': [2, 4], 'release': 2},
+    # CPU-only and GPU jobs of mixed sizes competing for the same clusters
+    'mixed': {'fill': False, 'high_share': 0.5, 'cpu': [1, 2, 4, 8], 'gpu': [0, 0, 1, 2], 'ram': [4, 8, 16, 32],
+              'release': 2},
+}
+
+
+def _choices(value):
+    return [float(choice) for choice in value.split(',')]
+
+
+class Command(BaseCommand):
+    help = "Benchmark scheduling passes on synthetic workloads, in a throwaway database"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS),
+                            help="Scenario to run, may be repeated (default: all)")
+        parser.add_argument('--backend', choices=['redis', 'memory'], default='redis',
+                            help="Queue backend, 'memory' needs no Redis")
+        parser.add_argument('--redis-url', default='redis://localhost:6379/15',
+                            help="Redis database the benchmark may fill and clear, keep it apart from real data")
+        parser.add_argument('--clusters', type=int, default=10)
+        parser.add_argument('--deployments', type=int, default=5000, help="Queued deployments over all clusters")
+        parser.add_argument('--passes', type=int, default=200)
+        parser.add_argument('--cpu', type=_choices, help="Comma separated CPU demands to draw from")
+        parser.add_argument('--gpu', type=_choices, help="Comma separated GPU demands to draw from")
+        parser.add_argument('--ram', type=_choices, help="Comma separated RAM demands to draw from")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help="Write the results as JSON to this file")
+
+    def handle(self, *args, **options):
+        if options['clusters'] < 1:
+            raise CommandError("--clusters must be at least 1")
+
+        # Seed into a test database so the real one is never touched
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            # The ORM pass is what is measured, metrics would add Redis calls of their own
+            with override_settings(SCHEDULER_ENGINE='orm', SCHEDULER_CAPACITY_CACHE=False, METRICS_ENABLED=False):
+                results = {
+                    'backend': options['backend'],
+                    'clusters': options['clusters'],
+                    'deployments': options['deployments'],
+                    'passes': options['passes'],
+                    'seed': options['seed'],
+                    'scenarios': {},
+                }
+                for name in options['scenario'] or sorted(SCENARIOS):
+                    result = self.run_scenario(name, options)
+                    results['scenarios'][name] = result
+                    self.stdout.write(
+                        f"{name}: {result['passes_per_sec']:.1f} passes/s, "
+                        f"{result['decisions_per_sec']:.1f} decisions/s, "
+                        f"p50 {result['p50_ms']:.2f} ms, p99 {result['p99_ms']:.2f} ms, "
+                        f"{result['queries_per_pass']:.1f} queries and "
+                        f"{result['redis_calls_per_pass']:.1f} Redis calls per pass"
+                    )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(results, output, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+
+    def run_scenario(self, name, options):
+        scenario = {**SCENARIOS[name], **{k: options[k] for k in ('cpu', 'gpu', 'ram') if options[k]}}
+        rng = random.Random(options['seed'])
+        if options['backend'] == 'memory':
+            queue = InMemoryQueue()
+        else:
+            queue = RedisQueue(CountingRedis.from_url(options['redis_url'], decode_responses=True))
+        clusters = self.seed(scenario, options, queue, rng)
+        scheduler = DeploymentScheduler(queue=queue)
+
+        durations = []
+        examined_total = started_total = queries_total = redis_total = 0
+        try:
+            for index in range(options['passes']):
+                cluster = clusters[index % len(clusters)]
+                self.release_some(cluster, scenario['release'], rng)
+
+                queries = QueryCounter()
+                redis_calls = redis_call_count()
+                started_at = time.perf_counter()
+                with connection.execute_wrapper(queries):
+                    started_ids, examined = scheduler._process_cluster_queue(cluster.id)
+                durations.append(time.perf_counter() - started_at)
+
+                examined_total += examined
+                started_total += len(started_ids)
+                queries_total += queries.count
+                redis_total += redis_call_count() - redis_calls
+        finally:
+            for cluster in clusters:
+                queue.clear_queue(cluster.id)
+            Deployment.objects.all().delete()
+            Cluster.objects.all().delete()
+
+        elapsed = sum(durations)
+        durations.sort()
+        passes = len(durations)
+        return {
+            'passes': passes,
+            'started': started_total,
+            'examined': examined_total,
+            'passes_per_sec': passes / elapsed if elapsed else 0.0,
+            'decisions_per_sec': examined_total / elapsed if elapsed else 0.0,
+            'p50_ms': percentile(durations, 50) * 1000 if durations else 0.0,
+            'p99_ms': percentile(durations, 99) * 1000 if durations else 0.0,
+            'queries_per_pass': queries_total / passes if passes else 0.0,
+            'redis_calls_per_pass': redis_total / passes if passes else 0.0,
+        }
+
+    def seed(self, scenario, options, queue, rng):
+        user, _ = UserProfile.objects.get_or_create(username='bench', defaults={'password': 'bench'})
+        clusters = [
+            Cluster.objects.create(name=f'bench-{i}', user=user, **CLUSTER_SIZE)
+            for i in range(options['clusters'])
+        ]
+        for cluster in clusters:
+            queue.clear_queue(cluster.id)
+
+        if scenario['fill']:
+            # Full clusters of small running deployments, the passes release them one by one
+            filler = {'cpu_required': 1, 'gpu_required': 0, 'ram_required': 4}
+            count = int(CLUSTER_SIZE['total_cpu'])
+            Deployment.objects.bulk_create([
+                Deployment(docker_image='bench:latest', priority='low', status='running', cluster=cluster,
+                           user=user, **filler)
+                for cluster in clusters for _ in range(count)
+            ])
+            Cluster.objects.update(utilized_cpu=count * filler['cpu_required'],
+                                   utilized_ram=count * filler['ram_required'])
+
+        deployments = Deployment.objects.bulk_create([
+            Deployment(
+                docker_image='bench:latest',
+                cpu_required=rng.choice(scenario['cpu']),
+                gpu_required=rng.choice(scenario['gpu']),
+                ram_required=rng.choice(scenario['ram']),
+                priority='high' if rng.random() < scenario['high_share'] else 'low',
+                cluster=clusters[i % len(clusters)],
+                user=user,
+            )
+            for i in range(options['deployments'])
+        ])
+        for deployment in deployments:
+            queue.enqueue_deployment(deployment_payload(deployment), deployment.cluster_id)
+        return clusters
+
+    def release_some(self, cluster, count, rng):
+        """Stop a few running deployments on the cluster, the way stop_deployment does"""
+        running = list(Deployment.objects.filter(cluster=cluster, status='running')
+                       .values_list('id', 'cpu_required', 'gpu_required', 'ram_required'))
+        for deployment_id, cpu, gpu, ram in rng.sample(running, min(count, len(running))):
+            if Deployment.objects.filter(id=deployment_id, status='running').update(status='stopped'):
+                release(cluster.id, cpu, gpu, ram)
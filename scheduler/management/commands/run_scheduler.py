@@ -0,0 +1,43 @@
+import asyncio
+import os
+import socket
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from scheduler.sharding import ShardCoordinator
+from scheduler.worker import SchedulerWorker
+
+
+class Command(BaseCommand):
+    help = "Run the scheduler worker, processing cluster queues as scheduling events arrive"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency', type=int,
+            default=getattr(settings, 'SCHEDULER_WORKER_CONCURRENCY', 4),
+            help="Number of clusters scheduled at the same time",
+        )
+        parser.add_argument(
+            '--block-ms', type=int, default=1000,
+            help="How long to wait for new events before checking for shutdown",
+        )
+        parser.add_argument(
+            '--worker-id', default=f'{socket.gethostname()}-{os.getpid()}',
+            help="Unique name of this worker among the running scheduler workers",
+        )
+        parser.add_argument(
+            '--lease-ttl', type=float,
+            default=getattr(settings, 'SCHEDULER_LEASE_TTL', 10.0),
+            help="Seconds before the clusters of an unresponsive worker move to the others",
+        )
+
+    def handle(self, *args, **options):
+        coordinator = ShardCoordinator(options['worker_id'], lease_ttl=options['lease_ttl'])
+        worker = SchedulerWorker(
+            concurrency=options['concurrency'],
+            block_ms=options['block_ms'],
+            coordinator=coordinator,
+            flush_interval=getattr(settings, 'SCHEDULER_CAPACITY_FLUSH_INTERVAL', 1.0),
+        )
+        self.stdout.write(f"Scheduler worker {options['worker_id']} started (concurrency {options['concurrency']})")
+        asyncio.run(worker.run())
+        self.stdout.write("Scheduler worker stopped")
@@ -0,0 +1,55 @@
+import json
+import os
+from django.core.management.base import BaseCommand, CommandError
+from scheduler.simulation import POLICIES, Simulation, read_trace, write_synthetic_trace
+
+
+class Command(BaseCommand):
+    help = "Replay a trace of submit and stop events offline and compare scheduling policies"
+
+    def add_arguments(self, parser):
+        parser.add_argument('trace', help="CSV trace file, see scheduler.simulation.TRACE_FIELDS")
+        parser.add_argument('--policy', action='append', choices=list(POLICIES),
+                            help="Policy to replay, may be repeated (default: all)")
+        parser.add_argument('--sample-interval', type=float, default=60.0,
+                            help="Virtual seconds between utilization samples")
+        parser.add_argument('--generate', type=int, metavar='SUBMITS',
+                            help="First write a synthetic trace with this many submits to the trace file")
+        parser.add_argument('--clusters', type=int, default=10, help="Clusters in a generated trace")
+        parser.add_argument('--seed', type=int, default=0, help="Seed of a generated trace")
+        parser.add_argument('--output', help="Write the results, with utilization over time, as JSON to this file")
+
+    def handle(self, *args, **options):
+        if options['sample_interval'] <= 0:
+            raise CommandError("--sample-interval must be positive")
+        if options['generate']:
+            write_synthetic_trace(options['trace'], options['generate'],
+                                  clusters=options['clusters'], seed=options['seed'])
+            self.stdout.write(f"Synthetic trace written to {options['trace']}")
+        elif not os.path.exists(options['trace']):
+            raise CommandError(f"Trace file {options['trace']} does not exist")
+
+        results = {}
+        for name in options['policy'] or list(POLICIES):
+            simulation = Simulation(sample_interval=options['sample_interval'], **POLICIES[name])
+            try:
+                result = simulation.run(read_trace(options['trace']))
+            except ValueError as error:
+                raise CommandError(f"Invalid trace: {error}")
+            results[name] = result
+
+            waits = ', '.join(
+                f"{priority} wait p50 {wait['p50']:.1f}s p99 {wait['p99']:.1f}s"
+                for priority, wait in sorted(result['wait_times'].items())
+            )
+            utilization = ', '.join(f"{resource} {share:.0%}" for resource, share in result['mean_utilization'].items())
+            self.stdout.write(
+                f"{name}: {result['throughput_per_hour']:.1f} completed/h, {waits}, "
+                f"utilization {utilization}, {result['preempted']} preempted, "
+                f"{result['events_per_sec']:.0f} events/s"
+            )
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(results, output, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
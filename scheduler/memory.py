@@ -0,0 +1,87 @@
+import bisect
+import itertools
+import time
+from .queue_handler import HIGH_PRIORITY, priority_value
+
+
+class InMemoryQueue:
+    """Stand-in for RedisQueue keeping every queue in process memory.
+
+    Orders deployments like RedisQueue, by priority then arrival, and exposes
+    the methods DeploymentScheduler uses. Meant for benchmarks and
+    simulations that should not need Redis; nothing is shared between
+    processes.
+    """
+
+    # No Redis behind this queue, so wait times are not recorded
+    redis_client = None
+
+    def __init__(self):
+        # cluster id -> (sorted list of (-priority, sequence, deployment id),
+        #                {deployment id: (entry, payload)})
+        self._queues = {}
+        self._sequence = itertools.count()
+
+    def _queue(self, cluster_id):
+        queue = self._queues.get(cluster_id)
+        if queue is None:
+            queue = self._queues[cluster_id] = ([], {})
+        return queue
+
+    def enqueue_deployment(self, deployment_data, cluster_id):
+        """Add deployment to the cluster's queue, ordered by priority then arrival"""
+        entries, items = self._queue(cluster_id)
+        deployment_data = dict(deployment_data)
+        deployment_data.setdefault('enqueued_at', time.time())
+        deployment_id = deployment_data['deployment_id']
+        if deployment_id in items:
+            self.remove_deployments(cluster_id, [deployment_id])
+        entry = (-priority_value(deployment_data['priority']), next(self._sequence), deployment_id)
+        bisect.insort(entries, entry)
+        items[deployment_id] = (entry, deployment_data)
+        return len(entries)
+
+    def enqueue_deployments(self, deployments):
+        """Add many deployments, given as (deployment data, cluster id) pairs"""
+        return [self.enqueue_deployment(deployment_data, cluster_id) for deployment_data, cluster_id in deployments]
+
+    def _payloads(self, cluster_id, min_priority=None):
+        entries, items = self._queue(cluster_id)
+        max_score = None if min_priority is None else -priority_value(min_priority)
+        for score, _, deployment_id in entries:
+            if max_score is not None and score > max_score:
+                break
+            yield items[deployment_id][1]
+
+    def peek_deployments(self, cluster_id, min_priority=None, count=None):
+        """Read queued deployments from the head of the queue without removing them"""
+        return list(itertools.islice(self._payloads(cluster_id, min_priority), count))
+
+    def feasible_deployments(self, cluster_id, free_cpu, free_gpu, free_ram, min_priority=None):
+        """Read the queued deployments that fit in the given free resources, in queue order"""
+        return [
+            deployment_data for deployment_data in self._payloads(cluster_id, min_priority)
+            if deployment_data['cpu'] <= free_cpu and deployment_data['gpu'] <= free_gpu
+            and deployment_data['ram'] <= free_ram
+        ]
+
+    def remove_deployments(self, cluster_id, deployment_ids):
+        """Remove deployments from the cluster's queue, returns how many were queued"""
+        entries, items = self._queue(cluster_id)
+        removed = 0
+        for deployment_id in deployment_ids:
+            item = items.pop(deployment_id, None)
+            if item is not None:
+                del entries[bisect.bisect_left(entries, item[0])]
+                removed += 1
+        return removed
+
+    def get_queue_length(self, cluster_id):
+        """Get queue lengths for a specific cluster"""
+        entries, _ = self._queue(cluster_id)
+        high = bisect.bisect_right(entries, (-HIGH_PRIORITY, float('inf')))
+        return {'high_priority': high, 'low_priority': len(entries) - high}
+
+    def clear_queue(self, cluster_id):
+        """Drop every queued deployment for a cluster"""
+        self._queues.pop(cluster_id, None)
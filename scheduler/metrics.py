@@ -0,0 +1,238 @@
+import asyncio
+import threading
+import time
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from collections import defaultdict
+from django.conf import settings
+from django.db import connection
+from .queue_handler import get_redis_client, redis_call_count
+
+# Series values of every process, summed in Redis. Fields are Prometheus series
+# such as 'scheduler_pass_started_count{cluster="1"}'.
+METRICS_KEY = 'metrics_counters'
+GAUGES_KEY = 'metrics_gauges'
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+WAIT_BUCKETS = (1, 5, 15, 60, 300, 900, 3600, 14400, 86400)
+
+# name -> (type, help, histogram buckets)
+METRICS = {
+    'scheduler_pass_duration_seconds': ('histogram', 'Duration of scheduling passes', DURATION_BUCKETS),
+    'scheduler_pass_examined': ('histogram', 'Queued deployments examined per scheduling pass', COUNT_BUCKETS),
+    'scheduler_pass_started': ('histogram', 'Deployments started per scheduling pass', COUNT_BUCKETS),
+    'scheduler_pass_redis_calls': ('histogram', 'Redis round trips per scheduling pass', COUNT_BUCKETS),
+    'scheduler_pass_db_queries': ('histogram', 'Database queries per scheduling pass', COUNT_BUCKETS),
+    'scheduler_queue_depth': ('gauge', 'Queued deployments per cluster and priority', None),
+    'scheduler_enqueue_to_running_seconds': ('histogram', 'Time from enqueue to running', WAIT_BUCKETS),
+    'api_request_duration_seconds': ('histogram', 'Latency of API views', DURATION_BUCKETS),
+    'api_response_cache_requests': ('counter', 'Cached API listing requests by result: hit, wait or miss', None),
+}
+
+
+def _series(name, labels, **extra):
+    labels = {**labels, **extra}
+    if not labels:
+        return name
+    pairs = ','.join(
+        '{}="{}"'.format(key, str(value).replace('\\', r'\\').replace('"', r'\"'))
+        for key, value in labels.items()
+    )
+    return f'{name}{{{pairs}}}'
+
+
+def _sort_key(series):
+    """Order series by name and labels, histogram buckets by their numeric bound"""
+    prefix, _, le = series.rpartition('le="')
+    if not prefix:
+        return series, 0.0
+    bound = le.rstrip('"}')
+    return prefix, float('inf') if bound == '+Inf' else float(bound)
+
+
+class Metrics:
+    """Counters, gauges and histograms rendered in the Prometheus text format.
+
+    Recording only updates a dict in memory. At most every ``flush_interval``
+    seconds the changes are pushed to Redis in one pipeline, where the values
+    of every API and scheduler process add up, so the endpoint can serve them
+    all from any process. Recorded on an event loop, the pipeline runs on the
+    loop's executor so it never blocks the loop.
+    """
+
+    def __init__(self, flush_interval=None):
+        self._flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._deltas = defaultdict(float)
+        self._gauges = {}
+        self._last_flush = time.monotonic()
+
+    @property
+    def enabled(self):
+        return getattr(settings, 'METRICS_ENABLED', True)
+
+    @property
+    def flush_interval(self):
+        if self._flush_interval is not None:
+            return self._flush_interval
+        return getattr(settings, 'METRICS_FLUSH_INTERVAL', 5.0)
+
+    def inc(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._deltas[_series(name, labels)] += value
+        self._maybe_flush()
+
+    def set(self, name, value, **labels):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._gauges[_series(name, labels)] = value
+        self._maybe_flush()
+
+    def observe(self, name, value, **labels):
+        if not self.enabled:
+            return
+        buckets = METRICS[name][2]
+        with self._lock:
+            for bound in buckets:
+                # Buckets the value misses are still created, Prometheus expects all of them
+                self._deltas[_series(f'{name}_bucket', labels, le=bound)] += 1 if value <= bound else 0
+            self._deltas[_series(f'{name}_bucket', labels, le='+Inf')] += 1
+            self._deltas[_series(f'{name}_sum', labels)] += value
+            self._deltas[_series(f'{name}_count', labels)] += 1
+        self._maybe_flush()
+
+    def _maybe_flush(self):
+        with self._lock:
+            if time.monotonic() - self._last_flush < self.flush_interval:
+                return
+            # Claimed here so recordings made while the flush runs don't start another
+            self._last_flush = time.monotonic()
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._flush_quietly()
+        else:
+            loop.run_in_executor(None, self._flush_quietly)
+
+    def _flush_quietly(self):
+        try:
+            self.flush()
+        except Exception:
+            # Metrics must never break the request or pass that records them
+            pass
+
+    def flush(self, redis_client=None):
+        """Push the changes recorded since the last flush to Redis"""
+        with self._lock:
+            deltas, self._deltas = self._deltas, defaultdict(float)
+            gauges, self._gauges = self._gauges, {}
+            self._last_flush = time.monotonic()
+        if not deltas and not gauges:
+            return
+        try:
+            pipe = (redis_client or get_redis_client()).pipeline(transaction=False)
+            for series, value in deltas.items():
+                pipe.hincrbyfloat(METRICS_KEY, series, value)
+            if gauges:
+                pipe.hset(GAUGES_KEY, mapping=gauges)
+            pipe.execute()
+        except Exception:
+            # Keep the changes for the next flush
+            with self._lock:
+                for series, value in deltas.items():
+                    self._deltas[series] += value
+                for series, value in gauges.items():
+                    self._gauges.setdefault(series, value)
+            raise
+
+    def render(self, redis_client=None):
+        """Every series in the Prometheus text exposition format"""
+        redis_client = redis_client or get_redis_client()
+        self.flush(redis_client)
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.hgetall(METRICS_KEY)
+        pipe.hgetall(GAUGES_KEY)
+        values = {}
+        for stored in pipe.execute():
+            values.update(stored)
+
+        lines = []
+        for name, (kind, help_text, _) in METRICS.items():
+            names = {name, f'{name}_bucket', f'{name}_sum', f'{name}_count'}
+            series = sorted((s for s in values if s.partition('{')[0] in names), key=_sort_key)
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            lines.extend(f'{s} {float(values[s]):g}' for s in series)
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
+
+
+class QueryCounter:
+    """Count the database queries run on this thread's connection"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def record_pass(cluster_id, run):
+    """Run a scheduling pass, ``run`` returns (started ids, deployments examined), and record its metrics"""
+    if not metrics.enabled:
+        return run()[0]
+    started_at = time.perf_counter()
+    redis_calls = redis_call_count()
+    queries = QueryCounter()
+    with connection.execute_wrapper(queries):
+        started_ids, examined = run()
+    metrics.observe('scheduler_pass_duration_seconds', time.perf_counter() - started_at, cluster=cluster_id)
+    metrics.observe('scheduler_pass_examined', examined)
+    metrics.observe('scheduler_pass_started', len(started_ids))
+    metrics.observe('scheduler_pass_redis_calls', redis_call_count() - redis_calls)
+    metrics.observe('scheduler_pass_db_queries', queries.count)
+    return started_ids
+
+
+class RequestMetricsMiddleware:
+    """Record the latency of every view of the ``api`` app.
+
+    Runs sync or async as the stack around it does, so under ASGI requests
+    don't hop to a thread and back just to be timed.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        started_at = time.perf_counter()
+        response = self.get_response(request)
+        self.record(request, response, started_at)
+        return response
+
+    async def __acall__(self, request):
+        started_at = time.perf_counter()
+        response = await self.get_response(request)
+        self.record(request, response, started_at)
+        return response
+
+    def record(self, request, response, started_at):
+        match = request.resolver_match
+        if match is not None and match.func.__module__.startswith('api.'):
+            metrics.observe(
+                'api_request_duration_seconds', time.perf_counter() - started_at,
+                view=match.url_name or match.func.__name__, method=request.method, status=response.status_code,
+            )
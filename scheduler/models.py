@@ -1,3 +1,17 @@
 from django.db import models
+from django.utils import timezone
+from api.models import Cluster, Deployment
 
-# Create your models here.
+
+class Preemption(models.Model):
+    """A running deployment stopped and re-queued to make room for a higher priority one"""
+    cluster = models.ForeignKey(Cluster, related_name='preemptions', on_delete=models.CASCADE)
+    preempted = models.ForeignKey(Deployment, related_name='preempted_by', on_delete=models.CASCADE)
+    deployment = models.ForeignKey(Deployment, related_name='preemptions', on_delete=models.CASCADE)  # The deployment that needed room
+
+    # Share of the cluster's resources given up, the quantity preemption minimizes
+    cost = models.FloatField()
+    created_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.preempted_id} preempted for {self.deployment_id} on {self.cluster_id}"
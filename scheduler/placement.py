@@ -0,0 +1,117 @@
+from django.conf import settings
+from django.db.models import F, FloatField, Value
+from django.db.models.functions import Coalesce, NullIf
+from api.models import Cluster
+
+BEST_FIT = 'best_fit'
+WORST_FIT = 'worst_fit'
+STRATEGIES = (BEST_FIT, WORST_FIT)
+
+RESOURCES = ('cpu', 'gpu', 'ram')
+
+
+def candidate_clusters(user_profile):
+    """Clusters a user may place deployments on.
+
+    The same rule as naming a cluster, Principal.can_access with ``manage``:
+    only the clusters the user owns, not every cluster of the organization.
+    """
+    return Cluster.objects.filter(user=user_profile)
+
+
+def _leftover_score(demand, free=True):
+    """Sum over resources of the share of the cluster left after placing ``demand``"""
+    score = Value(0.0)
+    for resource in RESOURCES:
+        total = F(f'total_{resource}')
+        available = total - F(f'utilized_{resource}') if free else total
+        # Clusters without any of a resource (e.g. no GPUs) contribute nothing for it
+        score = score + Coalesce(
+            (available - demand[resource]) / NullIf(total, 0.0),
+            Value(0.0),
+            output_field=FloatField(),
+        )
+    return score
+
+
+def choose_cluster(clusters, cpu, gpu, ram, strategy=None):
+    """Pick the cluster to place a deployment on, or None if none can ever hold it.
+
+    Feasibility and scores are computed by the database for every candidate in
+    a single query. Best fit picks the cluster left with the least spare room,
+    which keeps large clusters free for large deployments; worst fit picks the
+    one left with the most, which spreads load. When no cluster has room right
+    now, the deployment goes where it fits by total size, to wait in the queue.
+    """
+    strategy = strategy or getattr(settings, 'SCHEDULER_PLACEMENT_STRATEGY', BEST_FIT)
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown placement strategy '{strategy}'")
+    demand = {'cpu': cpu, 'gpu': gpu, 'ram': ram}
+    ordering = 'score' if strategy == BEST_FIT else '-score'
+
+    fits_now = clusters.annotate(
+        free_cpu=F('total_cpu') - F('utilized_cpu'),
+        free_gpu=F('total_gpu') - F('utilized_gpu'),
+        free_ram=F('total_ram') - F('utilized_ram'),
+        score=_leftover_score(demand),
+    ).filter(free_cpu__gte=cpu, free_gpu__gte=gpu, free_ram__gte=ram)
+    cluster = fits_now.order_by(ordering, 'id').first()
+    if cluster is not None:
+        return cluster
+
+    fits_eventually = clusters.annotate(
+        score=_leftover_score(demand, free=False),
+    ).filter(total_cpu__gte=cpu, total_gpu__gte=gpu, total_ram__gte=ram)
+    return fits_eventually.order_by(ordering, 'id').first()
+
+
+def _leftover(cluster, demand, utilized):
+    """``_leftover_score`` for a loaded cluster, ``utilized`` being None to score against its totals"""
+    score = 0.0
+    for resource in RESOURCES:
+        total = getattr(cluster, f'total_{resource}')
+        if total:
+            available = total - utilized[resource] if utilized is not None else total
+            score += (available - demand[resource]) / total
+    return score
+
+
+def place_deployments(clusters, demands, strategy=None):
+    """Batch counterpart of choose_cluster, picking a cluster for each (cpu, gpu, ram) demand.
+
+    The candidates are read in one query and scored in Python like
+    choose_cluster scores them. Each placement takes its demand off the free
+    room the following ones see, so a batch spreads over the clusters instead
+    of piling onto the best fit. Returns a list parallel to ``demands``, with
+    None where no cluster can ever hold the deployment.
+    """
+    strategy = strategy or getattr(settings, 'SCHEDULER_PLACEMENT_STRATEGY', BEST_FIT)
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown placement strategy '{strategy}'")
+    sign = 1 if strategy == BEST_FIT else -1
+    clusters = list(clusters)
+    utilized = {
+        cluster.id: {resource: getattr(cluster, f'utilized_{resource}') for resource in RESOURCES}
+        for cluster in clusters
+    }
+
+    placements = []
+    for cpu, gpu, ram in demands:
+        demand = {'cpu': cpu, 'gpu': gpu, 'ram': ram}
+        fits_now = [
+            cluster for cluster in clusters
+            if all(getattr(cluster, f'total_{resource}') - utilized[cluster.id][resource] >= demand[resource]
+                   for resource in RESOURCES)
+        ]
+        if fits_now:
+            cluster = min(fits_now, key=lambda c: (sign * _leftover(c, demand, utilized[c.id]), c.id))
+            for resource in RESOURCES:
+                utilized[cluster.id][resource] += demand[resource]
+        else:
+            fits_eventually = [
+                cluster for cluster in clusters
+                if all(getattr(cluster, f'total_{resource}') >= demand[resource] for resource in RESOURCES)
+            ]
+            cluster = min(fits_eventually, key=lambda c: (sign * _leftover(c, demand, None), c.id), default=None)
+        placements.append(cluster)
+    return placements
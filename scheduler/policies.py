@@ -0,0 +1,62 @@
+import time
+from django.conf import settings
+from .queue_handler import HIGH_PRIORITY, priority_value
+
+
+class AgingPolicy:
+    """Order queued deployments by an effective priority that grows while they wait.
+
+    A deployment's effective priority is its own priority plus ``rate`` points
+    per minute of waiting, capped at ``max_boost`` points. Once a low priority
+    deployment ages up to the high priority level it competes with high
+    priority deployments, so it cannot be starved by a steady stream of them.
+
+    With ``backfill`` enabled, deployments below the high priority level may
+    also start while high priority deployments are waiting. They only get what
+    is left once every high priority candidate has been tried, which is
+    capacity none of the waiting high priority deployments fits in.
+    """
+
+    def __init__(self, rate=0.0, max_boost=None, backfill=False):
+        self.rate = rate
+        self.max_boost = max_boost
+        self.backfill = backfill
+
+    @classmethod
+    def from_settings(cls):
+        config = getattr(settings, 'SCHEDULER_AGING', {})
+        return cls(
+            rate=config.get('RATE', 0.0),
+            max_boost=config.get('MAX_BOOST'),
+            backfill=config.get('BACKFILL', False),
+        )
+
+    @property
+    def enabled(self):
+        return self.rate > 0 or self.backfill
+
+    def effective_priority(self, deployment_data, now=None):
+        priority = priority_value(deployment_data['priority'])
+        enqueued_at = deployment_data.get('enqueued_at')
+        if not self.rate or enqueued_at is None:
+            return priority
+        waited = max(0.0, (time.time() if now is None else now) - enqueued_at)
+        boost = self.rate * waited / 60
+        if self.max_boost is not None:
+            boost = min(boost, self.max_boost)
+        return priority + boost
+
+    def order(self, queued, high_waiting, now=None):
+        """Order queued deployments for a pass and drop the ones that must keep waiting.
+
+        ``queued`` is in queue order, so sorting is stable on arrival.
+        ``high_waiting`` says whether a high priority deployment is queued.
+        """
+        now = time.time() if now is None else now
+        ranked = sorted(queued, key=lambda deployment_data: -self.effective_priority(deployment_data, now))
+        if self.backfill:
+            return ranked
+        if high_waiting:
+            # Only deployments as urgent as high priority compete with it
+            return [d for d in ranked if self.effective_priority(d, now) >= HIGH_PRIORITY]
+        return ranked
@@ -0,0 +1,103 @@
+RESOURCES = ('cpu', 'gpu', 'ram')
+
+# Above this many running candidates the exact search is replaced by a greedy one
+EXACT_SEARCH_LIMIT = 12
+# High priority deployments a single pass looks for victims for, which bounds
+# the pass however many of them do not fit
+VICTIM_SEARCHES_PER_PASS = 8
+
+
+def _demand(deployment):
+    return [getattr(deployment, f'{resource}_required') for resource in RESOURCES]
+
+
+def _free(cluster):
+    return [getattr(cluster, f'total_{resource}') - getattr(cluster, f'utilized_{resource}') for resource in RESOURCES]
+
+
+def preemption_cost(cluster, deployment):
+    """Share of the cluster's resources a deployment holds, summed over resources"""
+    return sum(
+        required / total
+        for required, total in zip(_demand(deployment), (cluster.total_cpu, cluster.total_gpu, cluster.total_ram))
+        if total
+    )
+
+
+def _covers(shortfall, victims):
+    freed = [sum(values) for values in zip(*(_demand(victim) for victim in victims))] or [0, 0, 0]
+    return all(freed[i] >= shortfall[i] for i in range(len(RESOURCES)))
+
+
+def _cheapest_cover(shortfall, useful, cost):
+    """Exact search: the cheapest subset of ``useful`` covering the shortfall.
+
+    Branch and bound over subsets in index order, so among sets of equal cost
+    the smallest and then the first one found wins. A branch is cut once it
+    costs more than the best set so far or its remaining candidates cannot
+    cover the shortfall.
+    """
+    demands = [_demand(candidate) for candidate in useful]
+    costs = [cost[candidate.id] for candidate in useful]
+    # What the candidates from index i onwards free together
+    remaining = [[0.0] * len(RESOURCES) for _ in range(len(useful) + 1)]
+    for i in range(len(useful) - 1, -1, -1):
+        remaining[i] = [a + b for a, b in zip(remaining[i + 1], demands[i])]
+    best = []  # [cost, indices] of the best cover so far
+
+    def search(start, chosen, freed, total):
+        if best and (total, len(chosen)) >= (best[0], len(best[1])):
+            return
+        if all(freed[r] >= shortfall[r] for r in range(len(RESOURCES))):
+            best[:] = [total, list(chosen)]
+            return
+        for i in range(start, len(useful)):
+            if any(freed[r] + remaining[i][r] < shortfall[r] for r in range(len(RESOURCES))):
+                return
+            chosen.append(i)
+            search(i + 1, chosen, [a + b for a, b in zip(freed, demands[i])], total + costs[i])
+            chosen.pop()
+
+    search(0, [], [0.0] * len(RESOURCES), 0.0)
+    return [useful[i] for i in best[1]]
+
+
+def choose_victims(cluster, deployment, running):
+    """Pick the cheapest set of running deployments whose release makes room.
+
+    Returns the list of deployments to preempt, or None when stopping all of
+    ``running`` would still not make room. Up to EXACT_SEARCH_LIMIT candidates
+    the cheapest subset is searched exactly; beyond that, candidates are taken greedily by how
+    much of the shortfall they cover per unit of cost, then redundant ones are
+    dropped again.
+    """
+    shortfall = [max(0.0, need - free) for need, free in zip(_demand(deployment), _free(cluster))]
+    # Only deployments holding something that is short can help
+    useful = [
+        candidate for candidate in running
+        if any(shortfall[i] > 0 and amount > 0 for i, amount in enumerate(_demand(candidate)))
+    ]
+    if not _covers(shortfall, useful):
+        return None
+
+    cost = {candidate.id: preemption_cost(cluster, candidate) for candidate in useful}
+    if len(useful) <= EXACT_SEARCH_LIMIT:
+        return _cheapest_cover(shortfall, useful, cost)
+
+    def coverage(candidate):
+        return sum(
+            min(amount, short) / short
+            for amount, short in zip(_demand(candidate), shortfall) if short > 0
+        ) / (cost[candidate.id] or 1e-9)
+
+    victims = []
+    for candidate in sorted(useful, key=coverage, reverse=True):
+        victims.append(candidate)
+        if _covers(shortfall, victims):
+            break
+    # Drop the most expensive victims that turned out not to be needed
+    for victim in sorted(victims, key=lambda victim: cost[victim.id], reverse=True):
+        remaining = [other for other in victims if other is not victim]
+        if _covers(shortfall, remaining):
+            victims = remaining
+    return victims
@@ -1,73 +1,637 @@
+import asyncio
 import redis
+import redis.asyncio
 import json
+import logging
+import math
+import threading
+import time
+import weakref
+from redis.asyncio.retry import Retry as AsyncRetry
+from redis.backoff import ExponentialBackoff
+from redis.retry import Retry
 from datetime import datetime
+from django.conf import settings
 from api.models import Cluster, Deployment
 
+logger = logging.getLogger(__name__)
+
+# Named priorities accepted by the API, mapped onto the numeric priority scale.
+# Higher numbers are scheduled first.
+PRIORITY_LEVELS = {
+    'high': 10,
+    'low': 0,
+}
+HIGH_PRIORITY = PRIORITY_LEVELS['high']
+
+# Resolution of the capacity index, deployments whose demand falls in the
+# same step on every resource share a bucket
+DEFAULT_BUCKET_STEPS = {'cpu': 1, 'gpu': 1, 'ram': 4}
+
+
+# Connection settings of the scheduler's Redis, overridden by SCHEDULER_REDIS
+DEFAULT_REDIS = {
+    'URL': 'redis://localhost:6379/0',
+    'MAX_CONNECTIONS': 50,
+    'SOCKET_TIMEOUT': 5,  # seconds, also used to connect
+    'HEALTH_CHECK_INTERVAL': 30,  # seconds a connection may idle before it is checked with PING
+    'RETRIES': 3,  # retries with exponential backoff after a connection error or timeout
+    # Status streams block on their own pool, each open stream holds one of its connections
+    'STREAM_MAX_CONNECTIONS': 100,
+}
+
+_redis_client = None
+_stream_redis_client = None
+_redis_lock = threading.Lock()
+_async_redis_clients = weakref.WeakKeyDictionary()  # event loop -> asyncio client
+_async_stream_redis_clients = weakref.WeakKeyDictionary()
+_round_trips = threading.local()
+
+
+def redis_call_count():
+    """Round trips this thread has made through the shared client, for metrics"""
+    return getattr(_round_trips, 'count', 0)
+
+
+def _count_round_trip():
+    _round_trips.count = getattr(_round_trips, 'count', 0) + 1
+
+
+class CountingPipeline(redis.client.Pipeline):
+    def execute(self, raise_on_error=True):
+        _count_round_trip()
+        return super().execute(raise_on_error)
+
+
+class CountingRedis(redis.Redis):
+    """Redis client counting round trips per thread, a pipeline counts once"""
+
+    def execute_command(self, *args, **options):
+        _count_round_trip()
+        return super().execute_command(*args, **options)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return CountingPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
+def get_redis_client():
+    """Return the scheduler's shared Redis client, building it on first use.
+
+    Every caller shares one connection pool. The pool notices when the
+    process has forked and opens fresh connections in the child, so the
+    client is safe to build before a pre-fork server forks its workers.
+    """
+    global _redis_client
+    if _redis_client is None:
+        with _redis_lock:
+            if _redis_client is None:
+                config = _redis_config()
+                pool = redis.ConnectionPool.from_url(
+                    config['URL'],
+                    retry=Retry(ExponentialBackoff(cap=1.0, base=0.05), config['RETRIES']),
+                    **_pool_options(config),
+                )
+                _redis_client = CountingRedis(connection_pool=pool)
+    return _redis_client
+
+
+def get_async_redis_client():
+    """Return the asyncio Redis client of the running event loop, building it on first use.
+
+    Used by the async views. asyncio connections belong to the loop that
+    opened them, so every loop gets a pool of its own; an ASGI server runs
+    a single loop per process.
+    """
+    loop = asyncio.get_running_loop()
+    client = _async_redis_clients.get(loop)
+    if client is None:
+        config = _redis_config()
+        pool = redis.asyncio.ConnectionPool.from_url(
+            config['URL'],
+            retry=AsyncRetry(ExponentialBackoff(cap=1.0, base=0.05), config['RETRIES']),
+            **_pool_options(config),
+        )
+        client = _async_redis_clients[loop] = redis.asyncio.Redis(connection_pool=pool)
+    return client
+
+
+def get_stream_redis_client():
+    """Return the client status streams block on, with a pool apart from the shared one.
+
+    A stream waits on XREAD for as long as it is open, so streams would
+    otherwise hold connections the scheduler and the API need. When its
+    STREAM_MAX_CONNECTIONS are taken, new streams fail rather than them.
+    """
+    global _stream_redis_client
+    if _stream_redis_client is None:
+        with _redis_lock:
+            if _stream_redis_client is None:
+                config = _stream_config()
+                pool = redis.ConnectionPool.from_url(
+                    config['URL'],
+                    retry=Retry(ExponentialBackoff(cap=1.0, base=0.05), config['RETRIES']),
+                    **_pool_options(config),
+                )
+                _stream_redis_client = redis.Redis(connection_pool=pool)
+    return _stream_redis_client
+
+
+def get_async_stream_redis_client():
+    """Async counterpart of ``get_stream_redis_client``, one per event loop"""
+    loop = asyncio.get_running_loop()
+    client = _async_stream_redis_clients.get(loop)
+    if client is None:
+        config = _stream_config()
+        pool = redis.asyncio.ConnectionPool.from_url(
+            config['URL'],
+            retry=AsyncRetry(ExponentialBackoff(cap=1.0, base=0.05), config['RETRIES']),
+            **_pool_options(config),
+        )
+        client = _async_stream_redis_clients[loop] = redis.asyncio.Redis(connection_pool=pool)
+    return client
+
+
+def _redis_config():
+    return {**DEFAULT_REDIS, **getattr(settings, 'SCHEDULER_REDIS', {})}
+
+
+def _stream_config():
+    config = _redis_config()
+    return {**config, 'MAX_CONNECTIONS': config['STREAM_MAX_CONNECTIONS']}
+
+
+def _pool_options(config):
+    return {
+        'max_connections': config['MAX_CONNECTIONS'],
+        'socket_timeout': config['SOCKET_TIMEOUT'],
+        'socket_connect_timeout': config['SOCKET_TIMEOUT'],
+        'health_check_interval': config['HEALTH_CHECK_INTERVAL'],
+        'retry_on_error': [redis.ConnectionError, redis.TimeoutError],
+        'decode_responses': True,
+    }
+
+
+def reset_redis_client():
+    """Drop the shared clients, the next use builds new ones from the settings"""
+    global _redis_client, _stream_redis_client
+    with _redis_lock:
+        for client in (_redis_client, _stream_redis_client):
+            if client is not None:
+                client.connection_pool.disconnect()
+        _redis_client = _stream_redis_client = None
+        # asyncio connections can only be closed on their own loop, they are left to the garbage collector
+        _async_redis_clients.clear()
+        _async_stream_redis_clients.clear()
+
+
+def priority_value(priority):
+    """Convert a named or numeric priority to its numeric value"""
+    if isinstance(priority, str) and priority in PRIORITY_LEVELS:
+        return PRIORITY_LEVELS[priority]
+    return float(priority)
+
+
+def deployment_payload(deployment, **extra):
+    """Build the queue payload for a deployment saved in the database"""
+    return {
+        "user_id": deployment.user_id,
+        "cpu": deployment.cpu_required,
+        "gpu": deployment.gpu_required,
+        "ram": deployment.ram_required,
+        "docker_image": deployment.docker_image,
+        "priority": deployment.priority,
+        "deployment_id": deployment.id,
+        "cluster_id": deployment.cluster_id,
+        "is_scheduled": True,
+        **extra,
+    }
+
+
+# Each cluster has one sorted set scored by negated priority, so ZRANGE returns the
+# most urgent deployment first. Members are '<sequence>:<deployment_id>' with a zero
+# padded sequence per cluster, which makes deployments of equal priority come out FIFO.
+# Payloads live in a hash keyed by deployment id, and a second hash maps a
+# deployment id back to its member so it can be removed in O(log n).
+#
+# Queued deployments are also indexed by quantized demand: every bucket label
+# '<cpu>:<gpu>:<ram>' has its own sorted set with the same scores and members,
+# a set lists the non-empty labels and a hash maps deployment ids to labels.
+#
+# Queue status is kept up to date as entries come and go, so reading it costs
+# the same however deep the queue is: a hash sums the queued demand and a
+# sorted set scores deployment ids by arrival, its head being the oldest.
+#
+# All queue scripts share the same key layout:
+#   KEYS[1] queue sorted set      KEYS[2] payload hash     KEYS[3] member hash
+#   KEYS[4] bucket label hash     KEYS[5] bucket label set
+#   KEYS[6] queued demand hash    KEYS[7] arrival sorted set
+#   ARGV[1] bucket key prefix, the bucket sorted set is ARGV[1] .. label
+#
+# Every key of a cluster, the bucket sorted sets included, carries the cluster's
+# hash tag (see cluster_key), so a script only ever touches one Redis Cluster
+# slot. The bucket sorted sets are not declared in KEYS, there is one per label
+# in use; a proxy that routes on the declared keys alone still finds the slot
+# from KEYS[1].
+QUEUE_LUA_HELPERS = """
+local function count_demand(payload, sign)
+    local data = cjson.decode(payload)
+    for _, resource in ipairs({'cpu', 'gpu', 'ram'}) do
+        local amount = tonumber(data[resource])
+        if amount and amount ~= 0 then
+            redis.call('HINCRBYFLOAT', KEYS[6], resource, sign * amount)
+        end
+    end
+    return data
+end
+
+local function remove_entry(id, member)
+    redis.call('ZREM', KEYS[1], member)
+    local payload = redis.call('HGET', KEYS[2], id)
+    if payload then
+        count_demand(payload, -1)
+    end
+    redis.call('HDEL', KEYS[2], id)
+    redis.call('HDEL', KEYS[3], id)
+    redis.call('ZREM', KEYS[7], id)
+    if redis.call('ZCARD', KEYS[1]) == 0 then
+        -- Start the sums over from zero, floating point additions drift
+        redis.call('DEL', KEYS[6], KEYS[7])
+    end
+    local label = redis.call('HGET', KEYS[4], id)
+    if label then
+        local bucket = ARGV[1] .. label
+        redis.call('ZREM', bucket, member)
+        if redis.call('ZCARD', bucket) == 0 then
+            redis.call('SREM', KEYS[5], label)
+        end
+        redis.call('HDEL', KEYS[4], id)
+    end
+end
+
+local function member_id(member)
+    return string.match(member, ':(.*)$')
+end
+
+local function fetch_payloads(ids)
+    local payloads = {}
+    -- HMGET in chunks, unpack() is limited by the Lua stack size
+    for i = 1, #ids, 1000 do
+        local chunk = redis.call('HMGET', KEYS[2], unpack(ids, i, math.min(i + 999, #ids)))
+        for j = 1, #chunk do
+            payloads[#payloads + 1] = chunk[j]
+        end
+    end
+    return payloads
+end
+"""
+
+# KEYS[8] the cluster's sequence counter
+# ARGV[2] deployment id, ARGV[3] score, ARGV[4] payload, ARGV[5] bucket label
+ENQUEUE_SCRIPT = QUEUE_LUA_HELPERS + """
+local seq = redis.call('INCR', KEYS[8])
+local old = redis.call('HGET', KEYS[3], ARGV[2])
+if old then
+    remove_entry(ARGV[2], old)
+end
+local member = string.format('%015d:%s', seq, ARGV[2])
+redis.call('ZADD', KEYS[1], ARGV[3], member)
+redis.call('HSET', KEYS[2], ARGV[2], ARGV[4])
+redis.call('HSET', KEYS[3], ARGV[2], member)
+redis.call('ZADD', ARGV[1] .. ARGV[5], ARGV[3], member)
+redis.call('SADD', KEYS[5], ARGV[5])
+redis.call('HSET', KEYS[4], ARGV[2], ARGV[5])
+local data = count_demand(ARGV[4], 1)
+redis.call('ZADD', KEYS[7], tonumber(data['enqueued_at']) or 0, ARGV[2])
+return redis.call('ZCARD', KEYS[1])
+"""
+
+# ARGV[2] highest score to return, ARGV[3] maximum count or ''
+PEEK_SCRIPT = QUEUE_LUA_HELPERS + """
+local members
+if ARGV[3] == '' then
+    members = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[2])
+else
+    members = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[2], 'LIMIT', 0, ARGV[3])
+end
+local ids = {}
+for i, member in ipairs(members) do
+    ids[i] = member_id(member)
+end
+return fetch_payloads(ids)
+"""
+
+# ARGV[2] highest score to return
+# ARGV[3..5] free cpu, gpu and ram, ARGV[6..8] bucket steps for cpu, gpu and ram
+# Returns the payloads of every deployment whose bucket could fit, in queue order
+FEASIBLE_SCRIPT = QUEUE_LUA_HELPERS + """
+local free = {tonumber(ARGV[3]), tonumber(ARGV[4]), tonumber(ARGV[5])}
+local steps = {tonumber(ARGV[6]), tonumber(ARGV[7]), tonumber(ARGV[8])}
+local candidates = {}
+for _, label in ipairs(redis.call('SMEMBERS', KEYS[5])) do
+    local lower = {string.match(label, '^(%d+):(%d+):(%d+)$')}
+    local fits = #lower == 3
+    for i = 1, #lower do
+        -- The smallest demand in the bucket is its lower bound
+        if tonumber(lower[i]) * steps[i] > free[i] + 1e-9 then
+            fits = false
+        end
+    end
+    if fits then
+        local entries = redis.call('ZRANGEBYSCORE', ARGV[1] .. label, '-inf', ARGV[2], 'WITHSCORES')
+        for i = 1, #entries, 2 do
+            candidates[#candidates + 1] = {entries[i], tonumber(entries[i + 1])}
+        end
+    end
+end
+table.sort(candidates, function(a, b)
+    if a[2] ~= b[2] then
+        return a[2] < b[2]
+    end
+    return a[1] < b[1]
+end)
+local ids = {}
+for i, candidate in ipairs(candidates) do
+    ids[i] = member_id(candidate[1])
+end
+return fetch_payloads(ids)
+"""
+
+POP_SCRIPT = QUEUE_LUA_HELPERS + """
+local popped = redis.call('ZRANGE', KEYS[1], 0, 0)
+if #popped == 0 then
+    return false
+end
+local id = member_id(popped[1])
+local payload = redis.call('HGET', KEYS[2], id)
+remove_entry(id, popped[1])
+return payload
+"""
+
+# ARGV[2..] deployment ids
+REMOVE_SCRIPT = QUEUE_LUA_HELPERS + """
+local removed = 0
+for i = 2, #ARGV do
+    local member = redis.call('HGET', KEYS[3], ARGV[i])
+    if member then
+        remove_entry(ARGV[i], member)
+        removed = removed + 1
+    end
+end
+return removed
+"""
+
+CLEAR_SCRIPT = QUEUE_LUA_HELPERS + """
+for _, label in ipairs(redis.call('SMEMBERS', KEYS[5])) do
+    redis.call('DEL', ARGV[1] .. label)
+end
+return redis.call('DEL', KEYS[1], KEYS[2], KEYS[3], KEYS[4], KEYS[5], KEYS[6], KEYS[7])
+"""
+
+
+def cluster_key(cluster_id, name):
+    """Name one of a cluster's Redis keys, hash tagged so all of them share a Redis Cluster slot"""
+    return f'{{cluster_{cluster_id}}}_{name}'
+
+
 class RedisQueue:
-    def __init__(self):
+
+    def __init__(self, redis_client=None, async_redis_client=None):
+        # Without a client of its own the queue uses the shared one, built on
+        # first use, so importing this module never touches Redis
+        self._redis_client = redis_client
+        self._async_redis_client = async_redis_client
+        self._scripts = {}
+        self._async_scripts = {}
+
+    @property
+    def redis_client(self):
+        return self._redis_client or get_redis_client()
+
+    @property
+    def async_redis_client(self):
+        return self._async_redis_client or get_async_redis_client()
+
+    def _script(self, source):
+        """Return the registered Lua script for ``source``, registering it on first use"""
+        client = self.redis_client
+        script = self._scripts.get(source)
+        if script is None or script.registered_client is not client:
+            script = self._scripts[source] = client.register_script(source)
+        return script
+
+    def _async_script(self, source):
+        """Return the Lua script for ``source`` registered with the asyncio client"""
+        client = self.async_redis_client
+        script = self._async_scripts.get(source)
+        if script is None or script.registered_client is not client:
+            script = self._async_scripts[source] = client.register_script(source)
+        return script
+
+    @property
+    def bucket_steps(self):
+        return {**DEFAULT_BUCKET_STEPS, **getattr(settings, 'SCHEDULER_BUCKET_STEPS', {})}
+
+    def get_queue_key(self, cluster_id):
+        """Generate the sorted set key for a specific cluster"""
+        return cluster_key(cluster_id, 'queue')
+
+    def get_items_key(self, cluster_id):
+        """Generate the hash key holding queued deployment payloads"""
+        return cluster_key(cluster_id, 'queue_items')
+
+    def get_members_key(self, cluster_id):
+        """Generate the hash key mapping deployment ids to sorted set members"""
+        return cluster_key(cluster_id, 'queue_members')
+
+    def get_bucket_prefix(self, cluster_id):
+        """Generate the key prefix of the cluster's capacity bucket sorted sets"""
+        return cluster_key(cluster_id, 'bucket_')
+
+    def get_demand_key(self, cluster_id):
+        """Generate the hash key summing the cluster's queued demand"""
+        return cluster_key(cluster_id, 'queue_demand')
+
+    def get_arrivals_key(self, cluster_id):
+        """Generate the sorted set key scoring queued deployment ids by arrival"""
+        return cluster_key(cluster_id, 'queue_arrivals')
+
+    def get_script_keys(self, cluster_id):
+        """Keys shared by every queue script, see QUEUE_LUA_HELPERS"""
+        return [
+            self.get_queue_key(cluster_id),
+            self.get_items_key(cluster_id),
+            self.get_members_key(cluster_id),
+            cluster_key(cluster_id, 'queue_buckets'),
+            cluster_key(cluster_id, 'bucket_labels'),
+            self.get_demand_key(cluster_id),
+            self.get_arrivals_key(cluster_id),
+        ]
+
+    def bucket_label(self, deployment_data):
+        """Quantize a deployment's demand into its capacity bucket label"""
+        steps = self.bucket_steps
         try:
-            self.redis_client = redis.Redis(
-                host='localhost', 
-                port=6379, 
-                db=0,
-                decode_responses=True  # Add this for proper string handling
+            return ':'.join(
+                str(max(0, math.floor(float(deployment_data[resource]) / steps[resource])))
+                for resource in ('cpu', 'gpu', 'ram')
             )
-            # Test connection
-            self.redis_client.ping()
-            print("Successfully connected to Redis")
-        except redis.ConnectionError as e:
-            print(f"Failed to connect to Redis: {e}")
-            raise
-        except Exception as e:
-            print(f"Unexpected error while connecting to Redis: {e}")
-            raise
+        except (KeyError, TypeError, ValueError):
+            # Unknown demand, index it as the smallest bucket so it is always a candidate
+            return '0:0:0'
 
-    def get_queue_key(self, cluster_id, priority):
-        """Generate queue key for specific cluster and priority"""
-        return f'cluster_{cluster_id}_{priority}_queue'
+    def _enqueue_arguments(self, deployment_data, cluster_id):
+        """Keys and arguments of ENQUEUE_SCRIPT for a deployment"""
+        priority = priority_value(deployment_data['priority'])
+        deployment_data = dict(deployment_data)
+        # Keep the original arrival time when a deployment is re-queued
+        deployment_data.setdefault('enqueued_at', time.time())
+        return {
+            'keys': self.get_script_keys(cluster_id) + [cluster_key(cluster_id, 'queue_sequence')],
+            'args': [
+                self.get_bucket_prefix(cluster_id),
+                deployment_data['deployment_id'],
+                -priority,
+                json.dumps(deployment_data),
+                self.bucket_label(deployment_data),
+            ],
+        }
 
     def enqueue_deployment(self, deployment_data, cluster_id):
-        """Add deployment to appropriate cluster's priority queue"""
+        """Add deployment to the cluster's queue, ordered by priority then arrival"""
         try:
-            priority = deployment_data['priority']
-            queue_key = self.get_queue_key(cluster_id, priority)
-            
-            # Debug prints
-            print(f"Attempting to push to queue: {queue_key}")
-            print(f"Data being pushed: {deployment_data}")
-            
-            result = self.redis_client.lpush(queue_key, json.dumps(deployment_data))
-            print(f"Push result: {result}")
-            
-            return result
-        except redis.ConnectionError as e:
-            print(f"Redis connection error: {e}")
-            raise
-        except Exception as e:
-            print(f"Error pushing to queue: {e}")
+            return self._script(ENQUEUE_SCRIPT)(**self._enqueue_arguments(deployment_data, cluster_id))
+        except redis.RedisError as e:
+            logger.warning("Failed to queue deployment %s on cluster %s: %s",
+                           deployment_data.get('deployment_id'), cluster_id, e)
             raise
 
+    def enqueue_deployments(self, deployments):
+        """Add many deployments, given as (deployment data, cluster id) pairs, in one round trip"""
+        pipe = self.redis_client.pipeline(transaction=False)
+        script = self._script(ENQUEUE_SCRIPT)
+        for deployment_data, cluster_id in deployments:
+            script(client=pipe, **self._enqueue_arguments(deployment_data, cluster_id))
+        return pipe.execute()
+
+    async def aenqueue_deployment(self, deployment_data, cluster_id):
+        """Async counterpart of ``enqueue_deployment``"""
+        return await self._async_script(ENQUEUE_SCRIPT)(**self._enqueue_arguments(deployment_data, cluster_id))
+
+    def _max_score(self, min_priority):
+        return '+inf' if min_priority is None else -priority_value(min_priority)
+
+    def peek_deployments(self, cluster_id, min_priority=None, count=None):
+        """Read queued deployments from the head of the queue without removing them.
+
+        Only deployments with a priority of at least ``min_priority`` are returned,
+        at most ``count`` of them, most urgent first.
+        """
+        payloads = self._script(PEEK_SCRIPT)(
+            keys=self.get_script_keys(cluster_id),
+            args=[self.get_bucket_prefix(cluster_id), self._max_score(min_priority), '' if count is None else count],
+        )
+        return [json.loads(payload) for payload in payloads if payload]
+
+    def feasible_deployments(self, cluster_id, free_cpu, free_gpu, free_ram, min_priority=None):
+        """Read the queued deployments that may fit in the given free resources.
+
+        Only the capacity buckets whose lower bound fits are read, so the cost
+        follows the number of candidates rather than the queue depth. Candidates
+        come back in queue order and still need an exact fit check.
+        """
+        steps = self.bucket_steps
+        payloads = self._script(FEASIBLE_SCRIPT)(
+            keys=self.get_script_keys(cluster_id),
+            args=[
+                self.get_bucket_prefix(cluster_id), self._max_score(min_priority),
+                free_cpu, free_gpu, free_ram,
+                steps['cpu'], steps['gpu'], steps['ram'],
+            ],
+        )
+        return [json.loads(payload) for payload in payloads if payload]
+
+    def remove_deployments(self, cluster_id, deployment_ids):
+        """Remove deployments from the cluster's queue, returns how many were queued"""
+        if not deployment_ids:
+            return 0
+        return self._script(REMOVE_SCRIPT)(
+            keys=self.get_script_keys(cluster_id),
+            args=[self.get_bucket_prefix(cluster_id), *deployment_ids],
+        )
+
     def get_next_deployment(self, cluster_id):
-        """Get next deployment for specific cluster prioritizing high priority queue"""
-        # First try high priority queue for this cluster
-        high_queue_key = self.get_queue_key(cluster_id, 'high')
-        deployment_data = self.redis_client.rpop(high_queue_key)
-        
-        if not deployment_data:
-            # If no high priority deployments, try low priority
-            low_queue_key = self.get_queue_key(cluster_id, 'low')
-            deployment_data = self.redis_client.rpop(low_queue_key)
-        
+        """Pop the most urgent deployment for a specific cluster"""
+        deployment_data = self._script(POP_SCRIPT)(
+            keys=self.get_script_keys(cluster_id),
+            args=[self.get_bucket_prefix(cluster_id)],
+        )
         return json.loads(deployment_data) if deployment_data else None
 
+    def _count_priorities(self, pipe, cluster_id):
+        queue_key = self.get_queue_key(cluster_id)
+        pipe.zcount(queue_key, '-inf', -HIGH_PRIORITY)
+        pipe.zcount(queue_key, f'({-HIGH_PRIORITY}', '+inf')
+        return pipe
+
     def get_queue_length(self, cluster_id):
         """Get queue lengths for a specific cluster"""
-        high_queue_key = self.get_queue_key(cluster_id, 'high')
-        low_queue_key = self.get_queue_key(cluster_id, 'low')
-        
+        pipe = self._count_priorities(self.redis_client.pipeline(transaction=False), cluster_id)
+        high, low = pipe.execute()
+
         return {
-            'high_priority': self.redis_client.llen(high_queue_key),
-            'low_priority': self.redis_client.llen(low_queue_key)
+            'high_priority': high,
+            'low_priority': low
         }
 
-queue_instance = RedisQueue()
\ No newline at end of file
+    async def aget_queue_length(self, cluster_id):
+        """Async counterpart of ``get_queue_length``"""
+        pipe = self._count_priorities(self.async_redis_client.pipeline(transaction=False), cluster_id)
+        high, low = await pipe.execute()
+        return {'high_priority': high, 'low_priority': low}
+
+    def _read_status(self, pipe, cluster_ids):
+        for cluster_id in cluster_ids:
+            self._count_priorities(pipe, cluster_id)
+            pipe.zrange(self.get_arrivals_key(cluster_id), 0, 0, withscores=True)
+            pipe.hmget(self.get_demand_key(cluster_id), ['cpu', 'gpu', 'ram'])
+        return pipe
+
+    def get_queue_status(self, cluster_ids, now=None):
+        """Queue lengths, oldest wait and queued demand for many clusters in one round trip.
+
+        Returns a dict mapping each cluster id to its status. ``oldest_age`` is
+        in seconds and None when nothing is queued. Reads the counters the queue
+        scripts maintain, never the queued payloads.
+        """
+        cluster_ids = list(cluster_ids)
+        pipe = self._read_status(self.redis_client.pipeline(transaction=False), cluster_ids)
+        return self._status_report(cluster_ids, pipe.execute(), now)
+
+    async def aget_queue_status(self, cluster_ids, now=None):
+        """Async counterpart of ``get_queue_status``"""
+        cluster_ids = list(cluster_ids)
+        pipe = self._read_status(self.async_redis_client.pipeline(transaction=False), cluster_ids)
+        return self._status_report(cluster_ids, await pipe.execute(), now)
+
+    def _status_report(self, cluster_ids, replies, now=None):
+        now = now or time.time()
+        report = {}
+        for index, cluster_id in enumerate(cluster_ids):
+            high, low, oldest, demand = replies[4 * index:4 * index + 4]
+            report[cluster_id] = {
+                'high_priority': high,
+                'low_priority': low,
+                'oldest_age': round(max(0.0, now - oldest[0][1]), 3) if oldest else None,
+                # Entries queued before the counters existed can leave them slightly low
+                'demand': {
+                    resource: max(0.0, float(amount or 0))
+                    for resource, amount in zip(('cpu', 'gpu', 'ram'), demand)
+                },
+            }
+        return report
+
+    def clear_queue(self, cluster_id):
+        """Drop every queued deployment for a cluster"""
+        self._script(CLEAR_SCRIPT)(keys=self.get_script_keys(cluster_id), args=[self.get_bucket_prefix(cluster_id)])
+
+queue_instance = RedisQueue()
@@ -1,11 +1,39 @@
+import logging
+from django.conf import settings
 from api.models import Cluster, Deployment
-from .queue_handler import queue_instance
+from .models import Preemption
+from .queue_handler import queue_instance, deployment_payload, priority_value, HIGH_PRIORITY
+from .engines import get_engine
+from .capacity import get_capacity_cache
+from .preemption import VICTIM_SEARCHES_PER_PASS, choose_victims, preemption_cost
+from .accounting import RESOURCES, CapacityConflict, reserve
+from .policies import AgingPolicy
+from .stats import record_wait_times
+from .metrics import metrics, record_pass
+from .status import PREEMPTED, QUEUED, RUNNING, publish_transitions
+from api.response_cache import UTILIZATION, invalidate_listings
 from django.db import transaction
-import json
+from django.db.models import F
+
+logger = logging.getLogger(__name__)
+
+# Passes planned again when a concurrent change invalidates the plan
+PASS_ATTEMPTS = 3
 
 class DeploymentScheduler:
-    def __init__(self):
-        self.queue = queue_instance
+    def __init__(self, queue=None):
+        # Any object with RedisQueue's interface, e.g. InMemoryQueue for benchmarks
+        self.queue = queue or queue_instance
+        # Optional engine running the whole pass server-side, see SCHEDULER_ENGINE,
+        # and Redis copy of cluster capacity, see SCHEDULER_CAPACITY_CACHE. Both
+        # need the queue to live in Redis.
+        in_redis = self.queue.redis_client is not None
+        self.engine = get_engine(self.queue) if in_redis else None
+        self.capacity = get_capacity_cache(self.queue) if in_redis else None
+        # Aging and backfill, see SCHEDULER_AGING
+        self.policy = AgingPolicy.from_settings()
+        # Stop running low priority deployments to make room for high priority ones
+        self.preemption = getattr(settings, 'SCHEDULER_PREEMPTION', False)
 
     def can_deploy(self, cluster, deployment):
         """Check if deployment can fit in cluster"""
@@ -16,67 +44,222 @@ class DeploymentScheduler:
         )
 
     def process_cluster_queue(self, cluster_id):
-        """Process deployments for a specific cluster - only process low priority when high is empty"""
-        def process_priority_queue(priority):
-            """Process all deployments in a specific priority queue"""
-            processed_deployments = set()  # Track processed deployments to avoid infinite loop
-            while True:
-                # Get next deployment from the priority queue 
-                queue_key = self.queue.get_queue_key(cluster_id, priority)
-                deployment_data_bytes = self.queue.redis_client.lindex(queue_key, -1)  # Peek at last deployment 
-                
-                if not deployment_data_bytes:
-                    break  # Queue is empty
-                   
-                deployment_data = json.loads(deployment_data_bytes)
-                deployment_id = deployment_data['deployment_id']
-               
-                if deployment_id in processed_deployments:
-                    # We've seen this deployment before, stop processing
-                    break
-                
-                self.queue.redis_client.rpop(queue_key)  
-                processed_deployments.add(deployment_id)
-               
-                try:
-                    deployment = Deployment.objects.get(id=deployment_id)
-                    cluster = Cluster.objects.get(id=cluster_id)
-
-                    if self.can_deploy(cluster, deployment):
-                        # Only now remove it from queue since we can deploy it
-                        # self.queue.redis_client.rpop(queue_key)
-                       
-                        
-                            # Update cluster resource utilization
-                        cluster.utilized_cpu += deployment.cpu_required
-                        cluster.utilized_gpu += deployment.gpu_required
-                        cluster.utilized_ram += deployment.ram_required
-                        cluster.save()
-
-                        # Update deployment status
-                        deployment.status = 'running'
-                        deployment.cluster = cluster
-                        deployment.save()
-                    else:
-                        # Can't deploy now, leave it in queue and try next
-                        self.queue.enqueue_deployment(deployment_data, cluster_id)
-                       
-                        continue
-
-                except (Deployment.DoesNotExist, Cluster.DoesNotExist):
-                    # Remove invalid deployments from queue
-                    self.queue.redis_client.rpop(queue_key)
-                    continue
-                except Exception as e:
-                    print(f"Error processing deployment {deployment_id}: {str(e)}")
-                    continue
+        """Process deployments for a specific cluster - only process low priority when high is empty.
+
+        Returns the ids of the deployments that were started.
+        """
+        return record_pass(cluster_id, lambda: self._process_cluster_queue(cluster_id))
+
+    def _process_cluster_queue(self, cluster_id):
+        """Run one pass, returns the started ids and how many queued deployments were examined"""
+        if self.engine is not None:
+            # The Lua pass examines the queue inside Redis
+            started_ids = self.engine.process_cluster_queue(cluster_id)
+            if started_ids:
+                transitions = [
+                    (deployment_id, cluster_id, organization_id, RUNNING)
+                    for deployment_id, organization_id in
+                    Deployment.objects.filter(id__in=started_ids).values_list('id', 'user__organization_id')
+                ]
+                publish_transitions(transitions, redis_client=self.queue.redis_client)
+                invalidate_listings({organization_id for _, _, organization_id, _ in transitions}, UTILIZATION)
+            return started_ids, len(started_ids)
 
         # First check if high priority queue has any deployments
         queue_length = self.queue.get_queue_length(cluster_id)
-        print(queue_length)
-        # Process high priority queue
-        process_priority_queue('high')
+        metrics.set('scheduler_queue_depth', queue_length['high_priority'], cluster=cluster_id, priority='high')
+        metrics.set('scheduler_queue_depth', queue_length['low_priority'], cluster=cluster_id, priority='low')
+        if not queue_length['high_priority'] and not queue_length['low_priority']:
+            return [], 0
+
+        for _ in range(PASS_ATTEMPTS):
+            try:
+                queued, started, finished, preemptions = self.run_pass(cluster_id, queue_length)
+                break
+            except CapacityConflict:
+                # Another worker started, stopped or preempted something meanwhile, plan again
+                logger.info("Capacity of cluster %s changed during a pass, retrying", cluster_id)
+        else:
+            # The next scheduling event runs another pass
+            return [], 0
+
+        if preemptions:
+            # Back in the queue in one round trip, before anything else, as the
+            # database already has them queued
+            self.queue.enqueue_deployments([
+                (deployment_payload(preemption.preempted), cluster_id) for preemption in preemptions
+            ])
+        self.queue.remove_deployments(cluster_id, finished)
+        for preemption in preemptions:
+            logger.info(
+                "Preempted deployment %s on cluster %s for deployment %s (cost %.3f)",
+                preemption.preempted_id, cluster_id, preemption.deployment_id, preemption.cost,
+            )
+        started_ids = [deployment.id for deployment in started]
+        if started_ids and self.queue.redis_client is not None:
+            record_wait_times(queued, started_ids, redis_client=self.queue.redis_client)
+            transitions = []
+            for preemption in preemptions:
+                victim = preemption.preempted
+                transitions.append((victim.id, cluster_id, victim.organization_id, PREEMPTED))
+                transitions.append((victim.id, cluster_id, victim.organization_id, QUEUED))
+            transitions.extend((deployment.id, cluster_id, deployment.organization_id, RUNNING) for deployment in started)
+            publish_transitions(transitions, redis_client=self.queue.redis_client)
+        if started_ids:
+            # Deployments only run on clusters of their owner's organization
+            invalidate_listings({deployment.organization_id for deployment in started}, UTILIZATION)
+        return started_ids, len(queued)
+
+    def read_candidates(self, cluster, queue_length, now=None):
+        """Read the queued deployments a pass on ``cluster`` tries, in the order to try them"""
+        # Low priority is only considered when no high priority deployment is
+        # waiting, unless aging or backfill may let it through
+        high_waiting = queue_length['high_priority'] > 0
+        min_priority = HIGH_PRIORITY if high_waiting and not self.policy.enabled else None
+
+        if self.preemption:
+            # Deployments that do not fit may still start by preempting others
+            queued = self.queue.peek_deployments(cluster.id, min_priority=min_priority)
+        else:
+            # Only read the queued deployments whose capacity bucket can fit in
+            # what is free, in queue order. Nothing is popped, so deployments
+            # that do not fit keep their place.
+            queued = self.queue.feasible_deployments(
+                cluster.id,
+                cluster.total_cpu - cluster.utilized_cpu,
+                cluster.total_gpu - cluster.utilized_gpu,
+                cluster.total_ram - cluster.utilized_ram,
+                min_priority=min_priority,
+            )
+        if self.policy.enabled:
+            queued = self.policy.order(queued, high_waiting, now)
+        return queued
+
+    def run_pass(self, cluster_id, queue_length):
+        """Plan a pass on a snapshot of the cluster, then commit it with conditional updates.
+
+        Nothing is locked while planning. The commit only moves deployments
+        that are still in the status the plan saw and reserves the net demand
+        with reserve(), or in the capacity cache when enabled, which refuses to
+        exceed the cluster's totals. If any of that fails, CapacityConflict
+        rolls the whole commit back.
+
+        Returns the queued payloads read, the started deployments, the ids to
+        drop from the queue and the Preemption records.
+        """
+        if self.capacity is not None:
+            cluster = self.capacity.get_cluster(cluster_id)
+        else:
+            cluster = Cluster.objects.filter(id=cluster_id).first()
+        if cluster is None:
+            # Remove invalid deployments from queue
+            self.queue.clear_queue(cluster_id)
+            return [], [], [], []
+
+        queued = self.read_candidates(cluster, queue_length)
+        if not queued:
+            return [], [], [], []
+
+        queued_ids = [deployment_data['deployment_id'] for deployment_data in queued]
+        # The owner's organization routes status transitions, joined in rather than queried
+        deployments = Deployment.objects.annotate(organization_id=F('user__organization_id')).in_bulk(queued_ids)
+        started, finished, preemptions = self.plan_pass(
+            cluster, queued_ids, deployments,
+            load_running=lambda: list(Deployment.objects.annotate(organization_id=F('user__organization_id')).filter(
+                cluster=cluster, status='running', priority='low')),
+        )
+        if not started:
+            return queued, started, finished, preemptions
+
+        preempted = [preemption.preempted for preemption in preemptions]
+        demand = [
+            sum(getattr(deployment, f'{resource}_required') for deployment in started)
+            - sum(getattr(victim, f'{resource}_required') for victim in preempted)
+            for resource in RESOURCES
+        ]
+        reserved = False
+        try:
+            with transaction.atomic():
+                if preempted:
+                    preempted_ids = [victim.id for victim in preempted]
+                    if Deployment.objects.filter(id__in=preempted_ids, status='running').update(status='queued') != len(preempted):
+                        raise CapacityConflict(cluster_id)
+                started_ids = [deployment.id for deployment in started]
+                if Deployment.objects.filter(id__in=started_ids, status='queued').update(status='running', cluster=cluster) != len(started):
+                    raise CapacityConflict(cluster_id)
+                if self.capacity is not None:
+                    reserved = self.capacity.reserve(cluster_id, *demand)
+                else:
+                    reserved = reserve(cluster_id, *demand)
+                if not reserved:
+                    raise CapacityConflict(cluster_id)
+                if preemptions:
+                    Preemption.objects.bulk_create(preemptions)
+        except Exception:
+            if reserved and self.capacity is not None:
+                # Redis is not part of the transaction, give the reservation back
+                self.capacity.release(cluster_id, *demand)
+            raise
+        return queued, started, finished, preemptions
+
+    def plan_pass(self, cluster, queued_ids, deployments, load_running=None):
+        """Decide which queued deployments start, in queue order.
+
+        ``deployments`` maps ids to Deployment objects. The cluster and started
+        deployments are updated in memory only. Returns the started deployments,
+        the ids to drop from the queue (started or no longer valid) and unsaved
+        Preemption records for running deployments sent back to the queue.
+
+        With preemption enabled, ``load_running`` returns the running low
+        priority deployments of the cluster. It is only called once a high
+        priority deployment does not fit. Victims are searched for at most
+        VICTIM_SEARCHES_PER_PASS deployments, the others wait for a later pass.
+        """
+        started = []
+        finished = []
+        preemptions = []
+        running = None
+        searches = 0
+        for deployment_id in queued_ids:
+            deployment = deployments.get(deployment_id)
+
+            if deployment is None or deployment.status != 'queued':
+                # Deleted, or already started or stopped elsewhere
+                finished.append(deployment_id)
+                continue
+
+            if not self.can_deploy(cluster, deployment):
+                if not (self.preemption and load_running and priority_value(deployment.priority) >= HIGH_PRIORITY):
+                    # Leave it in the queue and try the next one
+                    continue
+                if searches >= VICTIM_SEARCHES_PER_PASS:
+                    continue
+                searches += 1
+                if running is None:
+                    running = load_running()
+                victims = choose_victims(cluster, deployment, running)
+                if not victims:
+                    continue
+                for victim in victims:
+                    running.remove(victim)
+                    preemptions.append(Preemption(
+                        cluster=cluster, preempted=victim, deployment=deployment,
+                        cost=preemption_cost(cluster, victim),
+                    ))
+                    cluster.utilized_cpu -= victim.cpu_required
+                    cluster.utilized_gpu -= victim.gpu_required
+                    cluster.utilized_ram -= victim.ram_required
+                    victim.status = 'queued'
+
+            # Update cluster resource utilization
+            cluster.utilized_cpu += deployment.cpu_required
+            cluster.utilized_gpu += deployment.gpu_required
+            cluster.utilized_ram += deployment.ram_required
+
+            # Update deployment status
+            deployment.status = 'running'
+            deployment.cluster = cluster
+            started.append(deployment)
+            finished.append(deployment_id)
 
-        # Only process low priority if high priority queue is empty
-        if queue_length['high_priority'] == 0:
-            process_priority_queue('low')
+        return started, finished, preemptions
@@ -0,0 +1,123 @@
+import bisect
+import hashlib
+import time
+from .queue_handler import queue_instance
+
+WORKERS_KEY = 'scheduler_workers'
+
+# Extend a lease only if this worker still holds it
+RENEW_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+# Drop a lease only if this worker still holds it
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+def _hash(value):
+    return int.from_bytes(hashlib.md5(str(value).encode()).digest()[:8], 'big')
+
+
+class HashRing:
+    """Consistent hash ring mapping cluster ids onto worker ids.
+
+    Each worker is placed on the ring ``replicas`` times, so adding or removing
+    a worker only moves the clusters that hash next to it.
+    """
+
+    def __init__(self, workers, replicas=64):
+        self.workers = sorted(workers)
+        points = sorted((_hash(f'{worker}#{i}'), worker) for worker in self.workers for i in range(replicas))
+        self._hashes = [point for point, _ in points]
+        self._owners = [worker for _, worker in points]
+
+    def owner(self, cluster_id):
+        if not self._hashes:
+            return None
+        index = bisect.bisect(self._hashes, _hash(cluster_id)) % len(self._hashes)
+        return self._owners[index]
+
+
+class ShardCoordinator:
+    """Partition clusters across scheduler workers and guard them with leases.
+
+    Workers announce themselves with a heartbeat in a sorted set scored by
+    expiry time, and the live ones form the hash ring. A worker only
+    schedules a cluster while it holds that cluster's lease. Leases expire
+    after ``lease_ttl`` seconds unless renewed, so the clusters of a dead
+    worker move to the others once both its heartbeat and leases lapse.
+    """
+
+    def __init__(self, worker_id, lease_ttl=10.0, redis_client=None):
+        self.worker_id = worker_id
+        self.lease_ttl = lease_ttl
+        self.redis_client = redis_client or queue_instance.redis_client
+        self.ring = HashRing([worker_id])
+        self.held = set()
+        self._renew = self.redis_client.register_script(RENEW_SCRIPT)
+        self._release = self.redis_client.register_script(RELEASE_SCRIPT)
+
+    def get_lease_key(self, cluster_id):
+        return f'cluster_{cluster_id}_lease'
+
+    def heartbeat(self):
+        """Announce this worker and refresh the ring, returns True if the ring changed"""
+        now = time.time()
+        pipe = self.redis_client.pipeline()
+        pipe.zadd(WORKERS_KEY, {self.worker_id: now + self.lease_ttl})
+        pipe.zremrangebyscore(WORKERS_KEY, '-inf', now)
+        pipe.zrange(WORKERS_KEY, 0, -1)
+        workers = pipe.execute()[-1]
+        if sorted(workers) == self.ring.workers:
+            return False
+        self.ring = HashRing(workers)
+        return True
+
+    def owns(self, cluster_id):
+        return self.ring.owner(cluster_id) == self.worker_id
+
+    def acquire(self, cluster_id):
+        """Take the cluster's lease, returns False if another worker holds it"""
+        if cluster_id in self.held:
+            return True
+        if self.redis_client.set(self.get_lease_key(cluster_id), self.worker_id, nx=True, px=int(self.lease_ttl * 1000)):
+            self.held.add(cluster_id)
+            return True
+        return False
+
+    def renew(self):
+        """Extend every held lease, forgetting the ones that were lost"""
+        held = list(self.held)
+        pipe = self.redis_client.pipeline()
+        for cluster_id in held:
+            self._renew(keys=[self.get_lease_key(cluster_id)], args=[self.worker_id, int(self.lease_ttl * 1000)], client=pipe)
+        for cluster_id, renewed in zip(held, pipe.execute()):
+            if not renewed:
+                self.held.discard(cluster_id)
+
+    def release(self, cluster_id):
+        self.held.discard(cluster_id)
+        self._release(keys=[self.get_lease_key(cluster_id)], args=[self.worker_id])
+
+    def release_unowned(self, busy=()):
+        """Give up the leases of clusters the ring now assigns to other workers.
+
+        Clusters in ``busy`` keep their lease until their pass has finished.
+        """
+        for cluster_id in [cluster_id for cluster_id in self.held if not self.owns(cluster_id)]:
+            if cluster_id not in busy:
+                self.release(cluster_id)
+
+    def leave(self):
+        """Release every lease and leave the ring, e.g. on shutdown"""
+        for cluster_id in list(self.held):
+            self.release(cluster_id)
+        self.redis_client.zrem(WORKERS_KEY, self.worker_id)
@@ -0,0 +1,225 @@
+import csv
+import heapq
+import random
+import time
+from api.models import Cluster, Deployment
+from .memory import InMemoryQueue
+from .policies import AgingPolicy
+from .scheduler import DeploymentScheduler
+from .stats import PERCENTILES, percentile
+
+# Trace files are CSV with this header. 'cluster' rows declare a cluster with
+# id 'id' and totals 'cpu', 'gpu' and 'ram'. 'submit' rows queue deployment 'id'
+# on 'cluster' and 'stop' rows stop or cancel it. Times are in seconds.
+TRACE_FIELDS = ['time', 'event', 'id', 'cluster', 'cpu', 'gpu', 'ram', 'priority']
+
+# Policies the simulator compares, as keyword arguments for Simulation
+POLICIES = {
+    'fifo': {},
+    'aging': {'policy': AgingPolicy(rate=1.0, max_boost=20)},
+    'backfill': {'policy': AgingPolicy(backfill=True)},
+    'preemption': {'preemption': True},
+}
+
+RESOURCES = ('cpu', 'gpu', 'ram')
+
+# Deployments are built with Model.from_db, which skips the keyword handling of
+# Model.__init__ and more than halves the cost of a submit. Values follow the
+# model's field order.
+DEPLOYMENT_FIELDS = ('id', 'ram_required', 'cpu_required', 'gpu_required', 'cluster_id', 'status', 'priority')
+
+
+def read_trace(path):
+    """Yield (time, event, id, cluster, cpu, gpu, ram, priority) rows of a trace file"""
+    with open(path, newline='') as trace:
+        rows = csv.reader(trace)
+        if next(rows, None) != TRACE_FIELDS:
+            raise ValueError(f"Trace files start with the header {','.join(TRACE_FIELDS)}")
+        for at, event, item_id, cluster_id, cpu, gpu, ram, priority in rows:
+            yield (
+                float(at), event, int(item_id), int(cluster_id) if cluster_id else None,
+                float(cpu or 0), float(gpu or 0), float(ram or 0), priority,
+            )
+
+
+def write_synthetic_trace(path, submits, clusters=10, seed=0, mean_gap=1.0, mean_runtime=150.0):
+    """Write a trace of ``submits`` deployments, each stopped after a random runtime"""
+    rng = random.Random(seed)
+    stops = []
+    with open(path, 'w', newline='') as trace:
+        writer = csv.writer(trace)
+        writer.writerow(TRACE_FIELDS)
+        for cluster_id in range(1, clusters + 1):
+            writer.writerow([0, 'cluster', cluster_id, '', 64, 8, 256, ''])
+        now = 0.0
+        for deployment_id in range(1, submits + 1):
+            now += rng.expovariate(1 / mean_gap)
+            while stops and stops[0][0] <= now:
+                writer.writerow([f'{stops[0][0]:.3f}', 'stop', heapq.heappop(stops)[1], '', '', '', '', ''])
+            gpu = rng.choice([0, 0, 0, 1, 2])
+            writer.writerow([
+                f'{now:.3f}', 'submit', deployment_id, rng.randint(1, clusters),
+                rng.choice([1, 2, 4, 8]), gpu, rng.choice([2, 4, 8, 16, 32]),
+                'high' if rng.random() < 0.3 else 'low',
+            ])
+            heapq.heappush(stops, (now + rng.expovariate(1 / mean_runtime), deployment_id))
+        while stops:
+            writer.writerow([f'{stops[0][0]:.3f}', 'stop', heapq.heappop(stops)[1], '', '', '', '', ''])
+
+
+class Simulation:
+    """Replay submit and stop events against in-memory clusters on a virtual clock.
+
+    Each event runs a pass on its cluster, like the in-process dispatcher does.
+    Passes use DeploymentScheduler's own candidate selection and planning, on
+    an InMemoryQueue and unsaved model instances, so no database or Redis is
+    involved and only the policy under test differs between runs.
+    """
+
+    def __init__(self, policy=None, preemption=False, sample_interval=60.0):
+        self.queue = InMemoryQueue()
+        self.scheduler = DeploymentScheduler(queue=self.queue)
+        self.scheduler.policy = policy or AgingPolicy()
+        self.scheduler.preemption = preemption
+        self.sample_interval = sample_interval
+
+        self.clock = 0.0
+        self.clusters = {}
+        self.deployments = {}
+        self.running = {}  # cluster id -> {deployment id: deployment}
+        self.submitted_at = {}
+        self.waits = {}  # priority -> first wait of each started deployment
+        self.utilization = []
+        self._next_sample = None
+        self.events = self.started = self.completed = self.preempted = self.examined = 0
+
+    def run(self, events):
+        wall_started = time.perf_counter()
+        for at, event, item_id, cluster_id, cpu, gpu, ram, priority in events:
+            self.advance(at)
+            self.events += 1
+            if event == 'submit':
+                self.submit(item_id, cluster_id, cpu, gpu, ram, priority)
+            elif event == 'stop':
+                self.stop(item_id)
+            elif event == 'cluster':
+                self.add_cluster(item_id, cpu, gpu, ram)
+            else:
+                raise ValueError(f"Unknown trace event '{event}'")
+        self.wall_seconds = time.perf_counter() - wall_started
+        return self.report()
+
+    def advance(self, at):
+        """Move the clock to ``at``, sampling utilization on the way"""
+        if self._next_sample is None:
+            self._next_sample = at
+        while self._next_sample <= at:
+            self.sample(self._next_sample)
+            self._next_sample += self.sample_interval
+        self.clock = max(self.clock, at)
+
+    def sample(self, at):
+        point = {'time': at}
+        for resource in RESOURCES:
+            total = sum(getattr(cluster, f'total_{resource}') for cluster in self.clusters.values())
+            used = sum(getattr(cluster, f'utilized_{resource}') for cluster in self.clusters.values())
+            point[resource] = used / total if total else 0.0
+        self.utilization.append(point)
+
+    def add_cluster(self, cluster_id, cpu, gpu, ram):
+        self.clusters[cluster_id] = Cluster(id=cluster_id, total_cpu=cpu, total_gpu=gpu, total_ram=ram,
+                                            utilized_cpu=0.0, utilized_gpu=0.0, utilized_ram=0.0)
+        self.running[cluster_id] = {}
+
+    def submit(self, deployment_id, cluster_id, cpu, gpu, ram, priority):
+        if cluster_id not in self.clusters:
+            raise ValueError(f"Deployment {deployment_id} submitted to undeclared cluster {cluster_id}")
+        self.deployments[deployment_id] = Deployment.from_db(
+            None, DEPLOYMENT_FIELDS, (deployment_id, ram, cpu, gpu, cluster_id, 'queued', priority),
+        )
+        self.submitted_at[deployment_id] = self.clock
+        self.enqueue(self.deployments[deployment_id])
+        self.run_pass(cluster_id)
+
+    def enqueue(self, deployment):
+        self.queue.enqueue_deployment({
+            'deployment_id': deployment.id, 'priority': deployment.priority,
+            'cpu': deployment.cpu_required, 'gpu': deployment.gpu_required, 'ram': deployment.ram_required,
+            'enqueued_at': self.clock,
+        }, deployment.cluster_id)
+
+    def stop(self, deployment_id):
+        deployment = self.deployments.get(deployment_id)
+        if deployment is None or deployment.status not in ('queued', 'running'):
+            return
+        cluster_id = deployment.cluster_id
+        if deployment.status == 'queued':
+            # Cancelled before it started
+            self.queue.remove_deployments(cluster_id, [deployment_id])
+        else:
+            cluster = self.clusters[cluster_id]
+            cluster.utilized_cpu -= deployment.cpu_required
+            cluster.utilized_gpu -= deployment.gpu_required
+            cluster.utilized_ram -= deployment.ram_required
+            del self.running[cluster_id][deployment_id]
+            self.completed += 1
+        deployment.status = 'stopped'
+        self.run_pass(cluster_id)
+
+    def run_pass(self, cluster_id):
+        queue_length = self.queue.get_queue_length(cluster_id)
+        if not queue_length['high_priority'] and not queue_length['low_priority']:
+            return
+        cluster = self.clusters[cluster_id]
+        queued = self.scheduler.read_candidates(cluster, queue_length, now=self.clock)
+        if not queued:
+            return
+        self.examined += len(queued)
+
+        running = self.running[cluster_id]
+        started, finished, preemptions = self.scheduler.plan_pass(
+            cluster, [deployment_data['deployment_id'] for deployment_data in queued], self.deployments,
+            load_running=lambda: [deployment for deployment in running.values() if deployment.priority == 'low'],
+        )
+        self.queue.remove_deployments(cluster_id, finished)
+        for preemption in preemptions:
+            victim = preemption.preempted
+            del running[victim.id]
+            self.enqueue(victim)
+            self.preempted += 1
+        for deployment in started:
+            running[deployment.id] = deployment
+            submitted_at = self.submitted_at.pop(deployment.id, None)
+            if submitted_at is not None:
+                # Only the first start counts, a preempted deployment restarting is not a new wait
+                self.waits.setdefault(deployment.priority, []).append(self.clock - submitted_at)
+            self.started += 1
+
+    def report(self):
+        duration = self.utilization[-1]['time'] - self.utilization[0]['time'] if self.utilization else 0.0
+        wait_times = {}
+        for priority, waits in self.waits.items():
+            waits.sort()
+            wait_times[priority] = {'count': len(waits), 'mean': sum(waits) / len(waits)}
+            for percent in PERCENTILES:
+                wait_times[priority][f'p{percent}'] = percentile(waits, percent)
+            wait_times[priority]['max'] = waits[-1]
+        mean_utilization = {
+            resource: sum(point[resource] for point in self.utilization) / len(self.utilization)
+            if self.utilization else 0.0
+            for resource in RESOURCES
+        }
+        return {
+            'events': self.events,
+            'events_per_sec': self.events / self.wall_seconds if self.wall_seconds else 0.0,
+            'simulated_seconds': duration,
+            'started': self.started,
+            'completed': self.completed,
+            'preempted': self.preempted,
+            'examined': self.examined,
+            'throughput_per_hour': self.completed / duration * 3600 if duration else 0.0,
+            'still_queued': sum(sum(self.queue.get_queue_length(cluster_id).values()) for cluster_id in self.clusters),
+            'wait_times': wait_times,
+            'mean_utilization': mean_utilization,
+            'utilization': self.utilization,
+        }
@@ -0,0 +1,49 @@
+import time
+from .metrics import metrics
+from .queue_handler import queue_instance
+
+# Latest wait times kept per priority for the percentile report
+WAIT_SAMPLES = 1000
+PERCENTILES = (50, 90, 99)
+
+
+def get_wait_times_key(priority):
+    return f'scheduler_wait_times_{priority}'
+
+
+def record_wait_times(queued, started_ids, now=None, redis_client=None):
+    """Record how long each started deployment waited in the queue, per priority"""
+    now = now or time.time()
+    started_ids = set(started_ids)
+    pipe = (redis_client or queue_instance.redis_client).pipeline(transaction=False)
+    for deployment_data in queued:
+        if deployment_data['deployment_id'] in started_ids and 'enqueued_at' in deployment_data:
+            key = get_wait_times_key(deployment_data['priority'])
+            waited = now - deployment_data['enqueued_at']
+            pipe.lpush(key, round(waited, 3))
+            metrics.observe('scheduler_enqueue_to_running_seconds', waited, priority=deployment_data['priority'])
+            pipe.ltrim(key, 0, WAIT_SAMPLES - 1)
+    pipe.execute()
+
+
+def percentile(samples, percent):
+    """Nearest-rank percentile of sorted samples"""
+    index = max(0, min(len(samples) - 1, round(percent / 100 * len(samples)) - 1))
+    return samples[index]
+
+
+def wait_time_percentiles(priorities=('high', 'low'), redis_client=None):
+    """Wait time percentiles in seconds over the latest samples of each priority"""
+    pipe = (redis_client or queue_instance.redis_client).pipeline(transaction=False)
+    for priority in priorities:
+        pipe.lrange(get_wait_times_key(priority), 0, -1)
+
+    report = {}
+    for priority, samples in zip(priorities, pipe.execute()):
+        samples = sorted(float(sample) for sample in samples)
+        report[priority] = {'count': len(samples)}
+        if samples:
+            for percent in PERCENTILES:
+                report[priority][f'p{percent}'] = percentile(samples, percent)
+            report[priority]['max'] = samples[-1]
+    return report
@@ -0,0 +1,165 @@
+import json
+import logging
+import time
+import redis
+from .queue_handler import get_async_stream_redis_client, get_stream_redis_client, queue_instance
+from .versions import get_version_key, queue_version_bumps
+
+logger = logging.getLogger(__name__)
+
+# Transitions clients are told about. 'preempted' is followed by 'queued' once
+# the deployment is back in the queue. Nothing sets 'failed' yet.
+QUEUED = 'queued'
+RUNNING = 'running'
+STOPPED = 'stopped'
+FAILED = 'failed'
+PREEMPTED = 'preempted'
+
+# Every transition is appended to the Redis stream of its deployment, its
+# cluster and its organization, so a client reads exactly the events it
+# watches and can resume after the id of the last one it saw. Streams keep
+# about STREAM_MAXLEN events and expire STREAM_TTL seconds after the last one.
+SCOPES = ('deployment', 'cluster', 'organization')
+STREAM_MAXLEN = 1000
+STREAM_TTL = 86400
+# Milliseconds EventSource waits before reconnecting
+SSE_RETRY_MS = 1000
+
+
+def get_status_stream_key(scope, scope_id):
+    """Generate the key of the stream holding a deployment's, cluster's or organization's transitions"""
+    return f'status_events_{scope}_{scope_id}'
+
+
+def _stream_writes(transitions):
+    """Yield (stream key, event fields) for (deployment id, cluster id, organization id, status) transitions"""
+    at = time.time()
+    for deployment_id, cluster_id, organization_id, status in transitions:
+        fields = {'deployment_id': deployment_id, 'cluster_id': cluster_id, 'status': status, 'at': at}
+        if organization_id is not None:
+            fields['organization_id'] = organization_id
+        for scope, scope_id in zip(SCOPES, (deployment_id, cluster_id, organization_id)):
+            if scope_id is not None:
+                yield get_status_stream_key(scope, scope_id), fields
+
+
+def _queue_writes(pipe, transitions):
+    keys = set()
+    for key, fields in _stream_writes(transitions):
+        pipe.xadd(key, {'event': json.dumps(fields)}, maxlen=STREAM_MAXLEN, approximate=True)
+        keys.add(key)
+    for key in keys:
+        pipe.expire(key, STREAM_TTL)
+    # A transition changes the deployment and its cluster's status and listing
+    versions = {get_version_key('deployment', deployment_id) for deployment_id, _, _, _ in transitions}
+    versions.update(get_version_key('cluster', cluster_id) for _, cluster_id, _, _ in transitions if cluster_id is not None)
+    return queue_version_bumps(pipe, sorted(versions))
+
+
+def publish_transitions(transitions, redis_client=None):
+    """Append (deployment id, cluster id, organization id, status) transitions to their streams in one round trip.
+
+    Also bumps the versions of the deployments and their clusters. Call it
+    once the change is committed, so no event or version runs ahead of the
+    database. A Redis failure is only logged, clients miss the event and
+    keep the old version until the next bump.
+    """
+    if not transitions:
+        return
+    redis_client = redis_client or queue_instance.redis_client
+    try:
+        _queue_writes(redis_client.pipeline(transaction=False), transitions).execute()
+    except redis.RedisError as e:
+        logger.warning("Failed to publish %d status transitions: %s", len(transitions), e)
+
+
+async def apublish_transitions(transitions, redis_client=None):
+    """Async counterpart of ``publish_transitions``, on the asyncio Redis client"""
+    if not transitions:
+        return
+    redis_client = redis_client or queue_instance.async_redis_client
+    try:
+        await _queue_writes(redis_client.pipeline(transaction=False), transitions).execute()
+    except redis.RedisError as e:
+        logger.warning("Failed to publish %d status transitions: %s", len(transitions), e)
+
+
+def read_status_events(scope, scope_id, last_id, block_ms, count=100, redis_client=None):
+    """Block up to ``block_ms`` for the transitions after ``last_id``, or after the newest one if it is None.
+
+    Returns the id to read after next time and a list of (event id, transition dict).
+    A ``block_ms`` of 0 blocks until an event arrives. Reads go through the
+    streams' own connection pool unless given a client.
+    """
+    redis_client = redis_client or get_stream_redis_client()
+    key = get_status_stream_key(scope, scope_id)
+    if last_id is None:
+        newest = redis_client.xrevrange(key, count=1)
+        last_id = newest[0][0] if newest else '0-0'
+    return _parse_events(last_id, redis_client.xread({key: last_id}, count=count, block=block_ms))
+
+
+async def aread_status_events(scope, scope_id, last_id, block_ms, count=100, redis_client=None):
+    """Async counterpart of ``read_status_events``"""
+    redis_client = redis_client or get_async_stream_redis_client()
+    key = get_status_stream_key(scope, scope_id)
+    if last_id is None:
+        newest = await redis_client.xrevrange(key, count=1)
+        last_id = newest[0][0] if newest else '0-0'
+    return _parse_events(last_id, await redis_client.xread({key: last_id}, count=count, block=block_ms))
+
+
+def _parse_events(last_id, response):
+    events = []
+    for _stream, entries in response or []:
+        for event_id, fields in entries:
+            last_id = event_id
+            events.append((event_id, json.loads(fields['event'])))
+    return last_id, events
+
+
+def is_event_id(value):
+    """Whether a Last-Event-ID is a stream id, '<milliseconds>-<sequence>'"""
+    milliseconds, _, sequence = value.partition('-')
+    return milliseconds.isdigit() and sequence.isdigit()
+
+
+def format_event(event_id, transition):
+    """A transition as a Server-Sent Event, its id is what clients resume from"""
+    return f"id: {event_id}\nevent: status\ndata: {json.dumps(transition)}\n\n"
+
+
+def event_stream(scope, scope_id, last_id=None, heartbeat=3.0, duration=300.0):
+    """Yield a stream's transitions after ``last_id`` as Server-Sent Events, for ``duration`` seconds.
+
+    Sends a comment whenever ``heartbeat`` seconds pass without events, which
+    keeps proxies from closing the connection and notices clients that left.
+    The stream then ends and EventSource reconnects, resuming after the last
+    event it received.
+    """
+    yield f"retry: {SSE_RETRY_MS}\n\n"
+    deadline = time.monotonic() + duration
+    try:
+        while time.monotonic() < deadline:
+            last_id, events = read_status_events(scope, scope_id, last_id, max(1, int(heartbeat * 1000)))
+            if not events:
+                yield ": keep-alive\n\n"
+            for event_id, transition in events:
+                yield format_event(event_id, transition)
+    except redis.RedisError as e:
+        logger.warning("Status stream of %s %s failed: %s", scope, scope_id, e)
+
+
+async def aevent_stream(scope, scope_id, last_id=None, heartbeat=3.0, duration=300.0):
+    """Async counterpart of ``event_stream``, waits on the asyncio Redis client"""
+    yield f"retry: {SSE_RETRY_MS}\n\n"
+    deadline = time.monotonic() + duration
+    try:
+        while time.monotonic() < deadline:
+            last_id, events = await aread_status_events(scope, scope_id, last_id, max(1, int(heartbeat * 1000)))
+            if not events:
+                yield ": keep-alive\n\n"
+            for event_id, transition in events:
+                yield format_event(event_id, transition)
+    except redis.RedisError as e:
+        logger.warning("Status stream of %s %s failed: %s", scope, scope_id, e)
@@ -0,0 +1,17 @@
+import time
+from api.models import Deployment
+from scheduler.queue_handler import queue_instance
+
+
+def queue_deployment(cluster, cpu, gpu=0, ram=1, priority='high', waited=0, queue=None):
+    """Save a deployment on ``cluster``, owned by the cluster's user, and queue it as if it had waited ``waited`` seconds"""
+    deployment = Deployment.objects.create(
+        docker_image="model:latest", cpu_required=cpu, gpu_required=gpu, ram_required=ram,
+        priority=priority, cluster=cluster, user=cluster.user
+    )
+    (queue or queue_instance).enqueue_deployment({
+        "deployment_id": deployment.id, "priority": priority,
+        "cpu": cpu, "gpu": gpu, "ram": ram,
+        "enqueued_at": time.time() - waited,
+    }, cluster.id)
+    return deployment
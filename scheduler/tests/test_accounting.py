@@ -0,0 +1,129 @@
+import os
+import random
+import tempfile
+import threading
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from api.models import UserProfile, Cluster, Deployment
+from scheduler.accounting import reserve, release
+from scheduler.scheduler import DeploymentScheduler
+from scheduler.tests.helpers import queue_deployment
+
+
+class AccountingTestCase(TestCase):
+    def setUp(self):
+        self.user = UserProfile.objects.create(username="testuser", password="testpass")
+        self.cluster = Cluster.objects.create(name="TestCluster", user=self.user, total_cpu=4, total_gpu=1, total_ram=16)
+
+    def test_reserve_refuses_to_overcommit(self):
+        self.assertTrue(reserve(self.cluster.id, 3, 1, 8))
+        self.assertFalse(reserve(self.cluster.id, 2, 0, 1))
+        self.assertFalse(reserve(self.cluster.id, 1, 1, 1))
+        self.assertTrue(reserve(self.cluster.id, 1, 0, 8))
+        self.cluster.refresh_from_db()
+        self.assertEqual((self.cluster.utilized_cpu, self.cluster.utilized_gpu, self.cluster.utilized_ram), (4, 1, 16))
+
+    def test_release_stops_at_zero(self):
+        reserve(self.cluster.id, 1, 0, 2)
+        release(self.cluster.id, 2, 1, 2)
+        self.cluster.refresh_from_db()
+        self.assertEqual((self.cluster.utilized_cpu, self.cluster.utilized_gpu, self.cluster.utilized_ram), (0, 0, 0))
+
+
+class ConcurrentSchedulingTestCase(TransactionTestCase):
+    """Several threads schedule and stop deployments on one cluster at the same time"""
+
+    THREADS = 6
+
+    @classmethod
+    def setUpClass(cls):
+        # Threads share the in-memory test database through SQLite's shared cache,
+        # where a lock conflict fails at once instead of waiting. These tests get a
+        # file database of their own, the in-memory one is kept open for the others.
+        cls._directory = tempfile.TemporaryDirectory()
+        cls._memory_name = connection.settings_dict['NAME']
+        cls._memory_connection = connection.connection
+        connection.connection = None
+        # New connections, those of the threads too, are built from these settings
+        connection.settings_dict['NAME'] = os.path.join(cls._directory.name, 'test_db.sqlite3')
+        call_command('migrate', verbosity=0, interactive=False, run_syncdb=True)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connection.close()
+        connection.settings_dict['NAME'] = cls._memory_name
+        connection.connection = cls._memory_connection
+        cls._directory.cleanup()
+
+    def setUp(self):
+        self.user = UserProfile.objects.create(username="testuser", password="testpass")
+        self.cluster = Cluster.objects.create(name="TestCluster", user=self.user, total_cpu=6, total_gpu=2, total_ram=24)
+        self.scheduler = DeploymentScheduler()
+        self.queue = self.scheduler.queue
+        self.queue.clear_queue(self.cluster.id)
+
+    def tearDown(self):
+        self.queue.clear_queue(self.cluster.id)
+
+    def run_threads(self, target):
+        errors = []
+
+        def run(index):
+            try:
+                target(index)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=run, args=(index,)) for index in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    def assert_invariants(self):
+        self.cluster.refresh_from_db()
+        running = Deployment.objects.filter(cluster=self.cluster, status='running')
+        for resource in ('cpu', 'gpu', 'ram'):
+            utilized = getattr(self.cluster, f'utilized_{resource}')
+            self.assertLessEqual(utilized, getattr(self.cluster, f'total_{resource}'))
+            self.assertAlmostEqual(utilized, sum(getattr(d, f'{resource}_required') for d in running))
+
+    def test_concurrent_reservations_never_overcommit(self):
+        granted = []
+
+        def target(index):
+            for _ in range(20):
+                if reserve(self.cluster.id, 0.5, 0, 1):
+                    granted.append(index)
+
+        self.run_threads(target)
+
+        self.cluster.refresh_from_db()
+        self.assertEqual(len(granted), 12)
+        self.assertEqual(self.cluster.utilized_cpu, 6)
+
+    def test_concurrent_passes_and_stops_keep_utilization_consistent(self):
+        for _ in range(60):
+            queue_deployment(self.cluster, random.choice([0.5, 1, 2]), random.choice([0, 0, 1]), random.choice([1, 4]),
+                             queue=self.queue)
+
+        def target(index):
+            for _ in range(15):
+                self.scheduler.process_cluster_queue(self.cluster.id)
+                running = list(Deployment.objects.filter(cluster=self.cluster, status='running'))
+                if running:
+                    # Stop the way the API does, racing the other threads for the same deployment
+                    victim = random.choice(running)
+                    if Deployment.objects.filter(id=victim.id, status='running').update(status='stopped'):
+                        release(self.cluster.id, victim.cpu_required, victim.gpu_required, victim.ram_required)
+
+        self.run_threads(target)
+
+        self.assert_invariants()
+        self.assertTrue(Deployment.objects.filter(status='stopped').exists())
@@ -0,0 +1,99 @@
+from django.test import TestCase, override_settings
+from api.models import UserProfile, Organization, Cluster
+from scheduler.capacity import DIRTY_KEY, CapacityCache
+from scheduler.dispatch import InProcessDispatcher
+from scheduler.queue_handler import queue_instance
+from scheduler.scheduler import DeploymentScheduler
+from scheduler.tests.helpers import queue_deployment
+
+
+class CapacityCacheTestCase(TestCase):
+    def setUp(self):
+        self.cache = CapacityCache(queue_instance.redis_client)
+        self.organization = Organization.objects.create(name="TestOrg")
+        self.user = UserProfile.objects.create(username="testuser", password="testpass", organization=self.organization)
+        self.cluster = Cluster.objects.create(name="TestCluster", user=self.user, total_cpu=8, total_gpu=2, total_ram=32,
+                                              utilized_cpu=2)
+        self.clean_keys()
+
+    def tearDown(self):
+        self.clean_keys()
+
+    def clean_keys(self):
+        queue_instance.clear_queue(self.cluster.id)
+        queue_instance.redis_client.delete(self.cache.get_capacity_key(self.cluster.id), DIRTY_KEY)
+
+    def test_cluster_is_seeded_from_database(self):
+        cluster = self.cache.get_cluster(self.cluster.id)
+
+        self.assertEqual((cluster.total_cpu, cluster.utilized_cpu, cluster.utilized_ram), (8, 2, 0))
+        self.assertIsNone(self.cache.get_cluster(self.cluster.id + 1000))
+
+    def test_reserve_and_release_stay_within_totals(self):
+        self.assertTrue(self.cache.reserve(self.cluster.id, 6, 2, 16))
+        self.assertFalse(self.cache.reserve(self.cluster.id, 1, 0, 1))
+        self.cache.release(self.cluster.id, 10, 2, 16)
+
+        cluster = self.cache.get_cluster(self.cluster.id)
+        self.assertEqual((cluster.utilized_cpu, cluster.utilized_gpu, cluster.utilized_ram), (0, 0, 0))
+
+    def test_flush_writes_changed_clusters_back(self):
+        self.cache.reserve(self.cluster.id, 4, 1, 8)
+        self.cluster.refresh_from_db()
+        self.assertEqual(self.cluster.utilized_cpu, 2)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(self.cache.flush(), 1)
+
+        self.cluster.refresh_from_db()
+        self.assertEqual((self.cluster.utilized_cpu, self.cluster.utilized_gpu, self.cluster.utilized_ram), (6, 1, 8))
+        self.assertEqual(self.cache.flush(), 0)
+
+    def test_saved_totals_reach_the_cache(self):
+        self.cache.reserve(self.cluster.id, 1, 0, 4)
+        self.cluster.total_cpu = 12
+        self.cluster.save()
+
+        cluster = self.cache.get_cluster(self.cluster.id)
+        self.assertEqual((cluster.total_cpu, cluster.utilized_cpu, cluster.utilized_ram), (12, 3, 4))
+        self.cache.reserve(self.cluster.id, 9, 0, 0)
+        self.assertEqual(self.cache.get_cluster(self.cluster.id).utilized_cpu, 12)
+
+    def test_scripts_reload_after_redis_forgets_them(self):
+        self.cache.reserve(self.cluster.id, 1, 0, 1)
+        queue_instance.redis_client.delete(DIRTY_KEY)
+        queue_instance.redis_client.script_flush()
+
+        self.assertTrue(self.cache.reserve(self.cluster.id, 1, 0, 1))
+        self.assertTrue(queue_instance.redis_client.sismember(DIRTY_KEY, self.cluster.id))
+        self.assertEqual(self.cache.get_cluster(self.cluster.id).utilized_cpu, 4)
+
+    @override_settings(SCHEDULER_CAPACITY_CACHE=True)
+    def test_pass_does_not_read_cluster_row(self):
+        scheduler = DeploymentScheduler()
+        deployment = queue_deployment(self.cluster, 4, 1, 8)
+        self.cache.get_cluster(self.cluster.id)
+
+        # in_bulk, savepoint, status update, release savepoint
+        with self.assertNumQueries(4):
+            self.assertEqual(scheduler.process_cluster_queue(self.cluster.id), [deployment.id])
+
+        self.assertEqual(self.cache.get_cluster(self.cluster.id).utilized_cpu, 6)
+        self.cache.flush()
+        self.cluster.refresh_from_db()
+        self.assertEqual(self.cluster.utilized_cpu, 6)
+
+    @override_settings(SCHEDULER_CAPACITY_CACHE=True, SCHEDULER_CAPACITY_FLUSH_INTERVAL=60)
+    def test_in_process_passes_write_behind(self):
+        dispatcher = InProcessDispatcher()
+        queue_deployment(self.cluster, 2, 0, 4)
+        dispatcher.process(self.cluster.id)
+        self.cluster.refresh_from_db()
+        self.assertEqual(self.cluster.utilized_cpu, 4)
+
+        # Within the interval the cache runs ahead of the database
+        queue_deployment(self.cluster, 1, 0, 4)
+        dispatcher.process(self.cluster.id)
+        self.cluster.refresh_from_db()
+        self.assertEqual(self.cluster.utilized_cpu, 4)
+        self.assertEqual(self.cache.get_cluster(self.cluster.id).utilized_cpu, 5)
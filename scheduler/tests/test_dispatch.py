@@ -0,0 +1,16 @@
+from django.test import TestCase, override_settings
+from scheduler.dispatch import get_dispatcher, InProcessDispatcher, HttpDispatcher, SchedulingDispatchError
+
+
+class DispatcherTestCase(TestCase):
+    def test_default_dispatcher_is_in_process(self):
+        self.assertIsInstance(get_dispatcher(), InProcessDispatcher)
+
+    @override_settings(SCHEDULER_DISPATCHER='scheduler.dispatch.HttpDispatcher')
+    def test_dispatcher_follows_settings(self):
+        self.assertIsInstance(get_dispatcher(), HttpDispatcher)
+
+    def test_http_dispatcher_wraps_connection_errors(self):
+        dispatcher = HttpDispatcher(url='http://127.0.0.1:9/scheduler/schedule/', timeout=1)
+        with self.assertRaises(SchedulingDispatchError):
+            dispatcher.process(1)
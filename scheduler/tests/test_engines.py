@@ -0,0 +1,51 @@
+from django.test import TestCase
+from api.models import UserProfile, Organization, Cluster
+from scheduler.capacity import DIRTY_KEY
+from scheduler.queue_handler import RedisQueue
+from scheduler.engines import LuaSchedulingEngine
+from scheduler.tests.helpers import queue_deployment
+
+
+class LuaSchedulingEngineTestCase(TestCase):
+    def setUp(self):
+        self.queue = RedisQueue()
+        self.engine = LuaSchedulingEngine(self.queue)
+        self.organization = Organization.objects.create(name="TestOrg")
+        self.user = UserProfile.objects.create(username="testuser", password="testpass", organization=self.organization)
+        self.cluster = Cluster.objects.create(name="TestCluster", user=self.user, total_cpu=8, total_gpu=1, total_ram=32)
+        self.clean_keys()
+
+    def tearDown(self):
+        self.clean_keys()
+
+    def clean_keys(self):
+        self.queue.clear_queue(self.cluster.id)
+        self.queue.redis_client.delete(self.engine.get_capacity_key(self.cluster.id))
+
+    def test_pass_starts_deployments_that_fit(self):
+        first = queue_deployment(self.cluster, 4, 1, 16)
+        too_big = queue_deployment(self.cluster, 2, 1, 8)
+        fits = queue_deployment(self.cluster, 2.5, 0, 8)
+
+        started = self.engine.process_cluster_queue(self.cluster.id)
+
+        self.assertEqual(sorted(started), sorted([first.id, fits.id]))
+        self.cluster.refresh_from_db()
+        self.assertEqual((self.cluster.utilized_cpu, self.cluster.utilized_gpu, self.cluster.utilized_ram), (6.5, 1, 24))
+        too_big.refresh_from_db()
+        self.assertEqual(too_big.status, 'queued')
+        self.assertEqual([d['deployment_id'] for d in self.queue.peek_deployments(self.cluster.id)], [too_big.id])
+
+    def test_capacity_is_not_double_booked(self):
+        queue_deployment(self.cluster, 6, 0, 8)
+        self.engine.process_cluster_queue(self.cluster.id)
+        waiting = queue_deployment(self.cluster, 6, 0, 8)
+
+        # The second pass sees the reservation of the first one
+        self.assertEqual(self.engine.process_cluster_queue(self.cluster.id), [])
+
+        # Releasing resources lets the waiting deployment start
+        self.engine.release(self.cluster.id, 6, 0, 8)
+        self.assertEqual(self.engine.process_cluster_queue(self.cluster.id), [waiting.id])
+        # Without the capacity cache nothing flushes the dirty set, so it is left alone
+        self.assertFalse(self.queue.redis_client.sismember(DIRTY_KEY, self.cluster.id))
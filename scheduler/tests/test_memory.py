@@ -0,0 +1,51 @@
+from django.test import SimpleTestCase, TestCase
+from api.models import UserProfile, Cluster, Deployment
+from scheduler.memory import InMemoryQueue
+from scheduler.queue_handler import deployment_payload
+from scheduler.scheduler import DeploymentScheduler
+
+
+class InMemoryQueueTestCase(SimpleTestCase):
+    def setUp(self):
+        self.queue = InMemoryQueue()
+
+    def enqueue(self, deployment_id, priority, cpu=1):
+        self.queue.enqueue_deployment({"deployment_id": deployment_id, "priority": priority,
+                                       "cpu": cpu, "gpu": 0, "ram": 1}, 1)
+
+    def test_priority_then_fifo_order(self):
+        self.enqueue(1, 'low')
+        self.enqueue(2, 'high')
+        self.enqueue(3, 'high')
+
+        self.assertEqual([d['deployment_id'] for d in self.queue.peek_deployments(1)], [2, 3, 1])
+        self.assertEqual([d['deployment_id'] for d in self.queue.peek_deployments(1, min_priority='high')], [2, 3])
+        self.assertEqual(self.queue.get_queue_length(1), {'high_priority': 2, 'low_priority': 1})
+
+    def test_feasible_remove_and_requeue(self):
+        self.enqueue(1, 'high', cpu=4)
+        self.enqueue(2, 'high', cpu=1)
+        self.assertEqual([d['deployment_id'] for d in self.queue.feasible_deployments(1, 2, 0, 1)], [2])
+
+        self.assertEqual(self.queue.remove_deployments(1, [2, 5]), 1)
+        self.enqueue(1, 'low', cpu=4)
+        self.assertEqual(self.queue.get_queue_length(1), {'high_priority': 0, 'low_priority': 1})
+
+
+class InMemorySchedulingTestCase(TestCase):
+    def test_scheduler_runs_on_memory_queue(self):
+        user = UserProfile.objects.create(username="testuser", password="testpass")
+        cluster = Cluster.objects.create(name="TestCluster", user=user, total_cpu=4, total_gpu=0, total_ram=8)
+        queue = InMemoryQueue()
+        deployments = [
+            Deployment.objects.create(docker_image="model:latest", cpu_required=cpu, gpu_required=0, ram_required=1,
+                                      priority='high', cluster=cluster, user=user)
+            for cpu in (3, 2, 1)
+        ]
+        for deployment in deployments:
+            queue.enqueue_deployment(deployment_payload(deployment), cluster.id)
+
+        started = DeploymentScheduler(queue=queue).process_cluster_queue(cluster.id)
+
+        self.assertEqual(started, [deployments[0].id, deployments[2].id])
+        self.assertEqual([d['deployment_id'] for d in queue.peek_deployments(cluster.id)], [deployments[1].id])
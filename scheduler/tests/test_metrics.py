@@ -0,0 +1,90 @@
+import asyncio
+import threading
+from django.test import TestCase
+from django.urls import reverse
+from api.models import UserProfile, Cluster
+from scheduler.metrics import GAUGES_KEY, METRICS_KEY, Metrics, metrics
+from scheduler.queue_handler import queue_instance
+from scheduler.scheduler import DeploymentScheduler
+from scheduler.tests.helpers import queue_deployment
+
+
+class MetricsTestCase(TestCase):
+    def setUp(self):
+        self.redis_client = queue_instance.redis_client
+        self.clean_keys()
+
+    def tearDown(self):
+        self.clean_keys()
+
+    def clean_keys(self):
+        metrics.flush()
+        self.redis_client.delete(METRICS_KEY, GAUGES_KEY)
+
+    def test_histogram_is_rendered_cumulatively(self):
+        registry = Metrics(flush_interval=60)
+        registry.observe('scheduler_pass_duration_seconds', 0.02, cluster=1)
+        registry.observe('scheduler_pass_duration_seconds', 3, cluster=1)
+        registry.set('scheduler_queue_depth', 4, cluster=1, priority='high')
+
+        # Nothing reaches Redis until the flush interval has passed
+        self.assertEqual(self.redis_client.hlen(METRICS_KEY), 0)
+        text = registry.render()
+
+        self.assertIn('# TYPE scheduler_pass_duration_seconds histogram', text)
+        self.assertIn('scheduler_pass_duration_seconds_bucket{cluster="1",le="0.01"} 0', text)
+        self.assertIn('scheduler_pass_duration_seconds_bucket{cluster="1",le="0.025"} 1', text)
+        self.assertIn('scheduler_pass_duration_seconds_bucket{cluster="1",le="+Inf"} 2', text)
+        self.assertIn('scheduler_pass_duration_seconds_count{cluster="1"} 2', text)
+        self.assertIn('scheduler_queue_depth{cluster="1",priority="high"} 4', text)
+        buckets = [line for line in text.splitlines() if line.startswith('scheduler_pass_duration_seconds_bucket')]
+        self.assertTrue(buckets[-1].startswith('scheduler_pass_duration_seconds_bucket{cluster="1",le="+Inf"}'))
+
+    def test_counter(self):
+        registry = Metrics(flush_interval=60)
+        registry.inc('api_response_cache_requests', view='user_clusters', result='hit')
+        registry.inc('api_response_cache_requests', 2, view='user_clusters', result='hit')
+
+        text = registry.render()
+
+        self.assertIn('# TYPE api_response_cache_requests counter', text)
+        self.assertIn('api_response_cache_requests{view="user_clusters",result="hit"} 3', text)
+
+    def test_flush_leaves_the_event_loop(self):
+        registry = Metrics(flush_interval=0)
+        flush, threads = registry.flush, []
+
+        def record_thread():
+            threads.append(threading.get_ident())
+            flush()
+        registry.flush = record_thread
+
+        async def record():
+            registry.inc('api_response_cache_requests', view='user_clusters', result='miss')
+            return threading.get_ident()
+
+        # asyncio.run waits for the loop's executor before it returns
+        loop_thread = asyncio.run(record())
+
+        self.assertEqual(len(threads), 1)
+        self.assertNotEqual(threads[0], loop_thread)
+        self.assertEqual(
+            self.redis_client.hget(METRICS_KEY, 'api_response_cache_requests{view="user_clusters",result="miss"}'), '1'
+        )
+
+    def test_pass_and_request_metrics(self):
+        user = UserProfile.objects.create(username="testuser", password="testpass")
+        cluster = Cluster.objects.create(name="TestCluster", user=user, total_cpu=8, total_gpu=1, total_ram=32)
+        queue_instance.clear_queue(cluster.id)
+        queue_deployment(cluster, 1)
+
+        DeploymentScheduler().process_cluster_queue(cluster.id)
+        self.client.get(reverse('cluster-status', args=[cluster.id]))
+        text = self.client.get(reverse('metrics')).content.decode()
+        queue_instance.clear_queue(cluster.id)
+
+        self.assertIn('scheduler_pass_started_sum 1', text)
+        self.assertIn('scheduler_pass_db_queries_count 1', text)
+        self.assertIn('scheduler_enqueue_to_running_seconds_count{priority="high"} 1', text)
+        self.assertIn('api_request_duration_seconds_count{view="cluster-status",method="GET",status="', text)
+        self.assertNotIn('scheduler_pass_redis_calls_sum 0', text)
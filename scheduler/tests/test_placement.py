@@ -0,0 +1,51 @@
+from django.test import TestCase
+from api.models import UserProfile, Organization, Cluster
+from scheduler.placement import candidate_clusters, choose_cluster, place_deployments
+
+
+class PlacementTestCase(TestCase):
+    def setUp(self):
+        self.organization = Organization.objects.create(name="TestOrg")
+        self.user = UserProfile.objects.create(username="testuser", password="testpass", organization=self.organization)
+        self.teammate = UserProfile.objects.create(username="teammate", password="testpass", organization=self.organization)
+        self.small = Cluster.objects.create(name="Small", user=self.user, total_cpu=4, total_gpu=0, total_ram=16)
+        self.large = Cluster.objects.create(name="Large", user=self.user, total_cpu=32, total_gpu=4, total_ram=128)
+        # Visible to the user but not theirs to manage, like a cluster named explicitly
+        Cluster.objects.create(name="Teammate's", user=self.teammate, total_cpu=64, total_gpu=8, total_ram=256)
+        outsider = UserProfile.objects.create(username="outsider", password="testpass")
+        Cluster.objects.create(name="Elsewhere", user=outsider, total_cpu=64, total_gpu=8, total_ram=256)
+
+    def test_candidates_are_the_users_own_clusters(self):
+        self.assertEqual(set(candidate_clusters(self.user)), {self.small, self.large})
+
+    def test_best_fit_picks_tightest_cluster(self):
+        self.assertEqual(choose_cluster(candidate_clusters(self.user), 2, 0, 8), self.small)
+
+    def test_worst_fit_picks_roomiest_cluster(self):
+        self.assertEqual(choose_cluster(candidate_clusters(self.user), 2, 0, 8, strategy='worst_fit'), self.large)
+
+    def test_skips_clusters_without_room(self):
+        self.small.utilized_cpu = 3
+        self.small.save()
+        self.assertEqual(choose_cluster(candidate_clusters(self.user), 2, 0, 8), self.large)
+
+    def test_queues_on_a_cluster_that_fits_eventually(self):
+        self.large.utilized_gpu = 4
+        self.large.save()
+        self.assertEqual(choose_cluster(candidate_clusters(self.user), 2, 1, 8), self.large)
+        self.assertIsNone(choose_cluster(candidate_clusters(self.user), 2, 5, 8))
+
+    def test_unknown_strategy(self):
+        with self.assertRaises(ValueError):
+            choose_cluster(candidate_clusters(self.user), 1, 0, 1, strategy='random')
+
+    def test_batch_placement_matches_single_placement(self):
+        for strategy in ('best_fit', 'worst_fit'):
+            self.assertEqual(place_deployments(candidate_clusters(self.user), [(2, 0, 8)], strategy=strategy),
+                             [choose_cluster(candidate_clusters(self.user), 2, 0, 8, strategy=strategy)])
+
+    def test_batch_placement_counts_earlier_placements(self):
+        # The second deployment no longer fits on the small cluster, the third waits for room on the large one
+        with self.assertNumQueries(1):
+            placements = place_deployments(candidate_clusters(self.user), [(3, 0, 8), (3, 0, 8), (30, 0, 8), (2, 5, 8)])
+        self.assertEqual(placements, [self.small, self.large, self.large, None])
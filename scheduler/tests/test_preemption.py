@@ -0,0 +1,50 @@
+from types import SimpleNamespace
+from django.test import SimpleTestCase
+from scheduler.preemption import EXACT_SEARCH_LIMIT, choose_victims, preemption_cost
+
+
+def make_cluster(used_cpu=0, used_gpu=0, used_ram=0):
+    return SimpleNamespace(total_cpu=8, total_gpu=2, total_ram=64,
+                           utilized_cpu=used_cpu, utilized_gpu=used_gpu, utilized_ram=used_ram)
+
+
+def make_deployment(id, cpu, gpu=0, ram=1):
+    return SimpleNamespace(id=id, cpu_required=cpu, gpu_required=gpu, ram_required=ram)
+
+
+class ChooseVictimsTestCase(SimpleTestCase):
+    def test_picks_cheapest_set(self):
+        running = [make_deployment(1, 6, ram=8), make_deployment(2, 1), make_deployment(3, 1)]
+        cluster = make_cluster(used_cpu=8, used_ram=10)
+
+        victims = choose_victims(cluster, make_deployment(4, 2), running)
+
+        self.assertEqual(sorted(victim.id for victim in victims), [2, 3])
+
+    def test_only_useful_deployments_are_preempted(self):
+        # Only GPUs are short, so CPU-only deployments are left running
+        running = [make_deployment(1, 1), make_deployment(2, 1, gpu=2)]
+        cluster = make_cluster(used_cpu=2, used_gpu=2, used_ram=2)
+
+        victims = choose_victims(cluster, make_deployment(3, 1, gpu=1), running)
+
+        self.assertEqual([victim.id for victim in victims], [2])
+
+    def test_returns_none_when_room_cannot_be_made(self):
+        running = [make_deployment(1, 2)]
+        cluster = make_cluster(used_cpu=8)
+
+        self.assertIsNone(choose_victims(cluster, make_deployment(2, 4), running))
+
+    def test_greedy_search_beyond_limit(self):
+        running = [make_deployment(i, 0.25) for i in range(EXACT_SEARCH_LIMIT * 2)]
+        running.append(make_deployment(100, 2, ram=32))
+        cluster = make_cluster(used_cpu=8, used_ram=56)
+
+        victims = choose_victims(cluster, make_deployment(200, 1), running)
+
+        self.assertEqual(len(victims), 4)
+        self.assertAlmostEqual(
+            sum(preemption_cost(cluster, victim) for victim in victims),
+            4 * preemption_cost(cluster, running[0]),
+        )
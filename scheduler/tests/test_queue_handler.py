@@ -1,6 +1,7 @@
-from django.test import TestCase
-from scheduler.queue_handler import RedisQueue
+from django.test import TestCase, override_settings
+from scheduler.queue_handler import RedisQueue, get_redis_client, redis_call_count
 import redis
+from redis.crc import key_slot
 
 class RedisQueueTestCase(TestCase):
     def setUp(self):
@@ -13,12 +14,9 @@ class RedisQueueTestCase(TestCase):
         self.clean_test_queues()
 
     def clean_test_queues(self):
-        # Clean both high and low priority queues for the test cluster
+        # Clean the queue for the test cluster
         test_cluster_id = 1
-        high_queue_key = self.queue.get_queue_key(test_cluster_id, 'high')
-        low_queue_key = self.queue.get_queue_key(test_cluster_id, 'low')
-        self.queue.redis_client.delete(high_queue_key)
-        self.queue.redis_client.delete(low_queue_key)
+        self.queue.clear_queue(test_cluster_id)
 
     def test_enqueue_deployment(self):
         deployment_data = {"deployment_id": 1, "priority": "high", "cluster_id": 1}
@@ -39,7 +37,114 @@ class RedisQueueTestCase(TestCase):
         # Add one deployment
         deployment_data = {"deployment_id": 1, "priority": "high", "cluster_id": 1}
         self.queue.enqueue_deployment(deployment_data, 1)
-        
+
         # Check length is now 1
         queue_lengths = self.queue.get_queue_length(1)
         self.assertEqual(queue_lengths['high_priority'], 1)
+
+    def test_priority_then_fifo_order(self):
+        self.queue.enqueue_deployment({"deployment_id": 1, "priority": "low"}, 1)
+        self.queue.enqueue_deployment({"deployment_id": 2, "priority": 5}, 1)
+        self.queue.enqueue_deployment({"deployment_id": 3, "priority": "high"}, 1)
+        self.queue.enqueue_deployment({"deployment_id": 4, "priority": 5}, 1)
+
+        queued = self.queue.peek_deployments(1)
+        self.assertEqual([d['deployment_id'] for d in queued], [3, 2, 4, 1])
+
+    def test_peek_is_not_destructive(self):
+        self.queue.enqueue_deployment({"deployment_id": 1, "priority": "high"}, 1)
+        self.queue.enqueue_deployment({"deployment_id": 2, "priority": "low"}, 1)
+
+        self.assertEqual(len(self.queue.peek_deployments(1, min_priority='high')), 1)
+        self.assertEqual(len(self.queue.peek_deployments(1)), 2)
+        self.assertEqual(self.queue.get_queue_length(1), {'high_priority': 1, 'low_priority': 1})
+
+    def test_remove_deployments(self):
+        self.queue.enqueue_deployment({"deployment_id": 1, "priority": "high"}, 1)
+        self.queue.enqueue_deployment({"deployment_id": 2, "priority": "low"}, 1)
+
+        self.assertEqual(self.queue.remove_deployments(1, [1, 3]), 1)
+        self.assertEqual([d['deployment_id'] for d in self.queue.peek_deployments(1)], [2])
+
+    def test_requeue_replaces_entry(self):
+        self.queue.enqueue_deployment({"deployment_id": 1, "priority": "low"}, 1)
+        self.queue.enqueue_deployment({"deployment_id": 1, "priority": "high"}, 1)
+
+        self.assertEqual(self.queue.get_queue_length(1), {'high_priority': 1, 'low_priority': 0})
+
+    def test_feasible_deployments_skips_buckets_that_cannot_fit(self):
+        self.queue.enqueue_deployment({"deployment_id": 1, "priority": "low", "cpu": 1, "gpu": 0, "ram": 2}, 1)
+        self.queue.enqueue_deployment({"deployment_id": 2, "priority": "high", "cpu": 8, "gpu": 1, "ram": 32}, 1)
+        self.queue.enqueue_deployment({"deployment_id": 3, "priority": "high", "cpu": 2, "gpu": 0, "ram": 4}, 1)
+
+        feasible = self.queue.feasible_deployments(1, 2, 0, 8)
+        self.assertEqual([d['deployment_id'] for d in feasible], [3, 1])
+        feasible = self.queue.feasible_deployments(1, 2, 0, 8, min_priority='high')
+        self.assertEqual([d['deployment_id'] for d in feasible], [3])
+
+    def test_removal_cleans_capacity_index(self):
+        self.queue.enqueue_deployment({"deployment_id": 1, "priority": "high", "cpu": 1, "gpu": 0, "ram": 2}, 1)
+        self.queue.remove_deployments(1, [1])
+
+        self.assertEqual(self.queue.feasible_deployments(1, 100, 100, 100), [])
+        self.assertEqual(self.queue.redis_client.scard(self.queue.get_script_keys(1)[4]), 0)
+
+    def test_cluster_keys_share_one_slot(self):
+        self.queue.enqueue_deployment({"deployment_id": 1, "priority": "high", "cpu": 1, "gpu": 0, "ram": 2}, 1)
+        self.queue.enqueue_deployment({"deployment_id": 2, "priority": "low", "cpu": 8, "gpu": 1, "ram": 32}, 1)
+
+        keys = list(self.queue.redis_client.scan_iter(match='{cluster_1}*'))
+        self.assertIn(self.queue.get_bucket_prefix(1) + self.queue.bucket_label({"cpu": 8, "gpu": 1, "ram": 32}), keys)
+        self.assertEqual({key_slot(key.encode()) for key in keys}, {key_slot(self.queue.get_queue_key(1).encode())})
+
+    def test_queue_status_in_one_round_trip(self):
+        self.queue.clear_queue(2)
+        self.queue.enqueue_deployment({"deployment_id": 1, "priority": "high", "cpu": 1, "gpu": 1, "ram": 2, "enqueued_at": 100}, 1)
+        self.queue.enqueue_deployment({"deployment_id": 2, "priority": "low", "cpu": 0.5, "gpu": 0, "ram": 4, "enqueued_at": 90}, 1)
+
+        status = self.queue.get_queue_status([1, 2], now=130)
+
+        self.assertEqual(status[1], {
+            'high_priority': 1, 'low_priority': 1, 'oldest_age': 40.0,
+            'demand': {'cpu': 1.5, 'gpu': 1.0, 'ram': 6.0},
+        })
+        self.assertEqual(status[2]['oldest_age'], None)
+        self.assertEqual(status[2]['high_priority'] + status[2]['low_priority'], 0)
+
+    def test_queue_status_follows_removals(self):
+        self.queue.enqueue_deployment({"deployment_id": 1, "priority": "high", "cpu": 1, "gpu": 1, "ram": 2, "enqueued_at": 100}, 1)
+        self.queue.enqueue_deployment({"deployment_id": 2, "priority": "low", "cpu": 0.5, "gpu": 0, "ram": 4, "enqueued_at": 90}, 1)
+        # Queuing a deployment again replaces its counts rather than adding to them
+        self.queue.enqueue_deployment({"deployment_id": 2, "priority": "low", "cpu": 2, "gpu": 0, "ram": 4, "enqueued_at": 90}, 1)
+
+        self.queue.remove_deployments(1, [2])
+        status = self.queue.get_queue_status([1], now=130)[1]
+        self.assertEqual((status['oldest_age'], status['demand']), (30.0, {'cpu': 1.0, 'gpu': 1.0, 'ram': 2.0}))
+
+        self.queue.get_next_deployment(1)
+        status = self.queue.get_queue_status([1], now=130)[1]
+        self.assertEqual((status['oldest_age'], status['demand']), (None, {'cpu': 0.0, 'gpu': 0.0, 'ram': 0.0}))
+        self.assertFalse(self.queue.redis_client.exists(self.queue.get_demand_key(1), self.queue.get_arrivals_key(1)))
+
+    def test_enqueue_many_in_one_round_trip(self):
+        self.queue.clear_queue(2)
+        deployments = [({"deployment_id": i, "priority": "low" if i % 2 else "high", "cpu": 1, "gpu": 0, "ram": 1}, 1 + i % 2)
+                       for i in range(1, 7)]
+
+        calls = redis_call_count()
+        self.queue.enqueue_deployments(deployments)
+
+        self.assertEqual(redis_call_count() - calls, 1)
+        self.assertEqual(self.queue.get_queue_length(1), {'high_priority': 3, 'low_priority': 0})
+        self.assertEqual([item['deployment_id'] for item in self.queue.peek_deployments(2)], [1, 3, 5])
+        self.queue.clear_queue(2)
+
+    def test_client_is_shared_and_built_from_settings(self):
+        self.assertIs(RedisQueue().redis_client, get_redis_client())
+        with override_settings(SCHEDULER_REDIS={'URL': 'redis://localhost:1/0', 'RETRIES': 1}):
+            # Building the queue does not connect, using it does
+            queue = RedisQueue()
+            self.assertEqual(queue.redis_client.connection_pool.connection_kwargs['port'], 1)
+            with self.assertRaises(redis.ConnectionError):
+                queue.get_queue_length(1)
+        self.assertEqual(self.queue.get_queue_length(1)['high_priority'], 0)
@@ -0,0 +1,137 @@
+from unittest import mock
+from django.test import TestCase, override_settings
+from api.models import UserProfile, Organization, Cluster, Deployment
+from scheduler.models import Preemption
+from scheduler.scheduler import DeploymentScheduler
+from scheduler.stats import get_wait_times_key, wait_time_percentiles
+from scheduler.tests.helpers import queue_deployment
+
+
+class DeploymentSchedulerTestCase(TestCase):
+    def setUp(self):
+        self.scheduler = DeploymentScheduler()
+        self.queue = self.scheduler.queue
+        self.organization = Organization.objects.create(name="TestOrg")
+        self.user = UserProfile.objects.create(username="testuser", password="testpass", organization=self.organization)
+        self.cluster = Cluster.objects.create(name="TestCluster", user=self.user, total_cpu=8, total_gpu=2, total_ram=64)
+        self.queue.clear_queue(self.cluster.id)
+
+    def tearDown(self):
+        self.queue.clear_queue(self.cluster.id)
+
+    def test_starts_deployments_in_queue_order(self):
+        first = queue_deployment(self.cluster, 6)
+        blocked = queue_deployment(self.cluster, 4)
+        small = queue_deployment(self.cluster, 2)
+
+        started = self.scheduler.process_cluster_queue(self.cluster.id)
+
+        self.assertEqual(started, [first.id, small.id])
+        self.cluster.refresh_from_db()
+        self.assertEqual(self.cluster.utilized_cpu, 8)
+        blocked.refresh_from_db()
+        self.assertEqual(blocked.status, 'queued')
+        self.assertEqual([d['deployment_id'] for d in self.queue.peek_deployments(self.cluster.id)], [blocked.id])
+
+    def test_low_priority_waits_for_high(self):
+        queue_deployment(self.cluster, 10, priority='high')
+        low = queue_deployment(self.cluster, 1, priority='low')
+
+        self.assertEqual(self.scheduler.process_cluster_queue(self.cluster.id), [])
+        low.refresh_from_db()
+        self.assertEqual(low.status, 'queued')
+
+    @override_settings(SCHEDULER_PREEMPTION=True)
+    def test_high_priority_preempts_low(self):
+        scheduler = DeploymentScheduler()
+        low = queue_deployment(self.cluster, 6, priority='low')
+        scheduler.process_cluster_queue(self.cluster.id)
+        high = queue_deployment(self.cluster, 4, priority='high')
+
+        self.assertEqual(scheduler.process_cluster_queue(self.cluster.id), [high.id])
+
+        low.refresh_from_db()
+        self.assertEqual(low.status, 'queued')
+        self.cluster.refresh_from_db()
+        self.assertEqual(self.cluster.utilized_cpu, 4)
+        self.assertEqual([d['deployment_id'] for d in self.queue.peek_deployments(self.cluster.id)], [low.id])
+        preemption = Preemption.objects.get()
+        self.assertEqual((preemption.preempted_id, preemption.deployment_id), (low.id, high.id))
+
+    @override_settings(SCHEDULER_PREEMPTION=True)
+    def test_victims_are_requeued_in_one_round_trip(self):
+        scheduler = DeploymentScheduler()
+        lows = [queue_deployment(self.cluster, 4, priority='low') for _ in range(2)]
+        scheduler.process_cluster_queue(self.cluster.id)
+        high = queue_deployment(self.cluster, 8, priority='high')
+
+        with mock.patch.object(self.queue, 'enqueue_deployments', wraps=self.queue.enqueue_deployments) as enqueue:
+            self.assertEqual(scheduler.process_cluster_queue(self.cluster.id), [high.id])
+
+        enqueue.assert_called_once()
+        self.assertEqual(sorted(d['deployment_id'] for d in self.queue.peek_deployments(self.cluster.id)),
+                         [low.id for low in lows])
+
+    @override_settings(SCHEDULER_PREEMPTION=True)
+    def test_victim_searches_are_capped_per_pass(self):
+        scheduler = DeploymentScheduler()
+        queue_deployment(self.cluster, 8, priority='low')
+        scheduler.process_cluster_queue(self.cluster.id)
+        # No set of victims makes room for the first, which uses up the only search
+        queue_deployment(self.cluster, 8, gpu=4, priority='high')
+        fits = queue_deployment(self.cluster, 4, priority='high')
+
+        with mock.patch('scheduler.scheduler.VICTIM_SEARCHES_PER_PASS', 1):
+            self.assertEqual(scheduler.process_cluster_queue(self.cluster.id), [])
+        self.assertEqual(scheduler.process_cluster_queue(self.cluster.id), [fits.id])
+
+    def test_pass_uses_constant_number_of_queries(self):
+        # Cluster read, in_bulk, savepoint, status update, conditional reserve, release savepoint
+        for _ in range(3):
+            queue_deployment(self.cluster, 1)
+        with self.assertNumQueries(6):
+            self.scheduler.process_cluster_queue(self.cluster.id)
+
+        for _ in range(30):
+            queue_deployment(self.cluster, 0.1)
+        with self.assertNumQueries(6):
+            self.scheduler.process_cluster_queue(self.cluster.id)
+        self.assertEqual(Deployment.objects.filter(status='running').count(), 33)
+
+    @override_settings(SCHEDULER_AGING={'RATE': 1.0})
+    def test_aged_low_priority_competes_with_high(self):
+        scheduler = DeploymentScheduler()
+        queue_deployment(self.cluster, 10, priority='high')
+        fresh = queue_deployment(self.cluster, 1, priority='low')
+        aged = queue_deployment(self.cluster, 1, priority='low', waited=11 * 60)
+
+        self.assertEqual(scheduler.process_cluster_queue(self.cluster.id), [aged.id])
+        fresh.refresh_from_db()
+        self.assertEqual(fresh.status, 'queued')
+
+    @override_settings(SCHEDULER_AGING={'RATE': 1.0})
+    def test_aged_low_priority_does_not_hold_back_fresh_low(self):
+        scheduler = DeploymentScheduler()
+        fresh = queue_deployment(self.cluster, 1, priority='low')
+        aged = queue_deployment(self.cluster, 1, priority='low', waited=11 * 60)
+
+        self.assertEqual(scheduler.process_cluster_queue(self.cluster.id), [aged.id, fresh.id])
+
+    @override_settings(SCHEDULER_AGING={'BACKFILL': True})
+    def test_backfill_uses_capacity_high_priority_cannot(self):
+        scheduler = DeploymentScheduler()
+        queue_deployment(self.cluster, 10, priority='high')
+        fits = queue_deployment(self.cluster, 2, priority='high')
+        low = queue_deployment(self.cluster, 1, priority='low')
+
+        self.assertEqual(scheduler.process_cluster_queue(self.cluster.id), [fits.id, low.id])
+
+    def test_wait_times_are_recorded(self):
+        self.queue.redis_client.delete(get_wait_times_key('high'))
+        queue_deployment(self.cluster, 1, waited=30)
+        self.scheduler.process_cluster_queue(self.cluster.id)
+
+        report = wait_time_percentiles(priorities=('high',))
+        self.assertEqual(report['high']['count'], 1)
+        self.assertAlmostEqual(report['high']['p99'], 30, delta=1)
+        self.queue.redis_client.delete(get_wait_times_key('high'))
@@ -0,0 +1,57 @@
+import time
+from django.test import SimpleTestCase
+from scheduler.queue_handler import queue_instance
+from scheduler.sharding import HashRing, ShardCoordinator, WORKERS_KEY
+
+
+class HashRingTestCase(SimpleTestCase):
+    def test_clusters_are_spread_across_workers(self):
+        ring = HashRing(['a', 'b', 'c'])
+        owners = [ring.owner(cluster_id) for cluster_id in range(3000)]
+        for worker in ('a', 'b', 'c'):
+            self.assertGreater(owners.count(worker), 600)
+
+    def test_adding_a_worker_only_moves_its_share(self):
+        before = HashRing(['a', 'b', 'c'])
+        after = HashRing(['a', 'b', 'c', 'd'])
+        moved = [cluster_id for cluster_id in range(3000) if before.owner(cluster_id) != after.owner(cluster_id)]
+        self.assertTrue(all(after.owner(cluster_id) == 'd' for cluster_id in moved))
+
+
+class ShardCoordinatorTestCase(SimpleTestCase):
+    def setUp(self):
+        self.redis = queue_instance.redis_client
+        self.clean()
+
+    def tearDown(self):
+        self.clean()
+
+    def clean(self):
+        self.redis.delete(WORKERS_KEY, 'cluster_1_lease')
+
+    def test_lease_is_exclusive(self):
+        first = ShardCoordinator('first', lease_ttl=5)
+        second = ShardCoordinator('second', lease_ttl=5)
+
+        self.assertTrue(first.acquire(1))
+        self.assertFalse(second.acquire(1))
+        first.release(1)
+        self.assertTrue(second.acquire(1))
+
+    def test_dead_worker_clusters_are_taken_over(self):
+        dead = ShardCoordinator('dead', lease_ttl=0.2)
+        alive = ShardCoordinator('alive', lease_ttl=5)
+        dead.heartbeat()
+        alive.heartbeat()
+        self.assertTrue(dead.acquire(1))
+
+        # 'dead' stops heartbeating and renewing, its lease and ring slot lapse
+        time.sleep(0.3)
+        alive.heartbeat()
+        self.assertEqual(alive.ring.workers, ['alive'])
+        self.assertTrue(alive.owns(1))
+        self.assertTrue(alive.acquire(1))
+
+        # A late renewal from the old owner does not take the lease back
+        dead.renew()
+        self.assertNotIn(1, dead.held)
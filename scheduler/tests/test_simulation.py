@@ -0,0 +1,64 @@
+import os
+import tempfile
+from django.test import SimpleTestCase
+from scheduler.policies import AgingPolicy
+from scheduler.simulation import POLICIES, Simulation, read_trace, write_synthetic_trace
+
+# One cluster with 4 CPUs: a low priority job holds 2, two high priority jobs
+# need 4 each, and a small low priority job arrives while they wait
+EVENTS = [
+    (0, 'cluster', 1, None, 4, 0, 16, ''),
+    (0, 'submit', 1, 1, 2, 0, 1, 'low'),
+    (10, 'submit', 2, 1, 4, 0, 1, 'high'),
+    (20, 'submit', 3, 1, 1, 0, 1, 'low'),
+    (30, 'submit', 4, 1, 4, 0, 1, 'high'),
+    (100, 'stop', 1, None, 0, 0, 0, ''),
+    (200, 'stop', 2, None, 0, 0, 0, ''),
+    (300, 'stop', 4, None, 0, 0, 0, ''),
+    (400, 'stop', 3, None, 0, 0, 0, ''),
+]
+
+
+class SimulationTestCase(SimpleTestCase):
+    def run_policy(self, name):
+        return Simulation(sample_interval=50, **POLICIES[name]).run(EVENTS)
+
+    def test_fifo_holds_low_priority_behind_high(self):
+        result = self.run_policy('fifo')
+
+        self.assertEqual(result['started'], 4)
+        self.assertEqual(result['completed'], 4)
+        self.assertEqual(result['wait_times']['high']['max'], 200 - 30)
+        # Job 3 only starts once both high priority jobs are done
+        self.assertEqual(result['wait_times']['low']['max'], 300 - 20)
+        self.assertEqual(result['still_queued'], 0)
+
+    def test_backfill_starts_low_priority_in_leftover_capacity(self):
+        result = self.run_policy('backfill')
+
+        # Job 3 fits next to job 1 while job 2 waits for the whole cluster
+        self.assertEqual(result['wait_times']['low']['max'], 0)
+
+    def test_preemption_makes_room_for_high_priority(self):
+        result = self.run_policy('preemption')
+
+        self.assertEqual(result['wait_times']['high']['p50'], 0)
+        self.assertGreater(result['preempted'], 0)
+
+    def test_utilization_is_sampled_on_the_virtual_clock(self):
+        result = self.run_policy('fifo')
+
+        self.assertEqual([point['time'] for point in result['utilization']], list(range(0, 401, 50)))
+        # Only job 1 runs at 50s, job 4 has the whole cluster at 250s
+        self.assertEqual(result['utilization'][1]['cpu'], 0.5)
+        self.assertEqual(result['utilization'][5]['cpu'], 1.0)
+        self.assertEqual(result['simulated_seconds'], 400)
+
+    def test_synthetic_trace_round_trip(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'trace.csv')
+            write_synthetic_trace(path, 200, clusters=2)
+            result = Simulation(policy=AgingPolicy(rate=1.0)).run(read_trace(path))
+
+        self.assertEqual(result['events'], 2 + 200 * 2)
+        self.assertEqual(sum(wait['count'] for wait in result['wait_times'].values()), result['started'])
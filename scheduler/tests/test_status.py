@@ -0,0 +1,98 @@
+import redis
+from django.test import TestCase, override_settings
+from api.models import UserProfile, Organization, Cluster
+from scheduler.queue_handler import get_stream_redis_client, queue_instance
+from scheduler.scheduler import DeploymentScheduler
+from scheduler.status import (
+    get_status_stream_key, publish_transitions, read_status_events, event_stream, is_event_id,
+)
+from scheduler.tests.helpers import queue_deployment
+
+
+def clear_status_streams():
+    keys = list(queue_instance.redis_client.scan_iter(match=get_status_stream_key('*', '*')))
+    if keys:
+        queue_instance.redis_client.delete(*keys)
+
+
+class StatusStreamTestCase(TestCase):
+    def setUp(self):
+        self.organization = Organization.objects.create(name="TestOrg")
+        self.user = UserProfile.objects.create(username="testuser", password="testpass", organization=self.organization)
+        self.cluster = Cluster.objects.create(name="TestCluster", user=self.user, total_cpu=8, total_gpu=2, total_ram=64)
+        queue_instance.clear_queue(self.cluster.id)
+        clear_status_streams()
+
+    def tearDown(self):
+        queue_instance.clear_queue(self.cluster.id)
+        clear_status_streams()
+
+    def statuses(self, scope, scope_id, last_id='0-0'):
+        _, events = read_status_events(scope, scope_id, last_id, block_ms=10)
+        return [(event['deployment_id'], event['status']) for _, event in events]
+
+    def test_transitions_reach_each_scope(self):
+        publish_transitions([(1, self.cluster.id, self.organization.id, 'queued'),
+                             (2, self.cluster.id, self.organization.id, 'running')])
+
+        self.assertEqual(self.statuses('deployment', 1), [(1, 'queued')])
+        self.assertEqual(self.statuses('cluster', self.cluster.id), [(1, 'queued'), (2, 'running')])
+        self.assertEqual(self.statuses('organization', self.organization.id), [(1, 'queued'), (2, 'running')])
+
+    def test_resumes_after_last_event(self):
+        publish_transitions([(1, self.cluster.id, None, 'queued')])
+        last_id, events = read_status_events('deployment', 1, '0-0', block_ms=10)
+        self.assertEqual(len(events), 1)
+        self.assertTrue(is_event_id(last_id))
+
+        publish_transitions([(1, self.cluster.id, None, 'running')])
+        self.assertEqual(self.statuses('deployment', 1, last_id), [(1, 'running')])
+        # Without an id only transitions published from now on are read
+        self.assertEqual(self.statuses('deployment', 1, None), [])
+
+    def test_pass_publishes_started_deployments(self):
+        started = queue_deployment(self.cluster, 6)
+        waiting = queue_deployment(self.cluster, 4)
+
+        DeploymentScheduler().process_cluster_queue(self.cluster.id)
+
+        self.assertEqual(self.statuses('deployment', started.id), [(started.id, 'running')])
+        self.assertEqual(self.statuses('deployment', waiting.id), [])
+        self.assertEqual(self.statuses('organization', self.organization.id), [(started.id, 'running')])
+
+    @override_settings(SCHEDULER_PREEMPTION=True)
+    def test_pass_publishes_preemptions(self):
+        scheduler = DeploymentScheduler()
+        low = queue_deployment(self.cluster, 6, priority='low')
+        scheduler.process_cluster_queue(self.cluster.id)
+        high = queue_deployment(self.cluster, 4)
+
+        scheduler.process_cluster_queue(self.cluster.id)
+
+        self.assertEqual(self.statuses('cluster', self.cluster.id), [
+            (low.id, 'running'), (low.id, 'preempted'), (low.id, 'queued'), (high.id, 'running'),
+        ])
+
+    def test_event_stream(self):
+        publish_transitions([(1, self.cluster.id, None, 'queued')])
+
+        chunks = list(event_stream('deployment', 1, '0-0', heartbeat=0.01, duration=0.05))
+
+        self.assertTrue(chunks[0].startswith('retry: '))
+        self.assertIn('event: status\n', chunks[1])
+        self.assertIn('"status": "queued"', chunks[1])
+        self.assertEqual(chunks[-1], ': keep-alive\n\n')
+
+    def test_streams_have_their_own_connection_pool(self):
+        stream_client = get_stream_redis_client()
+        self.assertIsNot(stream_client.connection_pool, queue_instance.redis_client.connection_pool)
+        with override_settings(SCHEDULER_REDIS={'URL': 'redis://localhost:6379/0', 'STREAM_MAX_CONNECTIONS': 1}):
+            self.assertEqual(get_stream_redis_client().connection_pool.max_connections, 1)
+            # A stream holding the only connection does not keep the queue from Redis
+            connection = get_stream_redis_client().connection_pool.get_connection()
+            try:
+                with self.assertRaises(redis.ConnectionError):
+                    read_status_events('deployment', 1, '0-0', block_ms=10)
+                self.assertEqual(queue_instance.get_queue_length(self.cluster.id)['high_priority'], 0)
+            finally:
+                get_stream_redis_client().connection_pool.release(connection)
@@ -0,0 +1,47 @@
+from django.test import SimpleTestCase
+from scheduler.queue_handler import queue_instance
+from scheduler.status import publish_transitions
+from scheduler.versions import get_version, get_version_key
+
+
+class VersionTestCase(SimpleTestCase):
+    def setUp(self):
+        self.keys = [get_version_key(scope, scope_id) for scope, scope_id in
+                     (('cluster', 1), ('cluster', 2), ('deployment', 1), ('deployment', 2))]
+        queue_instance.redis_client.delete(*self.keys)
+
+    def tearDown(self):
+        queue_instance.redis_client.delete(*self.keys)
+
+    def test_reads_create_no_version(self):
+        self.assertIsNone(get_version('cluster', 1))
+        self.assertFalse(queue_instance.redis_client.exists(get_version_key('cluster', 1)))
+
+    def test_version_is_stable_until_bumped(self):
+        publish_transitions([(1, 1, None, 'queued')])
+        version = get_version('cluster', 1)
+        self.assertEqual(get_version('cluster', 1), version)
+
+        publish_transitions([(1, 1, None, 'running')])
+
+        self.assertEqual(get_version('cluster', 1), version + 1)
+        self.assertIsNone(get_version('cluster', 2))
+
+    def test_transitions_bump_deployment_and_cluster(self):
+        publish_transitions([(1, 1, None, 'queued'), (2, 1, None, 'queued')])
+        deployment, other, cluster = get_version('deployment', 1), get_version('deployment', 2), get_version('cluster', 1)
+
+        publish_transitions([(1, 1, None, 'preempted'), (1, 1, None, 'queued'), (2, 1, None, 'running')])
+
+        self.assertEqual(get_version('deployment', 1), deployment + 1)
+        self.assertEqual(get_version('deployment', 2), other + 1)
+        self.assertEqual(get_version('cluster', 1), cluster + 1)
+
+    def test_recreated_version_does_not_repeat(self):
+        publish_transitions([(1, 1, None, 'queued')])
+        version = get_version('deployment', 1)
+        queue_instance.redis_client.delete(get_version_key('deployment', 1))
+
+        publish_transitions([(1, 1, None, 'queued')])
+
+        self.assertNotEqual(get_version('deployment', 1), version)
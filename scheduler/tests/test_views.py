@@ -0,0 +1,70 @@
+from django.test import TestCase
+from django.urls import reverse
+from api.models import UserProfile, Organization, Cluster
+from scheduler.queue_handler import queue_instance
+
+
+class QueueStatusTestCase(TestCase):
+    def setUp(self):
+        self.organization = Organization.objects.create(name="TestOrg")
+        other = Organization.objects.create(name="OtherOrg")
+        user = UserProfile.objects.create(username="testuser", password="testpass", organization=self.organization)
+        other_user = UserProfile.objects.create(username="otheruser", password="testpass", organization=other)
+        self.clusters = [
+            Cluster.objects.create(name=f"Cluster{i}", user=user, total_cpu=8, total_gpu=1, total_ram=32)
+            for i in range(3)
+        ]
+        self.other_cluster = Cluster.objects.create(name="Other", user=other_user, total_cpu=8, total_gpu=1, total_ram=32)
+        for cluster in self.clusters + [self.other_cluster]:
+            queue_instance.clear_queue(cluster.id)
+        queue_instance.enqueue_deployment({"deployment_id": 1, "priority": "high", "cpu": 2, "gpu": 0, "ram": 4},
+                                          self.clusters[0].id)
+
+    def tearDown(self):
+        for cluster in self.clusters + [self.other_cluster]:
+            queue_instance.clear_queue(cluster.id)
+
+    def test_queue_status_filters_and_paginates(self):
+        url = reverse('queue-status')
+        response = self.client.get(url, {'organization': self.organization.id, 'page_size': 2})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['count'], response.data['num_pages']), (3, 2))
+        first = response.data['clusters'][0]
+        self.assertEqual(first['id'], self.clusters[0].id)
+        self.assertEqual(first['queues']['high_priority'], 1)
+        self.assertEqual(first['queues']['demand']['cpu'], 2.0)
+
+        response = self.client.get(url, {'organization': self.organization.id, 'page_size': 2, 'page': 2})
+        self.assertEqual([cluster['id'] for cluster in response.data['clusters']], [self.clusters[2].id])
+
+    def test_invalid_page(self):
+        response = self.client.get(reverse('queue-status'), {'page': 5})
+        self.assertEqual(response.status_code, 400)
+
+
+class ScheduleTestCase(TestCase):
+    def setUp(self):
+        user = UserProfile.objects.create(username="testuser", password="testpass")
+        self.clusters = [Cluster.objects.create(name=f"Cluster{i}", user=user, total_cpu=8, total_gpu=1, total_ram=32)
+                         for i in range(2)]
+
+    def tearDown(self):
+        for cluster in self.clusters:
+            queue_instance.clear_queue(cluster.id)
+
+    def test_schedule_batch(self):
+        deployments = [{"deployment_id": 1000 + i, "priority": "low", "cpu": 64, "gpu": 0, "ram": 1,
+                        "cluster_id": self.clusters[i % 2].id} for i in range(3)]
+
+        response = self.client.post(reverse('schedule'), {"deployments": deployments, "is_scheduled": True},
+                                    content_type='application/json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['deployment_ids'], [1000, 1001, 1002])
+        # Too large to start, so left queued
+        self.assertEqual(queue_instance.get_queue_length(self.clusters[0].id)['low_priority'], 2)
+
+        response = self.client.post(reverse('schedule'), {"deployments": [{"deployment_id": 1}]},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
@@ -0,0 +1,52 @@
+import asyncio
+import threading
+from django.test import SimpleTestCase
+from scheduler.worker import SchedulerWorker
+
+
+class RecordingScheduler:
+    """Stands in for DeploymentScheduler, holds each pass until released"""
+
+    def __init__(self):
+        self.passes = []
+        self.release = threading.Event()
+
+    def process_cluster_queue(self, cluster_id):
+        self.release.wait(5)
+        self.passes.append(cluster_id)
+        return []
+
+
+class SchedulerWorkerTestCase(SimpleTestCase):
+    def run_worker(self, coroutine):
+        async def runner():
+            self.worker._semaphore = asyncio.Semaphore(self.worker.concurrency)
+            await coroutine()
+            await self.worker.wait_idle()
+        asyncio.run(runner())
+
+    def setUp(self):
+        self.scheduler = RecordingScheduler()
+        self.worker = SchedulerWorker(scheduler=self.scheduler, concurrency=2)
+
+    def test_events_are_coalesced_per_cluster(self):
+        async def burst():
+            self.worker.handle_events([{'type': 'deployment_submitted', 'cluster_id': 1}] * 10)
+            self.worker.handle_events([{'type': 'capacity_freed', 'cluster_id': 2}])
+            # Events that arrive before a pass starts are folded into it
+            self.worker.handle_events([{'type': 'deployment_submitted', 'cluster_id': 1}] * 10)
+            await asyncio.sleep(0.1)
+            # More events while the first passes are still running get one more pass
+            self.worker.handle_events([{'type': 'deployment_submitted', 'cluster_id': 1}] * 10)
+            self.scheduler.release.set()
+
+        self.run_worker(burst)
+        self.assertEqual(sorted(self.scheduler.passes), [1, 1, 2])
+
+    def test_single_event_gets_single_pass(self):
+        async def single():
+            self.scheduler.release.set()
+            self.worker.handle_events([{'type': 'capacity_freed', 'cluster_id': 3}])
+
+        self.run_worker(single)
+        self.assertEqual(self.scheduler.passes, [3])
@@ -1,7 +1,15 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
+status_views = views
+if settings.ASYNC_VIEWS:
+    from . import async_views as status_views
+
 urlpatterns = [
     path('schedule/', views.schedule, name='schedule'),
-    path('queue-status/<int:cluster_id>/', views.cluster_queue_status, name='cluster-queue-status'),
+    path('queue-status/', status_views.queue_status, name='queue-status'),
+    path('queue-status/<int:cluster_id>/', status_views.cluster_queue_status, name='cluster-queue-status'),
+    path('wait-times/', views.wait_times, name='wait-times'),
+    path('metrics/', views.metrics, name='metrics'),
 ]
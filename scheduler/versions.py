@@ -0,0 +1,52 @@
+import logging
+import secrets
+import redis
+from .queue_handler import queue_instance
+
+logger = logging.getLogger(__name__)
+
+# Clusters and deployments carry a version counter in Redis, bumped with every
+# status transition, which the API serves as ETags. Only bumps create counters,
+# reads never do. A counter starts from a random value, so one recreated after
+# expiring or a Redis restart never repeats a version clients have seen.
+VERSION_TTL = 86400
+
+
+def get_version_key(scope, scope_id):
+    """Generate the key holding a cluster's or deployment's version"""
+    return f'{scope}_{scope_id}_version'
+
+
+def _initial_version():
+    return secrets.randbits(48)
+
+
+def queue_version_bumps(pipe, keys):
+    """Queue commands bumping the versions at ``keys`` on a pipeline"""
+    for key in keys:
+        pipe.set(key, _initial_version(), nx=True)
+        pipe.incr(key)
+        pipe.expire(key, VERSION_TTL)
+    return pipe
+
+
+def get_version(scope, scope_id, redis_client=None):
+    """Return the current version of a cluster or deployment, None if it has none or Redis fails"""
+    redis_client = redis_client or queue_instance.redis_client
+    try:
+        version = redis_client.get(get_version_key(scope, scope_id))
+    except redis.RedisError as e:
+        logger.warning("Failed to read the version of %s %s: %s", scope, scope_id, e)
+        return None
+    return None if version is None else int(version)
+
+
+async def aget_version(scope, scope_id, redis_client=None):
+    """Async counterpart of ``get_version``"""
+    redis_client = redis_client or queue_instance.async_redis_client
+    try:
+        version = await redis_client.get(get_version_key(scope, scope_id))
+    except redis.RedisError as e:
+        logger.warning("Failed to read the version of %s %s: %s", scope, scope_id, e)
+        return None
+    return None if version is None else int(version)
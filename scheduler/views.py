@@ -1,26 +1,51 @@
+import logging
+from django.http import HttpResponse
 from django.shortcuts import render
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework import status
-from .scheduler import DeploymentScheduler
+from .dispatch import InProcessDispatcher
 from .queue_handler import queue_instance
+from .stats import wait_time_percentiles
+from .metrics import metrics as metrics_registry
 from api.models import Cluster, Deployment
+from django.core.paginator import InvalidPage, Paginator
 from rest_framework.decorators import authentication_classes
 from rest_framework.permissions import AllowAny
 
-scheduler = DeploymentScheduler()
+logger = logging.getLogger(__name__)
+
+# The HTTP endpoint always runs the scheduler locally, it is what remote dispatchers talk to
+dispatcher = InProcessDispatcher()
 queue = queue_instance
 
+# Clusters per page of the fleet queue status
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
 
 @api_view(['POST'])
 @authentication_classes([])  # No authentication required
 @permission_classes([AllowAny])
 def schedule(request):
-    """Endpoint to receive deployment requests"""
+    """Endpoint to receive deployment requests, one or a batch under 'deployments'"""
     try:
         deployment_data = request.data
         cluster_id = request.data.get('cluster_id')
-        
+
+        if 'deployments' in deployment_data:
+            # A batch from schedule_deployments, one pass per cluster it touches
+            deployments = deployment_data['deployments']
+            if not all(item.get('cluster_id') for item in deployments):
+                return Response({
+                    "error": "cluster_id is required for every deployment"
+                }, status=status.HTTP_400_BAD_REQUEST)
+            dispatcher.schedule_many([(item, item['cluster_id']) for item in deployments])
+            return Response({
+                "message": "Deployments queued successfully",
+                "deployment_ids": [item.get('deployment_id') for item in deployments]
+            }, status=status.HTTP_200_OK)
+
         if not cluster_id:
             return Response({
                 "error": "cluster_id is required"
@@ -28,16 +53,15 @@ def schedule(request):
             
         try:
             cluster = Cluster.objects.get(id=cluster_id)
-            if(deployment_data['is_scheduled']):
-                
+            if deployment_data.get('is_scheduled'):
                 # Add to specified cluster's queue and process it
-                queue.enqueue_deployment(deployment_data, cluster_id)
-            
-            scheduler.process_cluster_queue(cluster_id)
+                dispatcher.schedule(deployment_data, cluster_id)
+            else:
+                dispatcher.process(cluster_id)
             
             return Response({
                 "message": "Deployment queued successfully",
-                "deployment_id": deployment_data['deployment_id'],
+                "deployment_id": deployment_data.get('deployment_id'),
                 "cluster_id": cluster_id
             }, status=status.HTTP_200_OK)
             
@@ -51,7 +75,7 @@ def schedule(request):
             }, status=status.HTTP_404_NOT_FOUND)
             
     except Exception as e:
-        print(str(e))
+        logger.exception("Failed to schedule: %s", e)
         return Response({
             "error": str(e)
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -62,24 +86,47 @@ def schedule(request):
 @authentication_classes([])  # No authentication required
 @permission_classes([AllowAny])
 def queue_status(request):
-    """Get current queue status for all clusters"""
+    """Get queue status for all clusters, optionally for one organization.
+
+    Paginated with ``page`` and ``page_size``. Every cluster on the page is
+    read from Redis in a single pipeline.
+    """
     try:
-        clusters = Cluster.objects.all()
-        status_data = {}
-        
-        for cluster in clusters:
-            status_data[f"cluster_{cluster.id}"] = {
-                "name": cluster.name,
-                "queues": queue.get_queue_length(cluster.id)
-            }
-        
-        return Response(status_data)
+        try:
+            page = cluster_paginator(request.query_params).page(request.query_params.get('page', 1))
+        except (ValueError, InvalidPage) as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        queues = queue.get_queue_status([cluster['id'] for cluster in page])
+        return Response(queue_status_payload(page, list(page), queues))
     except Exception as e:
         return Response(
             {"error": str(e)}, 
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
 
+def cluster_paginator(params):
+    """Paginator over the clusters listed by queue_status, for the ``organization`` and ``page_size`` parameters"""
+    clusters = Cluster.objects.order_by('id')
+    organization_id = params.get('organization')
+    if organization_id:
+        clusters = clusters.filter(user__organization_id=organization_id)
+    page_size = max(1, min(int(params.get('page_size', DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE))
+    return Paginator(clusters.values('id', 'name'), page_size)
+
+
+def queue_status_payload(page, clusters, queues):
+    return {
+        "count": page.paginator.count,
+        "page": page.number,
+        "num_pages": page.paginator.num_pages,
+        "clusters": [
+            {"id": cluster['id'], "name": cluster['name'], "queues": queues[cluster['id']]}
+            for cluster in clusters
+        ],
+    }
+
+
 @api_view(['GET'])
 @authentication_classes([])  # No authentication required
 @permission_classes([AllowAny])
@@ -103,3 +150,22 @@ def cluster_queue_status(request, cluster_id):
             {"error": str(e)}, 
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
+
+
+@api_view(['GET'])
+@authentication_classes([])  # No authentication required
+@permission_classes([AllowAny])
+def wait_times(request):
+    """Get wait time percentiles (in seconds) of recently started deployments per priority"""
+    try:
+        return Response(wait_time_percentiles())
+    except Exception as e:
+        return Response(
+            {"error": str(e)},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+
+def metrics(request):
+    """Scheduler and API metrics in the Prometheus text format"""
+    return HttpResponse(metrics_registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,162 @@
+import asyncio
+import logging
+import signal
+from django.db import close_old_connections
+from api.models import Cluster
+from .events import last_event_id, read_events
+from .scheduler import DeploymentScheduler
+
+logger = logging.getLogger(__name__)
+
+
+class SchedulerWorker:
+    """Run scheduling passes off the request path, driven by the events stream.
+
+    Events are coalesced per cluster: however many arrive for a cluster while
+    a pass is pending or running, it gets at most one more pass. Up to
+    ``concurrency`` clusters are scheduled at the same time.
+
+    With a ``coordinator`` several workers share the clusters: each one only
+    handles the clusters the hash ring assigns to it, and only schedules a
+    cluster while it holds that cluster's lease.
+
+    With the capacity cache enabled, the worker seeds it on startup and
+    writes it back to the database every ``flush_interval`` seconds.
+    """
+
+    def __init__(self, scheduler=None, concurrency=4, block_ms=1000, coordinator=None, flush_interval=1.0):
+        self.scheduler = scheduler or DeploymentScheduler()
+        self.concurrency = concurrency
+        self.block_ms = block_ms
+        self.coordinator = coordinator
+        self.flush_interval = flush_interval
+        self._running = {}  # cluster id -> pass task
+        self._dirty = set()  # clusters that got events while their pass was running
+        self._semaphore = None
+        self._stopping = None
+
+    def stop(self):
+        """Ask the worker to finish the passes in flight and exit"""
+        logger.info("Scheduler worker shutting down")
+        self._stopping.set()
+
+    async def run(self):
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._stopping = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, self.stop)
+
+        heartbeat = None
+        if self.coordinator is not None:
+            await asyncio.to_thread(self.coordinator.heartbeat)
+            heartbeat = asyncio.create_task(self._heartbeat())
+
+        write_behind = None
+        capacity = self.scheduler.capacity
+        if capacity is not None:
+            await asyncio.to_thread(self._database_call, capacity.rebuild)
+            write_behind = asyncio.create_task(self._write_behind(capacity))
+
+        # Remember where the stream ends before sweeping, so events that arrive
+        # during the sweep are still read afterwards
+        last_id = await asyncio.to_thread(last_event_id)
+        self.sweep(await asyncio.to_thread(self.startup_clusters))
+
+        while not self._stopping.is_set():
+            last_id, events = await asyncio.to_thread(read_events, last_id, self.block_ms)
+            self.handle_events(events)
+
+        await self.wait_idle()
+        if write_behind is not None:
+            write_behind.cancel()
+            await asyncio.to_thread(self._database_call, capacity.flush)
+        if heartbeat is not None:
+            heartbeat.cancel()
+            await asyncio.to_thread(self.coordinator.leave)
+
+    def startup_clusters(self):
+        """Clusters to schedule once on startup, events from before it are not replayed"""
+        close_old_connections()
+        return list(Cluster.objects.values_list('id', flat=True))
+
+    def owns(self, cluster_id):
+        return self.coordinator is None or self.coordinator.owns(cluster_id)
+
+    def sweep(self, cluster_ids):
+        """Schedule every owned cluster once, for when events may have been missed"""
+        for cluster_id in cluster_ids:
+            if self.owns(cluster_id):
+                self.request_pass(cluster_id)
+
+    def handle_events(self, events):
+        self.sweep({event['cluster_id'] for event in events})
+
+    def request_pass(self, cluster_id):
+        if cluster_id in self._running:
+            self._dirty.add(cluster_id)
+        else:
+            self._running[cluster_id] = asyncio.create_task(self._schedule_cluster(cluster_id))
+
+    async def wait_idle(self):
+        while self._running:
+            await asyncio.gather(*self._running.values(), return_exceptions=True)
+
+    async def _heartbeat(self):
+        interval = self.coordinator.lease_ttl / 3
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                changed = await asyncio.to_thread(self.coordinator.heartbeat)
+                await asyncio.to_thread(self.coordinator.renew)
+                await asyncio.to_thread(self.coordinator.release_unowned, set(self._running))
+                if changed:
+                    # Clusters moved to this worker missed their events on the old owner
+                    logger.info("Scheduler ring changed: %s", self.coordinator.ring.workers)
+                    self.sweep(await asyncio.to_thread(self.startup_clusters))
+            except Exception:
+                logger.exception("Scheduler heartbeat failed")
+
+    async def _write_behind(self, capacity):
+        """Periodically write the capacity cache back to the database"""
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await asyncio.to_thread(self._database_call, capacity.flush)
+            except Exception:
+                logger.exception("Capacity write-behind failed")
+
+    async def _acquire_lease(self, cluster_id):
+        """Wait for the cluster's lease, gives up if the cluster moves elsewhere"""
+        while not self._stopping.is_set() and self.owns(cluster_id):
+            if await asyncio.to_thread(self.coordinator.acquire, cluster_id):
+                return True
+            # The previous owner has not released or lost it yet
+            await asyncio.sleep(self.coordinator.lease_ttl / 3)
+        return False
+
+    async def _schedule_cluster(self, cluster_id):
+        try:
+            if self.coordinator is not None and not await self._acquire_lease(cluster_id):
+                return
+            async with self._semaphore:
+                while True:
+                    self._dirty.discard(cluster_id)
+                    try:
+                        await asyncio.to_thread(self._process, cluster_id)
+                    except Exception:
+                        logger.exception("Scheduling pass failed for cluster %s", cluster_id)
+                    if cluster_id not in self._dirty:
+                        break
+        finally:
+            del self._running[cluster_id]
+
+    def _process(self, cluster_id):
+        return self._database_call(self.scheduler.process_cluster_queue, cluster_id)
+
+    def _database_call(self, func, *args):
+        close_old_connections()
+        try:
+            return func(*args)
+        finally:
+            close_old_connections()